@@ -1,34 +1,76 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from .database import db
+from .database import configure_engines, db
 from .routes import init_routes
+from .search import init_search
+from .stats import init_stats
+from .cache import init_cache
+from .exchange import init_exchange
+from .recommend import init_recommendations
+from .batch import init_batch
+from .events import init_events
+from .jobs import init_jobs
+from .export import init_export
+from .archive import init_archive
+from .hashing import init_hashing
+from .principal import init_principal
+from .log import init_logging
+from .metrics import init_metrics
+from .migrations import init_migrations, upgrade
+from .apidocs import init_apidocs
+from .serialize import init_serialization
 from flask_jwt_extended import JWTManager
-from flasgger import Swagger
 from flask_cors import CORS
 
 jwt = JWTManager()
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_object('config.Config')
+    if config:
+        app.config.update(config)
+
+    init_logging(app)
+    init_serialization(app)
 
     CORS(app)
 
     jwt.init_app(app)
+    init_principal(app, jwt)
 
+    configure_engines(app)
     db.init_app(app)
+    init_metrics(app)
 
     # Настройка Swagger
     app.config['SWAGGER'] = {
         'title': 'Book Exchange API',
         'uiversion': 3
     }
-    Swagger(app)
+    init_apidocs(app)
 
+    init_cache(app)
+    init_exchange(app)
+    init_events(app)
+    init_jobs(app)
+    init_recommendations(app)
+    init_hashing(app)
+    init_batch(app)
+    init_export(app)
+    init_archive(app)
     init_routes(app)
 
+    init_migrations(app, db)
+
     with app.app_context():
-        db.create_all()
+        # create_all — схема по моделям; migrations — версионные миграции из app/migrations;
+        # none — схемой и счётчиками управляет развёртывание, при старте к БД не обращаемся
+        schema = app.config.get('DB_SCHEMA', 'create_all')
+        if schema == 'migrations':
+            upgrade(db.engine)
+        elif schema != 'none':
+            db.create_all()
+        init_search(app, install=schema != 'none')
+        init_stats(app, reconcile=schema != 'none')
 
     return app
\ No newline at end of file
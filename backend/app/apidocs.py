@@ -0,0 +1,110 @@
+import importlib.util
+import json
+import os
+import click
+from flask import current_app, jsonify, send_from_directory
+
+SPEC_ROUTE = '/apispec_1.json'
+
+# Страница Swagger UI для режимов lazy и file; статика берётся из пакета flasgger
+# без его импорта, по тем же адресам, что и у самого flasgger
+UI_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+  <title>{title}</title>
+  <link rel="stylesheet" href="/flasgger_static/swagger-ui.css">
+</head>
+<body>
+  <div id="swagger-ui"></div>
+  <script src="/flasgger_static/swagger-ui-bundle.js"></script>
+  <script src="/flasgger_static/swagger-ui-standalone-preset.js"></script>
+  <script>
+    window.ui = SwaggerUIBundle({{
+      url: '{spec_route}',
+      dom_id: '#swagger-ui',
+      presets: [SwaggerUIBundle.presets.apis, SwaggerUIStandalonePreset],
+      layout: 'StandaloneLayout'
+    }});
+  </script>
+</body>
+</html>
+"""
+
+
+def swag_from(specs):
+    """
+    Лёгкая замена flasgger.swag_from для словарей: только сохраняет спецификацию
+    в атрибуте specs_dict, который читает flasgger, и не оборачивает обработчик
+    """
+    def decorator(function):
+        function.specs_dict = specs
+        return function
+    return decorator
+
+
+def build_spec(app):
+    """
+    Собирает OpenAPI-спецификацию средствами flasgger; flasgger импортируется только здесь
+    """
+    from flasgger import Swagger
+
+    swagger = Swagger()
+    swagger.app = app
+    swagger.load_config(app)
+    with app.app_context():
+        return swagger.get_apispecs('apispec_1')
+
+
+def _static_folder():
+    package = os.path.dirname(importlib.util.find_spec('flasgger').origin)
+    return os.path.join(package, 'ui3', 'static')
+
+
+def _register_ui(app):
+    page = UI_PAGE.format(title=app.config['SWAGGER'].get('title', 'API'), spec_route=SPEC_ROUTE)
+
+    @app.route('/apidocs/')
+    def apidocs():
+        return page
+
+    @app.route('/flasgger_static/<path:filename>')
+    def apidocs_static(filename):
+        return send_from_directory(_static_folder(), filename)
+
+
+def init_apidocs(app):
+    """
+    SWAGGER_MODE: eager — flasgger при старте (как раньше); lazy — спецификация собирается
+    при первом запросе к /apispec_1.json; file — готовая спецификация из SWAGGER_SPEC_FILE
+    (собирается командой flask apispec); off — без документации
+    """
+    @app.cli.command('apispec')
+    @click.option('--output', default=None, help='Файл для спецификации (по умолчанию SWAGGER_SPEC_FILE)')
+    def apispec_command(output):
+        """Собрать OpenAPI-спецификацию в файл для SWAGGER_MODE=file."""
+        output = output or current_app.config['SWAGGER_SPEC_FILE']
+        with open(output, 'w', encoding='utf-8') as spec_file:
+            json.dump(build_spec(current_app._get_current_object()), spec_file, ensure_ascii=False, indent=2)
+        click.echo(f'Спецификация записана в {output}')
+
+    mode = app.config.get('SWAGGER_MODE', 'eager')
+    if mode == 'off':
+        return
+    if mode == 'eager':
+        from flasgger import Swagger
+        Swagger(app)
+        return
+
+    spec = {}
+
+    @app.route(SPEC_ROUTE)
+    def apispec():
+        if not spec:
+            if mode == 'file':
+                with open(app.config['SWAGGER_SPEC_FILE'], encoding='utf-8') as spec_file:
+                    spec.update(json.load(spec_file))
+            else:
+                spec.update(build_spec(app))
+        return jsonify(spec)
+
+    _register_ui(app)
@@ -0,0 +1,114 @@
+"""
+Архив сделок: завершённые сделки старше DEAL_ARCHIVE_AFTER_DAYS переносятся из deal
+в deal_archive, чтобы горячая таблица (и выборка сделок пользователя по sender_id OR
+recipient_id) не росла вместе с историей обменов. Отменённые сделки удаляются сразу
+(app.deals.cancel), поэтому в архив попадают только Completed.
+
+Перенос идёт пакетами по DEAL_ARCHIVE_BATCH_SIZE, каждый пакет — отдельная короткая
+транзакция: INSERT ... SELECT в архив и DELETE из deal по тем же ID. Кандидаты выбираются
+FOR UPDATE SKIP LOCKED, поэтому параллельные проходы не переносят одну сделку дважды.
+Возраст считается по времени сделки (time): времени завершения в таблице нет.
+
+Проходы выполняет фоновая задача deals_archive (app.jobs): её ставит завершение сделки,
+а проход с полным пакетом ставит следующий. Команда `flask deals-archive` переносит всё
+накопившееся сразу, её можно запускать по cron.
+"""
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import func, literal, select, union_all
+from . import jobs
+from .database import db
+from .models import Deal, DealArchive
+
+ARCHIVED_STATUS = 'Completed'
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Переносит один пакет сделок, завершённых раньше cutoff; возвращает их число
+    """
+    # Последняя сделка остаётся в deal: SQLite без AUTOINCREMENT выдаёт новой строке
+    # max(deal_id) + 1, и ID перенесённой сделки мог бы достаться новой
+    last_id = db.session.query(func.max(Deal.deal_id)).scalar()
+    deal_ids = [deal_id for deal_id, in db.session.query(Deal.deal_id)
+                .filter(Deal.status == ARCHIVED_STATUS, Deal.time < cutoff, Deal.deal_id < last_id)
+                .order_by(Deal.deal_id).limit(batch_size).with_for_update(skip_locked=True)]
+    if not deal_ids:
+        db.session.rollback()
+        return 0
+    columns = [column.name for column in DealArchive.__table__.columns if column.name != 'archived_at']
+    db.session.execute(DealArchive.__table__.insert().from_select(
+        columns + ['archived_at'],
+        select(*(Deal.__table__.c[name] for name in columns), literal(datetime.utcnow()))
+        .where(Deal.deal_id.in_(deal_ids))))
+    db.session.query(Deal).filter(Deal.deal_id.in_(deal_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(deal_ids)
+
+
+def archive_deals(older_than_days, batch_size, max_batches=None):
+    """
+    Переносит пакеты, пока они полные (или max_batches); возвращает (перенесено, остались ли ещё)
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        moved += count
+        batches += 1
+        if count < batch_size:
+            return moved, False
+    return moved, True
+
+
+def schedule(delay=None):
+    """
+    Ставит проход архивации в текущей транзакции, если он ещё не ждёт в очереди
+    """
+    if delay is None:
+        delay = current_app.config.get('DEAL_ARCHIVE_INTERVAL_SECONDS', 3600)
+    jobs.enqueue('deals_archive', delay=delay, unique=True)
+
+
+@jobs.job('deals_archive')
+def archive_job():
+    config = current_app.config
+    moved, more = archive_deals(config.get('DEAL_ARCHIVE_AFTER_DAYS', 90), config.get('DEAL_ARCHIVE_BATCH_SIZE', 1000),
+                                max_batches=config.get('DEAL_ARCHIVE_BATCHES_PER_PASS', 10))
+    if more:
+        # Задача остаётся короткой: оставшееся переносит следующий проход
+        schedule(delay=0)
+        db.session.commit()
+
+
+def archived_union(resource, *criteria):
+    """
+    Подзапрос deals: сделки из deal и deal_archive со столбцами resource;
+    criteria — функции модели, возвращающие условие отбора
+    """
+    def part(model):
+        columns = [getattr(model, column.key).label(key) for key, column in zip(resource.keys, resource.columns)]
+        return select(*columns).where(*(criterion(model) for criterion in criteria))
+
+    return union_all(part(Deal), part(DealArchive)).subquery('deals')
+
+
+def with_archived(resource, *criteria):
+    """
+    Запрос по сделкам из deal и deal_archive; возвращает (запрос, столбец deal_id)
+    для keyset-пагинации
+    """
+    deals = archived_union(resource, *criteria)
+    return db.session.query(*deals.c), deals.c.deal_id
+
+
+def init_archive(app):
+    @app.cli.command('deals-archive')
+    @click.option('--older-than-days', type=int, help='Возраст сделки (по умолчанию DEAL_ARCHIVE_AFTER_DAYS)')
+    def deals_archive_command(older_than_days):
+        """Перенести старые завершённые сделки в архив."""
+        if older_than_days is None:
+            older_than_days = app.config.get('DEAL_ARCHIVE_AFTER_DAYS', 90)
+        moved, _ = archive_deals(older_than_days, app.config.get('DEAL_ARCHIVE_BATCH_SIZE', 1000))
+        click.echo(f'Перенесено сделок: {moved}')
@@ -0,0 +1,567 @@
+"""
+ASGI-режим (backend/asgi.py, запуск через uvicorn).
+
+Горячие маршруты чтения — список книг, карточка книги, отзывы и сделки пользователя —
+обслуживаются нативно: асинхронный SQLAlchemy (asyncpg для Postgres, aiosqlite для SQLite)
+и проверка JWT без блокировки цикла событий. Остальные запросы, а также ошибки
+аутентификации и 404 уходят в обычное Flask-приложение в пуле потоков, поэтому
+контракт /api/* совпадает с WSGI-режимом.
+
+Поток событий сделок (/api/deals/events) здесь тоже нативный: простаивающее
+SSE-соединение — корутина, ждущая свою очередь, а не поток пула.
+"""
+import asyncio
+import io
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode
+import jwt
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import InternalServerError
+from werkzeug.http import is_resource_modified
+from .archive import archived_union
+from .cache import book_key, book_reviews_key
+from .database import engine_options
+from .etag import MODIFIED_PREFIX, VERSION_PREFIX, validators_key
+from .events import AsyncSubscription, format_event, stream_headers
+from .models import Book, Deal, Review, StatCounter, User
+from .pagination import flag_arg, page_args
+from .principal import Principal
+from .serialize import BOOK, DEAL, REVIEW, deal_contact_ids, deal_dicts
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('app.access')
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_database_uri(uri):
+    """
+    Тот же адрес БД с асинхронным драйвером
+    """
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+class ClientDisconnected(Exception):
+    """
+    Клиент ASGI-соединения отключился, пока Flask-приложение отдавало ответ
+    """
+
+
+class AsgiRequest:
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.request_id = self.headers.get('x-request-id') or uuid.uuid4().hex
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        # Токен в query string принимается только там, где заголовок недоступен (EventSource)
+        self.query_token = False
+
+
+class AsgiApp:
+    """
+    ASGI-приложение поверх Flask-приложения app
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.routes = [
+            (re.compile(r'^/api/books$'), 'get_books', self.get_books),
+            (re.compile(r'^/api/books/(\d+)$'), 'get_book', self.get_book),
+            (re.compile(r'^/api/books/(\d+)/reviews$'), 'get_reviews', self.get_reviews),
+            (re.compile(r'^/api/deals$'), 'get_user_deals', self.get_user_deals),
+        ]
+        self.executor = ThreadPoolExecutor(self.config.get('ASGI_WSGI_THREADS', 16))
+        self._primary = None
+        self._replicas = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        if scope['method'] == 'GET' and scope['path'] == '/api/deals/events':
+            if await self.deal_events(scope, receive, send):
+                return
+        elif scope['method'] == 'GET':
+            for pattern, endpoint, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    if await self._native(scope, send, endpoint, handler, *map(int, match.groups())):
+                        return
+                    break
+        await self._wsgi(scope, receive, send)
+
+    # === Нативные обработчики ===
+
+    async def get_books(self, request):
+        if request.args.get('title') or flag_arg(request.args, 'stream'):
+            # Полнотекстовый фильтр и потоковая выдача — через Flask
+            return None
+        is_available = request.args.get('is_available', type=bool)
+        limit, after = self._page_args(request)
+
+        async def produce(engine):
+            query = BOOK.select()
+            if is_available is not None:
+                query = query.where(Book.is_available == is_available)
+            books, next_cursor = await self._keyset_page(request, engine, query, Book.book_id, limit, after)
+            return self._set_next_cursor(
+                request, self.app.json.response(BOOK.dicts(books)), next_cursor, limit)
+
+        return await self._conditional(request, 'book', produce)
+
+    async def get_book(self, request, book_id):
+        async def produce(engine):
+            async def load():
+                rows = await self._execute(request, engine, BOOK.select().where(Book.book_id == book_id))
+                return BOOK.to_dict(rows[0]) if rows else None
+
+            data = await self._cached(book_key(book_id), load)
+            return self.app.json.response(data) if data is not None else None
+
+        return await self._conditional(request, 'book', produce)
+
+    async def get_reviews(self, request, book_id):
+        async def produce(engine):
+            async def load():
+                rows = await self._execute(request, engine, REVIEW.select().where(Review.book_id == book_id))
+                return REVIEW.dicts(rows)
+
+            return self.app.json.response(await self._cached(book_reviews_key(book_id), load))
+
+        return await self._conditional(request, 'review', produce)
+
+    async def get_user_deals(self, request):
+        engine = self._engine(request)
+        principal = await self._principal(request, engine)
+        if principal is None:
+            # Нет токена или он недействителен — ответ об ошибке формирует flask_jwt_extended
+            return None
+        requested_user_id = request.args.get('user_id', type=int)
+        if principal.id != requested_user_id:
+            response = self.app.json.response({'message': 'Доступ запрещен'})
+            response.status_code = 403
+            return response
+
+        status = request.args.get('status')
+        limit, after = self._page_args(request)
+        criteria = [lambda model: (model.sender_id == requested_user_id) | (model.recipient_id == requested_user_id)]
+        if status:
+            criteria.append(lambda model: model.status == status)
+        if flag_arg(request.args, 'include_archived'):
+            union = archived_union(DEAL, *criteria)
+            query, key_column = select(*union.c), union.c.deal_id
+        else:
+            query, key_column = DEAL.select().where(*(criterion(Deal) for criterion in criteria)), Deal.deal_id
+        deals, next_cursor = await self._keyset_page(request, engine, query, key_column, limit, after)
+
+        contact_ids = deal_contact_ids(deals)
+        contacts = {}
+        if contact_ids:
+            users = await self._execute(
+                request, engine, select(User.id, User.email, User.phone).where(User.id.in_(contact_ids)))
+            contacts = {user.id: user.email or user.phone for user in users}
+
+        response = self.app.json.response(deal_dicts(deals, contacts))
+        return self._set_next_cursor(request, response, next_cursor, limit)
+
+    async def deal_events(self, scope, receive, send):
+        """
+        SSE-поток событий сделок: соединение — корутина, ждущая очередь подписки, без
+        отдельного потока. Без действительного токена запрос уходит во Flask за ответом 401.
+        """
+        request = AsgiRequest(scope)
+        request.query_token = True
+        principal = await self._principal(request, self._engine(request))
+        if principal is None:
+            return False
+
+        hub, broker = self.app.extensions['events']
+        await asyncio.get_running_loop().run_in_executor(self.executor, broker.listen)
+        subscription = hub.subscribe(AsyncSubscription(
+            principal.id, asyncio.get_running_loop(), self.config.get('EVENTS_MAX_PENDING', 100)))
+        heartbeat = self.config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+        origin = request.headers.get('origin')
+        headers = {**stream_headers(), 'Content-Type': 'text/event-stream; charset=utf-8',
+                   'Access-Control-Allow-Origin': origin or '*', 'X-Request-ID': request.request_id}
+        disconnected = asyncio.ensure_future(self._disconnected(receive))
+        overflowed = asyncio.ensure_future(subscription.closed.wait())
+        started = time.perf_counter()
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+            })
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': f"retry: {self.config.get('EVENTS_RETRY_MS', 3000)}\n\n".encode()})
+            while not subscription.overflowed:
+                next_event = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait({next_event, disconnected, overflowed}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    next_event.cancel()
+                    break
+                if subscription.overflowed:
+                    # Оставшиеся события не отправляются: клиент переподключится и перечитает сделки
+                    next_event.cancel()
+                    continue
+                if next_event in done:
+                    chunk = format_event(next_event.result())
+                else:
+                    next_event.cancel()
+                    chunk = ': ping\n\n'
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            else:
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            hub.unsubscribe(subscription)
+            disconnected.cancel()
+            overflowed.cancel()
+            access_logger.info('%s %s %s', request.method, request.path, 200, extra={
+                'request_id': request.request_id,
+                'endpoint': 'deal_events',
+                'method': request.method,
+                'path': request.path,
+                'status': 200,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            })
+        return True
+
+    @staticmethod
+    async def _disconnected(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # === Общие части: БД, JWT, условный GET, пагинация ===
+
+    def _engine(self, request):
+        """
+        Реплика для чтения, если она настроена и пользователь недавно не писал в БД
+        """
+        if self._primary is None:
+            uri = self.config['SQLALCHEMY_DATABASE_URI']
+            self._primary = create_async_engine(async_database_uri(uri), **engine_options(uri, self.config))
+            self._replicas = [
+                create_async_engine(async_database_uri(uri), **engine_options(uri, self.config))
+                for uri in self.config.get('SQLALCHEMY_REPLICA_URIS') or []]
+        if self._replicas:
+            identity = self._identity(request)
+            if identity is None or self.app.extensions['recent_writers'].get(identity) is None:
+                return random.choice(self._replicas)
+        return self._primary
+
+    async def _execute(self, request, engine, statement):
+        started = time.perf_counter()
+        async with engine.connect() as connection:
+            rows = (await connection.execute(statement)).all()
+        request.sql_count += 1
+        request.sql_seconds += time.perf_counter() - started
+        return rows
+
+    def _identity(self, request):
+        """
+        Идентификатор пользователя из access-токена или None; проверка подписи и срока
+        — чистое вычисление без ввода-вывода, цикл событий не блокируется
+        """
+        if hasattr(request, 'identity'):
+            return request.identity
+        request.identity = None
+        header = request.headers.get('authorization', '')
+        token = header[len('Bearer '):] if header.startswith('Bearer ') else None
+        if token is None and request.query_token:
+            token = request.args.get(self.config.get('JWT_QUERY_STRING_NAME', 'jwt'))
+        if token:
+            try:
+                claims = jwt.decode(
+                    token,
+                    self.config.get('JWT_SECRET_KEY') or self.config.get('SECRET_KEY'),
+                    algorithms=[self.config.get('JWT_ALGORITHM', 'HS256')],
+                    leeway=self.config.get('JWT_DECODE_LEEWAY', 0))
+            except jwt.PyJWTError:
+                return None
+            if claims.get('type') == 'access':
+                request.identity = claims.get(self.config.get('JWT_IDENTITY_CLAIM', 'sub'))
+        return request.identity
+
+    async def _principal(self, request, engine):
+        identity = self._identity(request)
+        if identity is None:
+            return None
+        user_id = int(identity)
+        principals = self.app.extensions['principals']
+        principal = principals.get(user_id)
+        if principal is None:
+            rows = await self._execute(
+                request, engine, select(User.id, User.username, User.is_admin).where(User.id == user_id))
+            if not rows:
+                return None
+            principal = Principal(rows[0].id, rows[0].username, bool(rows[0].is_admin))
+            principals.set(user_id, principal)
+        return principal
+
+    async def _cached(self, key, load):
+        """
+        Аналог app.cache.cached: тот же кэш, что у Flask-обработчиков, загрузка — корутиной
+        """
+        cache = self.app.extensions['cache']
+        value = cache.get(key)
+        if value is None:
+            value = await load()
+            if value is not None:
+                cache.set(key, value)
+        return value
+
+    async def _conditional(self, request, table, produce):
+        """
+        Аналог app.etag.conditional: 304, если клиентская копия актуальна
+        """
+        engine = self._engine(request)
+        cache, key = self.app.extensions['cache'], validators_key(table)
+        values = cache.get(key)
+        if values is None:
+            names = (VERSION_PREFIX + table, MODIFIED_PREFIX + table)
+            rows = await self._execute(
+                request, engine, select(StatCounter.name, StatCounter.value).where(StatCounter.name.in_(names)))
+            counters = {row.name: row.value for row in rows}
+            values = [counters.get(VERSION_PREFIX + table, 0), counters.get(MODIFIED_PREFIX + table)]
+            cache.set(key, values, self.config.get('ETAG_CACHE_TTL', 5))
+        version, modified = values
+        etag = f'{table}-v{version}'
+        last_modified = datetime.fromtimestamp(modified, timezone.utc) if modified else None
+
+        environ = {'REQUEST_METHOD': request.method}
+        for header in ('if-none-match', 'if-modified-since'):
+            if header in request.headers:
+                environ['HTTP_' + header.upper().replace('-', '_')] = request.headers[header]
+        if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+            response = self.app.response_class('', 304)
+        else:
+            response = await produce(engine)
+            if response is None:
+                return None
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        return response
+
+    def _page_args(self, request):
+        return page_args(request.args, self.config)
+
+    async def _keyset_page(self, request, engine, query, key_column, limit, after):
+        query = query.order_by(key_column)
+        if after is not None:
+            query = query.where(key_column > after)
+        if limit is not None:
+            query = query.limit(limit + 1)
+        rows = await self._execute(request, engine, query)
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = getattr(rows[-1], key_column.key)
+        return rows, next_cursor
+
+    def _set_next_cursor(self, request, response, next_cursor, limit):
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+            args = request.args.to_dict()
+            args.update({'limit': limit, 'after': next_cursor})
+            response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+        return response
+
+    # === Отправка ответов ===
+
+    async def _native(self, scope, send, endpoint, handler, *path_args):
+        """
+        Выполняет нативный обработчик; False — запрос нужно передать во Flask
+        """
+        request = AsgiRequest(scope)
+        started = time.perf_counter()
+        try:
+            response = await handler(request, *path_args)
+        except Exception:
+            logger.exception('Ошибка в ASGI-обработчике %s', endpoint, extra={'request_id': request.request_id})
+            response = InternalServerError().get_response()
+        if response is None:
+            return False
+
+        origin = request.headers.get('origin')
+        response.headers['Access-Control-Allow-Origin'] = origin or '*'
+        if origin:
+            response.headers.add('Vary', 'Origin')
+        response.headers['X-Request-ID'] = request.request_id
+        body = response.get_data()
+        response.headers['Content-Length'] = str(len(body))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.to_wsgi_list()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+        duration = time.perf_counter() - started
+        metrics = self.app.extensions.get('metrics')
+        if metrics is not None:
+            metrics.record(endpoint, response.status_code, duration, request.sql_count, request.sql_seconds)
+        access_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'request_id': request.request_id,
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+        })
+        return True
+
+    async def _wsgi(self, scope, receive, send):
+        """
+        Запрос к Flask-приложению в пуле потоков; тело ответа передаётся по частям
+        """
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=16)
+        started = loop.create_future()
+        # Клиент отключился: поток перестаёт читать ответ Flask и закрывает его
+        cancelled = threading.Event()
+        pending = {}
+
+        def start_response(status, headers, exc_info=None):
+            loop.call_soon_threadsafe(started.set_result, (int(status.split(' ', 1)[0]), headers))
+
+        def put(chunk):
+            if cancelled.is_set():
+                raise ClientDisconnected()
+            future = pending['put'] = asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop)
+            if cancelled.is_set():
+                future.cancel()
+            try:
+                future.result()
+            except CancelledError:
+                raise ClientDisconnected()
+
+        def run():
+            # Весь ответ читается в одном потоке: stream_with_context держит контекст Flask
+            # в генераторе, и его нельзя продолжать из другого потока
+            try:
+                result = self.app(self._environ(scope, body), start_response)
+                try:
+                    for chunk in result:
+                        if chunk:
+                            put(chunk)
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+                put(None)
+            except ClientDisconnected:
+                pass
+            except Exception as error:
+                loop.call_soon_threadsafe(lambda: started.done() or started.set_exception(error))
+                if not cancelled.is_set():
+                    put(None)
+                raise
+
+        def cancel():
+            cancelled.set()
+            future = pending.get('put')
+            if future is not None:
+                future.cancel()
+
+        worker = loop.run_in_executor(self.executor, run)
+        disconnected = asyncio.ensure_future(self._disconnected(receive))
+        try:
+            done, _ = await asyncio.wait({started, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if started not in done:
+                cancel()
+                return
+            status, headers = started.result()
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+            while True:
+                next_chunk = asyncio.ensure_future(chunks.get())
+                done, _ = await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if next_chunk not in done:
+                    next_chunk.cancel()
+                    cancel()
+                    return
+                chunk = next_chunk.result()
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            await worker
+        finally:
+            disconnected.cancel()
+            # Поток после отключения завершается сам; его ошибка уже записана в лог Flask
+            worker.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ and key.startswith('HTTP_') else value
+        return environ
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        for engine in [self._primary, *(self._replicas or [])]:
+            if engine is not None:
+                await engine.dispose()
+        self._primary = self._replicas = None
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,161 @@
+"""
+Пакетные запросы: POST /api/batch выполняет несколько запросов к /api/* за один
+HTTP-запрос клиента.
+
+По умолчанию подзапросы идут по очереди в контексте приложения пакета: общая сессия БД
+и соединение из пула. Каждый проходит обычный конвейер Flask (before/after_request,
+обработчики ошибок, условный GET), поэтому ответ совпадает с ответом на отдельный запрос.
+При parallel=true запросы только на чтение (GET) выполняются в пуле потоков, у каждого
+свой контекст и своя сессия.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from flask import g, request
+from werkzeug.datastructures import MultiDict
+from werkzeug.test import EnvironBuilder
+from .database import db
+from .pagination import flag_arg
+
+BATCH_PATH = '/api/batch'
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+# Заголовки пакета, которые получает каждый подзапрос: один токен на весь пакет
+FORWARDED_HEADERS = ('Authorization', 'X-Request-ID')
+RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'X-Next-Cursor', 'Link', 'Retry-After')
+# Потоковые ответы пакет не собирает: поток событий бесконечен, выгрузка и stream=1
+# рассчитаны на то, что тело не держится в памяти целиком
+EVENTS_PATH = '/api/deals/events'
+EXPORT_PREFIX = '/api/admin/export/'
+STREAMING_REJECTED = 'Потоковые ответы (события сделок, выгрузка, stream=1) в пакете не поддерживаются'
+
+
+class BatchInvalid(Exception):
+    pass
+
+
+def _streaming(path):
+    route, _, query = path.partition('?')
+    route = route.rstrip('/')
+    return route == EVENTS_PATH or route.startswith(EXPORT_PREFIX) or \
+        flag_arg(MultiDict(parse_qsl(query, keep_blank_values=True)), 'stream')
+
+
+def _rejected(message):
+    return {'status': 400, 'headers': {}, 'body': {'message': message}}
+
+
+def parse(data, max_requests):
+    """
+    Проверяет тело пакета; возвращает (подзапросы, parallel). Потоковые подзапросы
+    не выполняются: их элемент ответа — 400 (поле error)
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        raise BatchInvalid('Ожидается объект с массивом requests')
+    items = data['requests']
+    if not items:
+        raise BatchInvalid('Пустой пакет')
+    if len(items) > max_requests:
+        raise BatchInvalid(f'В пакете не больше {max_requests} запросов')
+
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchInvalid(f'Запрос {index}: поле path обязательно')
+        method = str(item.get('method', 'GET')).upper()
+        path = item['path']
+        if method not in METHODS:
+            raise BatchInvalid(f'Запрос {index}: метод {method} не поддерживается')
+        if not path.startswith('/api/') or path.split('?', 1)[0].rstrip('/') == BATCH_PATH:
+            raise BatchInvalid(f'Запрос {index}: допустимы только пути /api/*, кроме {BATCH_PATH}')
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise BatchInvalid(f'Запрос {index}: headers должен быть объектом')
+        parsed.append({'method': method, 'path': path, 'body': item.get('body'),
+                       'headers': {name: str(value) for name, value in headers.items()
+                                   if name.lower() != 'authorization'},
+                       'error': STREAMING_REJECTED if _streaming(path) else None})
+
+    parallel = bool(data.get('parallel'))
+    if parallel and any(item['method'] != 'GET' for item in parsed):
+        raise BatchInvalid('Параллельно выполняются только GET-запросы')
+    return parsed, parallel
+
+
+def _environ(item, forwarded, base_url, remote_addr):
+    builder = EnvironBuilder(
+        path=item['path'], method=item['method'], base_url=base_url,
+        json=item['body'] if item['body'] is not None else None,
+        headers={**item['headers'], **forwarded},
+        environ_base={'REMOTE_ADDR': remote_addr})
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _dispatch(app, environ):
+    """
+    Полный цикл обработки одного подзапроса; возвращает элемент ответа пакета
+    """
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            # Необработанная ошибка подзапроса не должна оставить общую сессию в сбойном состоянии
+            db.session.rollback()
+            response = app.make_response(app.handle_exception(e))
+        # Страховка для потоков, не распознанных в parse: тело не читается, генератор закрывается.
+        # Ошибки HTTP (abort) Flask тоже оборачивает в итератор, но их тело ограничено
+        if response.is_streamed and response.status_code < 400:
+            response.close()
+            return _rejected(STREAMING_REJECTED)
+        body = response.get_data()
+        return {
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in RESPONSE_HEADERS if name in response.headers},
+            'body': response.get_json(silent=True) if response.is_json else body.decode('utf-8', 'replace') or None,
+        }
+
+
+def _dispatch_nested(app, environ):
+    """
+    Подзапрос в контексте приложения пакета: g подзапроса начинается пустым, а после него
+    восстанавливается g пакета (метрики, request_id). Сохраняется только отметка о записи
+    в БД — по ней пакет прилипает к основной БД (read-your-writes).
+    """
+    namespace = vars(g._get_current_object())
+    saved = dict(namespace)
+    namespace.clear()
+    try:
+        return _dispatch(app, environ)
+    finally:
+        wrote = namespace.get('db_wrote')
+        namespace.clear()
+        namespace.update(saved)
+        if wrote:
+            g.db_wrote = True
+
+
+def run(app, items, parallel=False):
+    forwarded = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    forwarded.setdefault('X-Request-ID', g.get('request_id', ''))
+    results = [_rejected(item['error']) if item['error'] else None for item in items]
+    pending = [index for index, item in enumerate(items) if not item['error']]
+    environs = [_environ(items[index], forwarded, request.host_url, request.remote_addr) for index in pending]
+
+    executor = app.extensions.get('batch_executor')
+    if parallel and executor is not None and len(environs) > 1:
+        def dispatch_isolated(environ):
+            with app.app_context():
+                return _dispatch(app, environ)
+
+        responses = executor.map(dispatch_isolated, environs)
+    else:
+        responses = [_dispatch_nested(app, environ) for environ in environs]
+    for index, response in zip(pending, responses):
+        results[index] = response
+    return results
+
+
+def init_batch(app):
+    workers = app.config.get('BATCH_MAX_WORKERS', 4)
+    app.extensions['batch_executor'] = ThreadPoolExecutor(workers, thread_name_prefix='batch') if workers else None
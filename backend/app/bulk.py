@@ -0,0 +1,126 @@
+import io
+import json
+from .database import db
+from .models import Book
+
+BOOK_COLUMNS = ('title', 'description', 'user_id', 'is_available')
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def iter_rows(request, max_rows):
+    """
+    Строки импорта из JSON-массива или NDJSON-потока (по одной JSON-строке на книгу).
+    NDJSON читается построчно, не загружая тело целиком.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        index = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            if index >= max_rows:
+                raise BatchTooLarge()
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, None
+            index += 1
+        return
+
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise ValueError('Ожидается JSON-массив книг')
+    if len(rows) > max_rows:
+        raise BatchTooLarge()
+    yield from enumerate(rows)
+
+
+def validate_book(row):
+    """
+    Возвращает (поля книги, None) или (None, текст ошибки)
+    """
+    if not isinstance(row, dict):
+        return None, 'Строка должна быть JSON-объектом'
+    title = row.get('title')
+    description = row.get('description')
+    is_available = row.get('is_available', True)
+    if not isinstance(title, str) or not title.strip():
+        return None, 'Поле title обязательно'
+    if len(title) > Book.title.type.length:
+        return None, f'Поле title длиннее {Book.title.type.length} символов'
+    if description is not None and not isinstance(description, str):
+        return None, 'Поле description должно быть строкой'
+    if description and len(description) > Book.description.type.length:
+        return None, f'Поле description длиннее {Book.description.type.length} символов'
+    if not isinstance(is_available, bool):
+        return None, 'Поле is_available должно быть boolean'
+    return {'title': title, 'description': description, 'is_available': is_available}, None
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_books(rows):
+    """
+    COPY ... FROM STDIN в текущей транзакции (Postgres + psycopg2)
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(row[column]) for column in BOOK_COLUMNS) + '\n')
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY book ({', '.join(BOOK_COLUMNS)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_books(rows):
+    """
+    Вставка пачки книг одним executemany (или COPY на Postgres) без транзакционного commit
+    """
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        _copy_books(rows)
+    else:
+        db.session.execute(Book.__table__.insert(), rows)
+
+
+def import_books(rows, user_id, chunk_size=1000, atomic=False):
+    """
+    Проверяет и вставляет книги пачками по chunk_size строк.
+    Возвращает (число вставленных строк, список ошибок по строкам).
+    При atomic=True и любой ошибке ничего не вставляется.
+    """
+    inserted = 0
+    errors = []
+    chunk = []
+    for index, row in rows:
+        book, error = validate_book(row)
+        if error:
+            errors.append({'row': index, 'error': error})
+            continue
+        if atomic and errors:
+            continue
+        book['user_id'] = user_id
+        chunk.append(book)
+        if len(chunk) >= chunk_size:
+            insert_books(chunk)
+            inserted += len(chunk)
+            chunk = []
+    if atomic and errors:
+        db.session.rollback()
+        return 0, errors
+    insert_books(chunk)
+    inserted += len(chunk)
+    return inserted, errors
@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class CacheBackend:
+    """
+    Общий интерфейс бэкендов кэша; значения — JSON-совместимые объекты
+    """
+    name = 'base'
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class NullCache(CacheBackend):
+    name = 'none'
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    Кэш в памяти процесса: вытеснение по LRU и истечение по TTL
+    """
+    name = 'memory'
+
+    def __init__(self, max_entries=10000, default_ttl=300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        result = super().stats()
+        result['size'] = len(self._entries)
+        return result
+
+
+class RedisCache(CacheBackend):
+    """
+    Разделяемый между процессами кэш; клиент должен поддерживать get/setex/delete
+    (redis.Redis или совместимая заглушка в тестах)
+    """
+    name = 'redis'
+
+    def __init__(self, client, default_ttl=300, prefix='book-exchange:'):
+        super().__init__()
+        self.client = client
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.setex(self.prefix + key, ttl or self.default_ttl, json.dumps(value))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+
+def book_key(book_id):
+    return f'book:{book_id}'
+
+
+def book_reviews_key(book_id):
+    return f'book:{book_id}:reviews'
+
+
+def init_cache(app):
+    backend = app.config.get('CACHE_BACKEND', 'memory')
+    ttl = app.config.get('CACHE_TTL', 300)
+    if backend == 'memory':
+        cache = LRUCache(app.config.get('CACHE_MAX_ENTRIES', 10000), ttl)
+    elif backend == 'redis':
+        cache = RedisCache.from_url(app.config['CACHE_REDIS_URL'], default_ttl=ttl)
+    else:
+        cache = NullCache()
+    app.extensions['cache'] = cache
+    return cache
+
+
+def get_cache():
+    return current_app.extensions['cache']
+
+
+def cached(key, loader, ttl=None):
+    """
+    Read-through: значение из кэша или результат loader(), который кладётся в кэш.
+    None от loader не кэшируется.
+    """
+    cache = get_cache()
+    value = cache.get(key)
+    if value is None:
+        value = loader()
+        if value is not None:
+            cache.set(key, value, ttl)
+    return value
+
+
+def invalidate_book(book_id, reviews=False):
+    """
+    Удаляет из кэша карточку книги (и её отзывы); вызывается после коммита изменения
+    """
+    keys = [book_key(book_id)]
+    if reviews:
+        keys.append(book_reviews_key(book_id))
+    get_cache().delete(*keys)
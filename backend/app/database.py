@@ -1,3 +1,109 @@
+import random
+from functools import wraps
+from flask import current_app, g, has_request_context
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from .cache import LRUCache
 
-db = SQLAlchemy()
\ No newline at end of file
+class RoutingSession(Session):
+    """
+    Сессия, которая в обработчиках, помеченных read_only, отправляет SELECT на реплику.
+    Запись, SELECT ... FOR UPDATE и всё после первой записи в запросе остаются на основной БД.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if clause is not None and getattr(clause, 'is_dml', False):
+                g.db_wrote = True
+            elif self._can_use_replica(clause):
+                replicas = current_app.extensions.get('db_replicas')
+                if replicas:
+                    return random.choice(replicas)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_replica(self, clause):
+        return (
+            g.get('db_read_only') and not g.get('db_wrote')
+            and clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None
+            and not (self.new or self.dirty or self.deleted)
+        )
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def read_only(view):
+    """
+    Помечает обработчик как только читающий: его запросы могут уйти на реплику.
+    Пользователь, недавно писавший в БД, читает с основной (read-your-writes).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_app.config.get('SQLALCHEMY_REPLICA_URIS'):
+            g.db_read_only = not _recently_wrote()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _recently_wrote():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return False
+    return identity is not None and current_app.extensions['recent_writers'].get(identity) is not None
+
+
+def engine_options(uri, config):
+    """
+    Параметры пула из конфигурации; для SQLite размер пула не задаётся
+    """
+    options = {
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+    }
+    if not uri.startswith('sqlite'):
+        options.update({
+            'pool_size': config.get('DB_POOL_SIZE', 10),
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        })
+    return options
+
+
+def configure_engines(app):
+    """
+    Вызывается до db.init_app: пул основной БД и движки реплик.
+    Реплики не заводятся как SQLALCHEMY_BINDS, чтобы create_all/drop_all их не трогали.
+    """
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(config['SQLALCHEMY_DATABASE_URI'], config).items():
+        config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault(key, value)
+
+    app.extensions['db_replicas'] = [
+        create_engine(uri, **engine_options(uri, config)) for uri in config.get('SQLALCHEMY_REPLICA_URIS') or []]
+
+    # Пользователи, которые недавно писали в БД, читают с основной (в пределах процесса)
+    app.extensions['recent_writers'] = LRUCache(
+        config.get('REPLICA_STICKY_MAX_ENTRIES', 10000), config.get('REPLICA_STICKY_SECONDS', 5))
+
+    @app.after_request
+    def remember_writer(response):
+        if g.get('db_wrote') and config.get('SQLALCHEMY_REPLICA_URIS'):
+            try:
+                identity = get_jwt_identity()
+            except Exception:
+                identity = None
+            if identity is not None:
+                app.extensions['recent_writers'].set(identity, True)
+        return response
@@ -0,0 +1,117 @@
+"""
+Переходы сделок между статусами: Created -> Agreed -> Completed, отмена только из Created.
+
+Каждый переход — условный UPDATE/DELETE ... WHERE status = <прочитанный статус>: если
+параллельный запрос уже изменил сделку, затронуто ноль строк, и переход отклоняется.
+Книги сделки при завершении снимаются с обмена одним UPDATE ... WHERE is_available,
+поэтому одну и ту же книгу нельзя отдать в двух сделках.
+
+Побочные эффекты, которым не место в ответе (пересчёт рекомендаций, перенос старых
+сделок в архив), ставятся в очередь фоновых задач (app.jobs) в той же транзакции.
+Участники узнают о переходе из потока событий (app.events). Счётчики статистики
+меняются в транзакции перехода, граф обменов и события — после её коммита в процессе
+запроса, поэтому в фоновые задачи они не выносятся.
+"""
+from flask import abort, current_app
+from sqlalchemy import and_, exists, or_, select
+from . import archive, events, exchange, jobs, stats
+from .database import db
+from .etag import touch
+from .models import Book, Deal, StatCounter
+
+CREATED, AGREED, COMPLETED = 'Created', 'Agreed', 'Completed'
+
+
+class DealConflict(Exception):
+    """
+    Переход невозможен: сделка или её книги уже изменились
+    """
+
+
+def load(deal_id):
+    """
+    Снимок сделки для проверки прав и условного перехода; 404, если сделки нет
+    """
+    deal = db.session.query(Deal.deal_id, Deal.sender_id, Deal.recipient_id, Deal.sender_book_id,
+                            Deal.recipient_book_id, Deal.status, Deal.time) \
+        .filter(Deal.deal_id == deal_id).first()
+    if deal is None:
+        abort(404)
+    return deal
+
+
+def _available(book_id, owner_id):
+    return exists().where(Book.book_id == book_id, Book.user_id == owner_id, Book.is_available.is_(True))
+
+
+def _set_status(deal, expected, status, **values):
+    """
+    Условный UPDATE сделки; при проигранной гонке откатывает транзакцию и бросает DealConflict
+    """
+    if deal.status != expected:
+        raise DealConflict(f'Сделка в статусе {deal.status}, ожидался {expected}')
+    query = db.session.query(Deal).filter(Deal.deal_id == deal.deal_id, Deal.status == expected)
+    if status == AGREED:
+        # Принять можно, только пока книги ещё у владельцев и доступны
+        query = query.filter(_available(deal.recipient_book_id, deal.recipient_id))
+        if values.get('sender_book_id'):
+            query = query.filter(_available(values['sender_book_id'], deal.sender_id))
+    if query.update(dict(values, status=status), synchronize_session=False) != 1:
+        db.session.rollback()
+        raise DealConflict('Сделка уже изменена другим запросом или книга недоступна')
+    stats.record_deal_status_changed(expected, status)
+
+
+def accept(deal, sender_book_id=None, gift_flag=None):
+    _set_status(deal, CREATED, AGREED, sender_book_id=sender_book_id, gift_flag=gift_flag)
+    # Сделка больше не открыта — из графа обменов она уходит
+    exchange.queue_change('remove_deal', deal.deal_id)
+    events.queue_event(events.deal_event(deal, AGREED, sender_book_id=sender_book_id))
+    db.session.commit()
+
+
+def complete(deal):
+    """
+    Завершает сделку и снимает её книги с обмена в одной транзакции; возвращает id книг
+    """
+    # Номер завершения берётся из счётчика в этой же транзакции: строка счётчика заблокирована
+    # до коммита, поэтому номера растут в порядке коммитов
+    stats.increment(stats.DEALS_COMPLETED_SEQ)
+    _set_status(deal, AGREED, COMPLETED, completed_seq=select(StatCounter.value)
+                .where(StatCounter.name == stats.DEALS_COMPLETED_SEQ).scalar_subquery())
+    owners = {deal.recipient_book_id: deal.recipient_id}
+    if deal.sender_book_id:
+        owners[deal.sender_book_id] = deal.sender_id
+    book_ids = sorted(owners)
+    # Строки книг блокируются в одном порядке, чтобы встречные сделки не ловили deadlock
+    db.session.query(Book.book_id).filter(Book.book_id.in_(book_ids)) \
+        .order_by(Book.book_id).with_for_update().all()
+    updated = db.session.query(Book) \
+        .filter(Book.is_available.is_(True),
+                or_(*[and_(Book.book_id == book_id, Book.user_id == owner_id) for book_id, owner_id in owners.items()])) \
+        .update({'is_available': False}, synchronize_session=False)
+    if updated != len(book_ids):
+        db.session.rollback()
+        raise DealConflict('Книга уже отдана в другой сделке')
+    for book_id in book_ids:
+        exchange.queue_change('set_book', book_id, owners[book_id], False)
+    events.queue_event(events.deal_event(deal, COMPLETED))
+    # Одна отложенная задача на серию завершённых сделок
+    jobs.enqueue('recommend_refresh', delay=current_app.config.get('RECOMMEND_REFRESH_DELAY', 60), unique=True)
+    archive.schedule()
+    touch('book')
+    db.session.commit()
+    return book_ids
+
+
+def cancel(deal):
+    deleted = db.session.query(Deal).filter(Deal.deal_id == deal.deal_id, Deal.status == CREATED) \
+        .delete(synchronize_session=False)
+    if deleted != 1:
+        db.session.rollback()
+        raise DealConflict('Сделка уже изменена другим запросом')
+    stats.record_deal_deleted(deal)
+    exchange.queue_change('remove_deal', deal.deal_id)
+    events.queue_event(events.deal_event(deal, events.CANCELLED))
+    db.session.commit()
+
@@ -0,0 +1,82 @@
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, has_app_context, make_response, request
+from sqlalchemy import event
+from werkzeug.http import is_resource_modified
+from . import stats
+from .cache import cached, get_cache
+from .database import RoutingSession, db
+
+VERSION_PREFIX = 'version:'
+MODIFIED_PREFIX = 'modified:'
+
+
+def validators_key(table):
+    return f'validators:{table}'
+
+
+def touch(*tables):
+    """
+    Отмечает изменение таблиц: версия растёт, время изменения обновляется.
+    Вызывается в той же транзакции, что и само изменение; валидаторы в кэше
+    сбрасываются после коммита.
+    """
+    now = int(time.time())
+    for table in tables:
+        stats.increment(VERSION_PREFIX + table)
+        stats.set_value(MODIFIED_PREFIX + table, now)
+    db.session.info.setdefault('etag_touched', set()).update(tables)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _drop_validators(session):
+    tables = session.info.pop('etag_touched', None)
+    if tables and has_app_context():
+        get_cache().delete(*map(validators_key, tables))
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_touched(session):
+    session.info.pop('etag_touched', None)
+
+
+def read_validators(table):
+    """
+    Версия и время изменения таблицы одним запросом к stat_counter
+    """
+    values = stats.read_values(VERSION_PREFIX + table, MODIFIED_PREFIX + table)
+    return [values.get(VERSION_PREFIX + table, 0), values.get(MODIFIED_PREFIX + table)]
+
+
+def validators(table):
+    """
+    ETag и Last-Modified таблицы. Берутся из кэша (ETAG_CACHE_TTL): в этом процессе
+    touch сбрасывает их сразу, в других процессах с кэшем в памяти — по истечении TTL
+    """
+    version, modified = cached(validators_key(table), lambda: read_validators(table),
+                               ttl=current_app.config.get('ETAG_CACHE_TTL', 5))
+    last_modified = datetime.fromtimestamp(modified, timezone.utc) if modified else None
+    return f'{table}-v{version}', last_modified
+
+
+def conditional(table):
+    """
+    Условный GET: если клиентская копия актуальна, отвечает 304 без вызова обработчика
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = validators(table)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
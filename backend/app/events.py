@@ -0,0 +1,302 @@
+"""
+События сделок для участников: GET /api/deals/events (Server-Sent Events).
+
+Переходы сделок (создание, принятие, завершение, отмена) ставятся в очередь сессии и
+публикуются только после коммита. Брокер доставляет событие во все процессы: memory —
+в пределах процесса, redis — через PUBLISH/SUBSCRIBE с одним слушающим потоком на процесс.
+В процессе событие раздаётся подпискам участников сделки через EventHub.
+
+Подписка — ограниченная очередь соединения. В ASGI-режиме (app.asgi) соединение — это
+корутина, ждущая asyncio.Queue, поэтому тысячи простаивающих клиентов не занимают потоков.
+В WSGI-режиме поток ответа ждёт обычную queue.Queue с тайм-аутом heartbeat.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from flask import Response, current_app, has_app_context
+from sqlalchemy import event
+from .database import RoutingSession, db
+from .models import Deal
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = 'Cancelled'
+DEAL_FIELDS = ('deal_id', 'status', 'sender_id', 'recipient_id', 'recipient_book_id', 'sender_book_id')
+
+
+class Subscription:
+    """
+    Очередь событий одного соединения. Если клиент не успевает читать и очередь
+    переполнилась, поток закрывается: клиент переподключится и перечитает сделки.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.overflowed = False
+
+    def deliver(self, event):
+        raise NotImplementedError
+
+
+class ThreadSubscription(Subscription):
+    def __init__(self, user_id, max_pending=100):
+        super().__init__(user_id)
+        self.queue = queue.Queue(max_pending)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """
+    Подписка корутины: доставка из любого потока через call_soon_threadsafe
+    """
+
+    def __init__(self, user_id, loop, max_pending=100):
+        super().__init__(user_id)
+        self.loop = loop
+        self.queue = asyncio.Queue(max_pending)
+        # Будит корутину соединения при переполнении, чтобы поток закрылся сразу
+        self.closed = asyncio.Event()
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.closed.set()
+
+
+class EventHub:
+    """
+    Подписки процесса по пользователям
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def subscribe(self, subscription):
+        with self.lock:
+            self.subscribers[subscription.user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[subscription.user_id]
+
+    def dispatch(self, event):
+        with self.lock:
+            targets = [subscription for user_id in {event['sender_id'], event['recipient_id']}
+                       for subscription in self.subscribers.get(user_id, ())]
+        for subscription in targets:
+            subscription.deliver(event)
+
+    def connections(self):
+        with self.lock:
+            return sum(len(subscriptions) for subscriptions in self.subscribers.values())
+
+
+class EventBroker:
+    """
+    Общий интерфейс доставки событий между процессами
+    """
+    name = 'base'
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, event):
+        raise NotImplementedError
+
+    def listen(self):
+        """
+        Вызывается при подписке: брокер начинает принимать события других процессов
+        """
+
+
+class MemoryBroker(EventBroker):
+    name = 'memory'
+
+    def publish(self, event):
+        self.hub.dispatch(event)
+
+
+class RedisBroker(EventBroker):
+    """
+    PUBLISH в общий канал; события других процессов принимает один поток на процесс,
+    запускаемый при первой подписке. При обрыве соединения поток переподписывается
+    с экспоненциальной задержкой; события за время разрыва теряются.
+    Клиент должен поддерживать publish/pubsub (redis.Redis или совместимая заглушка в тестах).
+    """
+    name = 'redis'
+
+    def __init__(self, hub, client, channel='book-exchange:deal-events', reconnect_delay=1, reconnect_max_delay=30):
+        super().__init__(hub)
+        self.client = client
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._listener = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, hub, url, **kwargs):
+        import redis
+        return cls(hub, redis.Redis.from_url(url), **kwargs)
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def listen(self):
+        with self._lock:
+            if self._listener is None:
+                # Первая подписка — в вызывающем потоке: события после listen() уже не теряются
+                self._listener = threading.Thread(target=self._run, args=(self._subscribe(),),
+                                                  name='deal-events', daemon=True)
+                self._listener.start()
+
+    def _subscribe(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        return pubsub
+
+    def _run(self, pubsub):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = self._subscribe()
+                    logger.info('Подписка на канал %s восстановлена', self.channel)
+                    delay = self.reconnect_delay
+                for message in pubsub.listen():
+                    self._dispatch(message)
+                logger.warning('Подписка на канал %s закрыта, переподключение через %s с', self.channel, delay)
+            except Exception:
+                logger.exception('Ошибка подписки на канал %s, переподключение через %s с', self.channel, delay)
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+                pubsub = None
+            time.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    def _dispatch(self, message):
+        try:
+            self.hub.dispatch(json.loads(message['data']))
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Некорректное событие сделки в канале %s', self.channel)
+
+
+def deal_event(deal, status, **changes):
+    """
+    Событие по ORM-объекту или строке сделки; changes — поля, изменённые переходом
+    """
+    event = {name: getattr(deal, name) for name in DEAL_FIELDS}
+    event.update(changes, status=status)
+    return event
+
+
+def queue_event(event):
+    """
+    Событие будет опубликовано после коммита текущей транзакции
+    """
+    db.session.info.setdefault('deal_events', []).append(event)
+
+
+def format_event(event):
+    return f"id: {event['deal_id']}\nevent: deal\ndata: {json.dumps(event)}\n\n"
+
+
+def stream_headers():
+    return {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def stream_response(user_id):
+    """
+    SSE-поток для WSGI-режима: подписка создаётся сразу, поток ответа ждёт события
+    с тайм-аутом heartbeat и отправляет комментарий-пинг, чтобы прокси не рвали соединение
+    """
+    config = current_app.config
+    hub, broker = get_events()
+    broker.listen()
+    subscription = hub.subscribe(ThreadSubscription(user_id, config.get('EVENTS_MAX_PENDING', 100)))
+    heartbeat = config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+    retry = config.get('EVENTS_RETRY_MS', 3000)
+
+    def generate():
+        try:
+            yield f'retry: {retry}\n\n'
+            while not subscription.overflowed:
+                event = subscription.get(heartbeat)
+                yield format_event(event) if event is not None else ': ping\n\n'
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream', headers=stream_headers())
+    # Генератор мог не начаться, если клиент отключился сразу
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    return response
+
+
+def get_events():
+    return current_app.extensions['events']
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_created(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Deal):
+            session.info.setdefault('deal_events', []).append(deal_event(obj, obj.status))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _publish(session):
+    pending = session.info.pop('deal_events', None)
+    if not pending or not has_app_context() or 'events' not in current_app.extensions:
+        return
+    _, broker = get_events()
+    for payload in pending:
+        try:
+            broker.publish(payload)
+        except Exception:
+            # Уведомление не должно ломать уже закоммиченный запрос
+            logger.exception('Не удалось опубликовать событие сделки %s', payload['deal_id'])
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard(session):
+    session.info.pop('deal_events', None)
+
+
+def init_events(app):
+    hub = EventHub()
+    backend = app.config.get('EVENTS_BACKEND', 'memory')
+    if backend == 'redis':
+        broker = RedisBroker.from_url(hub, app.config.get('EVENTS_REDIS_URL') or app.config['CACHE_REDIS_URL'])
+    else:
+        broker = MemoryBroker(hub)
+    app.extensions['events'] = (hub, broker)
+    return hub, broker
@@ -0,0 +1,237 @@
+"""
+Поиск многосторонних обменов по открытым сделкам.
+
+Граф «хочу/есть»: вершины — пользователи, ребро sender -> recipient — открытая сделка
+(статус Created), в которой sender хочет доступную книгу recipient. Цикл
+u1 -> u2 -> ... -> uk -> u1 — обмен, в котором каждый отдаёт одну книгу и получает одну.
+
+Граф строится один раз и затем обновляется по изменениям Deal и Book, закоммиченным
+через сессию этого процесса (ORM-объекты — из after_flush, массовые UPDATE — через queue_change). Изменения из других процессов подхватываются полной
+перестройкой раз в EXCHANGE_REBUILD_SECONDS; найденные циклы перед выдачей
+перепроверяются по БД.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from .database import RoutingSession, db
+from .models import Book, Deal
+
+OPEN_STATUS = 'Created'
+
+
+class ExchangeGraph:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.deals = {}                                   # deal_id -> (sender_id, recipient_id, book_id)
+        self.book_deals = defaultdict(set)                # book_id -> открытые сделки на эту книгу
+        self.owners = {}                                  # book_id -> владелец доступной книги
+        self.edges = defaultdict(lambda: defaultdict(set))    # sender -> recipient -> deal_ids
+        self.reverse = defaultdict(lambda: defaultdict(set))  # recipient -> sender -> deal_ids
+        self.built_at = None
+
+    def load(self, deals, books):
+        """
+        deals — (deal_id, sender_id, recipient_id, book_id), books — (book_id, owner_id) доступных книг
+        """
+        with self.lock:
+            self._reset()
+            self.owners.update(books)
+            for deal_id, sender_id, recipient_id, book_id in deals:
+                self.set_deal(deal_id, sender_id, recipient_id, book_id)
+            self.built_at = time.monotonic()
+
+    # === Инкрементальные изменения ===
+
+    def set_deal(self, deal_id, sender_id, recipient_id, book_id):
+        with self.lock:
+            self.remove_deal(deal_id)
+            self.deals[deal_id] = (sender_id, recipient_id, book_id)
+            self.book_deals[book_id].add(deal_id)
+            self._update_edge(deal_id)
+
+    def remove_deal(self, deal_id):
+        with self.lock:
+            deal = self.deals.pop(deal_id, None)
+            if deal is None:
+                return
+            sender_id, recipient_id, book_id = deal
+            self._discard_edge(sender_id, recipient_id, deal_id)
+            self.book_deals[book_id].discard(deal_id)
+            if not self.book_deals[book_id]:
+                del self.book_deals[book_id]
+
+    def set_book(self, book_id, owner_id, is_available):
+        with self.lock:
+            if is_available:
+                self.owners[book_id] = owner_id
+            else:
+                self.owners.pop(book_id, None)
+            for deal_id in self.book_deals.get(book_id, ()):
+                self._update_edge(deal_id)
+
+    def remove_book(self, book_id):
+        self.set_book(book_id, None, False)
+
+    def _update_edge(self, deal_id):
+        sender_id, recipient_id, book_id = self.deals[deal_id]
+        if sender_id != recipient_id and self.owners.get(book_id) == recipient_id:
+            self.edges[sender_id][recipient_id].add(deal_id)
+            self.reverse[recipient_id][sender_id].add(deal_id)
+        else:
+            self._discard_edge(sender_id, recipient_id, deal_id)
+
+    def _discard_edge(self, sender_id, recipient_id, deal_id):
+        for index, source, target in ((self.edges, sender_id, recipient_id), (self.reverse, recipient_id, sender_id)):
+            targets = index.get(source)
+            if targets is None or target not in targets:
+                continue
+            targets[target].discard(deal_id)
+            if not targets[target]:
+                del targets[target]
+                if not targets:
+                    del index[source]
+
+    # === Поиск циклов ===
+
+    def _distances_to(self, user_id, max_depth):
+        """
+        Расстояние от каждой вершины до user_id по рёбрам графа, не больше max_depth
+        """
+        distances = {user_id: 0}
+        queue = deque([user_id])
+        while queue:
+            node = queue.popleft()
+            depth = distances[node]
+            if depth == max_depth:
+                continue
+            for sender_id in self.reverse.get(node, ()):
+                if sender_id not in distances:
+                    distances[sender_id] = depth + 1
+                    queue.append(sender_id)
+        return distances
+
+    def cycles(self, user_id, max_length, limit, budget=100000):
+        """
+        Циклы длины 2..max_length через user_id, короткие первыми; каждый цикл — список
+        сделок (deal_id, sender_id, recipient_id, book_id). budget ограничивает число шагов поиска.
+        """
+        with self.lock:
+            distances = self._distances_to(user_id, max_length - 1)
+            found = []
+            path, deals = [user_id], []
+            steps = 0
+
+            def visit(node, length):
+                nonlocal steps
+                for target, deal_ids in self.edges.get(node, {}).items():
+                    if len(found) >= limit or steps >= budget:
+                        return
+                    steps += 1
+                    remaining = length - len(deals) - 1
+                    if target == user_id:
+                        if remaining == 0:
+                            found.append(deals + [(min(deal_ids), *self.deals[min(deal_ids)])])
+                        continue
+                    if remaining == 0 or target in path or distances.get(target, length) > remaining:
+                        continue
+                    deal_id = min(deal_ids)
+                    path.append(target)
+                    deals.append((deal_id, *self.deals[deal_id]))
+                    visit(target, length)
+                    path.pop()
+                    deals.pop()
+
+            for length in range(2, max_length + 1):
+                visit(user_id, length)
+        return found
+
+
+def _load_graph(graph):
+    deals = db.session.query(Deal.deal_id, Deal.sender_id, Deal.recipient_id, Deal.recipient_book_id) \
+        .filter(Deal.status == OPEN_STATUS).all()
+    books = db.session.query(Book.book_id, Book.user_id).filter(Book.is_available.is_(True)).all()
+    graph.load(deals, books)
+
+
+def get_exchange():
+    """
+    Граф текущего приложения; строится при первом обращении и перестраивается
+    раз в EXCHANGE_REBUILD_SECONDS
+    """
+    graph = current_app.extensions['exchange']
+    max_age = current_app.config.get('EXCHANGE_REBUILD_SECONDS', 60)
+    if graph.built_at is None or time.monotonic() - graph.built_at > max_age:
+        _load_graph(graph)
+    return graph
+
+
+def valid_cycles(cycles):
+    """
+    Оставляет циклы, все сделки которых всё ещё открыты, а книги доступны у получателей.
+    Устаревшие сделки заодно убираются из графа.
+    """
+    deal_ids = {deal[0] for cycle in cycles for deal in cycle}
+    if not deal_ids:
+        return []
+    valid = {
+        row.deal_id for row in db.session.query(Deal.deal_id)
+        .join(Book, Book.book_id == Deal.recipient_book_id)
+        .filter(Deal.deal_id.in_(deal_ids), Deal.status == OPEN_STATUS,
+                Book.is_available.is_(True), Book.user_id == Deal.recipient_id)
+    }
+    graph = current_app.extensions['exchange']
+    for deal_id in deal_ids - valid:
+        graph.remove_deal(deal_id)
+    return [cycle for cycle in cycles if all(deal[0] in valid for deal in cycle)]
+
+
+def queue_change(method, *args):
+    """
+    Изменение графа после коммита текущей транзакции — для UPDATE/DELETE мимо ORM-объектов,
+    которые не видны в after_flush
+    """
+    db.session.info.setdefault('exchange_changes', []).append((method, *args))
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault('exchange_changes', [])
+    for obj in session.deleted:
+        if isinstance(obj, Deal):
+            changes.append(('remove_deal', obj.deal_id))
+        elif isinstance(obj, Book):
+            changes.append(('remove_book', obj.book_id))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Deal):
+            if obj.status == OPEN_STATUS:
+                changes.append(('set_deal', obj.deal_id, obj.sender_id, obj.recipient_id, obj.recipient_book_id))
+            else:
+                changes.append(('remove_deal', obj.deal_id))
+        elif isinstance(obj, Book):
+            changes.append(('set_book', obj.book_id, obj.user_id, bool(obj.is_available)))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('exchange_changes', None)
+    if not changes or not has_app_context():
+        return
+    graph = current_app.extensions.get('exchange')
+    if graph is None or graph.built_at is None:
+        return
+    for method, *args in changes:
+        getattr(graph, method)(*args)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('exchange_changes', None)
+
+
+def init_exchange(app):
+    app.extensions['exchange'] = ExchangeGraph()
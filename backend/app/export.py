@@ -0,0 +1,129 @@
+"""
+Выгрузка таблиц для админов: GET /api/admin/export/<resource> и `flask export`.
+
+Строки читаются одним SELECT по первичному ключу через серверный курсор (stream_results,
+yield_per) и кодируются пачками по EXPORT_CHUNK_SIZE строк, поэтому память не зависит от
+размера таблицы. Выборка — обычный SELECT без блокировок: запись в таблицы не ждёт
+выгрузку, а в обработчике с read_only запрос уходит на реплику, если она настроена.
+
+В таблицах нет времени изменения, поэтому инкрементальная выгрузка идёт по первичному
+ключу: since — ID последней выгруженной строки, выгружаются строки с ID больше него.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+import click
+from flask import current_app
+from sqlalchemy import select, union_all
+from .database import db
+from .models import Book, Deal, DealArchive, Review
+
+EXPORTS = {'books': Book, 'reviews': Review, 'deals': Deal}
+# Ресурсы с архивной таблицей (app.archive) выгружаются вместе с ней, одним потоком по ключу
+ARCHIVES = {'deals': DealArchive}
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+class ExportInvalid(Exception):
+    pass
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _ndjson(names, partitions):
+    dumps = current_app.json.dumps
+    for rows in partitions:
+        yield ''.join(dumps(dict(zip(names, map(_plain, row))), sort_keys=False) + '\n' for row in rows)
+
+
+def _csv(names, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(names)
+    for rows in partitions:
+        writer.writerows(map(_plain, row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _gzip(chunks):
+    # wbits=31 — формат gzip; сжатие потоковое, пачка за пачкой
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def open_export(resource, fmt='ndjson', since=None, compress=False, chunk_size=None, summary=None):
+    """
+    Проверяет параметры и возвращает (генератор байтов, mimetype, имя файла).
+    В summary, если передан, по ходу выгрузки пишутся rows и last_id.
+    """
+    model = EXPORTS.get(resource)
+    if model is None:
+        raise ExportInvalid(f'Неизвестный ресурс {resource}; доступны: {", ".join(EXPORTS)}')
+    if fmt not in FORMATS:
+        raise ExportInvalid(f'Неизвестный формат {fmt}; доступны: {", ".join(FORMATS)}')
+    if since is not None:
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            raise ExportInvalid('since — ID последней выгруженной строки')
+    if chunk_size is None:
+        chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+
+    table = model.__table__
+    source = table
+    if resource in ARCHIVES:
+        archived = ARCHIVES[resource].__table__
+        source = union_all(select(*table.columns),
+                           select(*(archived.c[column.name] for column in table.columns))).subquery(table.name)
+    primary_key, = table.primary_key.columns
+    key = source.c[primary_key.name]
+    statement = select(*source.c).order_by(key)
+    if since is not None:
+        statement = statement.where(key > since)
+    names = [column.name for column in table.columns]
+    key_index = names.index(key.name)
+    summary = summary if summary is not None else {}
+    summary.update(rows=0, last_id=since)
+
+    def partitions():
+        result = db.session.execute(statement.execution_options(stream_results=True, yield_per=chunk_size))
+        for rows in result.partitions():
+            summary['rows'] += len(rows)
+            summary['last_id'] = rows[-1][key_index]
+            yield rows
+
+    encode = _ndjson if fmt == 'ndjson' else _csv
+    chunks = (text.encode('utf-8') for text in encode(names, partitions()))
+    filename = f'{resource}.{fmt}'
+    if compress:
+        return _gzip(chunks), 'application/gzip', filename + '.gz'
+    return chunks, FORMATS[fmt], filename
+
+
+def init_export(app):
+    @app.cli.command('export')
+    @click.argument('resource', type=click.Choice(list(EXPORTS)))
+    @click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='ndjson')
+    @click.option('--since', type=int, help='Выгрузить строки с ID больше указанного')
+    @click.option('--gzip', 'compress', is_flag=True, help='Сжать gzip')
+    @click.option('--output', '-o', default='-', help='Файл; по умолчанию stdout')
+    def export_command(resource, fmt, since, compress, output):
+        """Выгрузить книги, сделки или отзывы в NDJSON/CSV."""
+        summary = {}
+        chunks, _, _ = open_export(resource, fmt, since, compress, summary=summary)
+        with click.open_file(output, 'wb') as stream:
+            for chunk in chunks:
+                stream.write(chunk)
+        # Последний ID — значение --since для следующей инкрементальной выгрузки
+        click.echo(f"Строк: {summary['rows']}, последний ID: {summary['last_id']}", err=True)
@@ -0,0 +1,101 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# Пулы общие для всех экземпляров приложения в процессе, ключ — число воркеров
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """
+    Очередь на хэширование заполнена или ответ не получен вовремя
+    """
+
+
+class PasswordHasher:
+    """
+    Хэширование паролей в ограниченном пуле процессов.
+    Одновременно принимается не больше workers + queue_size задач, остальные получают HashingBusy.
+    При workers=0 хэширование выполняется в потоке запроса.
+    """
+
+    def __init__(self, method, workers=0, queue_size=0, timeout=None):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+
+    def _get_executor(self):
+        # Пул создаётся при первом обращении, чтобы не замедлять старт приложения
+        with _executors_lock:
+            if self.workers not in _executors:
+                _executors[self.workers] = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return _executors[self.workers]
+
+    def _discard_executor(self, executor):
+        # Сломанный пул (упал процесс-воркер) больше не принимает задачи: следующий запрос создаст новый
+        with _executors_lock:
+            if _executors.get(self.workers) is executor:
+                del _executors[self.workers]
+        executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        executor = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        except BaseException as error:
+            self._slots.release()
+            if isinstance(error, BrokenProcessPool):
+                self._discard_executor(executor)
+                raise HashingBusy()
+            raise
+        # Слот занят, пока задача выполняется в пуле, даже если запрос перестал её ждать
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+
+def init_hashing(app):
+    hasher = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+        queue_size=app.config.get('PASSWORD_HASH_QUEUE_SIZE', 0),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT'),
+    )
+    app.extensions['hashing'] = hasher
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(error):
+        response = jsonify({'message': 'Сервер перегружен, повторите попытку позже'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config.get('PASSWORD_HASH_RETRY_AFTER', 1))
+        return response
+
+    return hasher
+
+
+def get_hasher():
+    return current_app.extensions['hashing']
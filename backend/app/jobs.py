@@ -0,0 +1,424 @@
+"""
+Фоновые задачи: побочные эффекты переходов сделок выполняются после ответа.
+
+Задача ставится в очередь в транзакции запроса и становится видна воркерам только после
+коммита; при откате она исчезает вместе с изменениями. Очередь — таблица job (database,
+переживает перезапуски, воркеры — отдельные процессы `flask jobs-worker`) или память
+процесса (memory, для тестов).
+
+Воркер забирает задачу условным UPDATE ... WHERE status = 'queued' (на Postgres кандидаты
+выбираются FOR UPDATE SKIP LOCKED), поэтому одна задача не выполняется дважды. Упавшая
+задача повторяется с экспоненциальной задержкой, после max_attempts попыток помечается
+failed. Задача, зависшая в running дольше JOBS_TIMEOUT_SECONDS (воркер упал), забирается снова.
+
+Уникальность ждущих задач (enqueue(unique=...)) обеспечивает база: частичный уникальный индекс
+по (name, unique_key) среди queued и INSERT ... ON CONFLICT DO NOTHING, поэтому параллельные
+запросы не ставят дубликат.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+import click
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, exists, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from .database import RoutingSession, db
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Обработчики задач по имени; регистрируются декоратором job в модулях предметной области
+HANDLERS = {}
+
+ClaimedJob = namedtuple('ClaimedJob', ['id', 'name', 'payload', 'attempts', 'max_attempts', 'run_at'])
+
+
+def job(name):
+    def decorator(handler):
+        HANDLERS[name] = handler
+        return handler
+    return decorator
+
+
+def backoff(attempts, base, cap):
+    """
+    Задержка перед повтором: base * 2^(attempts-1), не больше cap, с джиттером ±20%
+    """
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _seconds(delta):
+    return delta.total_seconds() if delta is not None else None
+
+
+def summarize(counts, oldest_run_at, finished, now, window):
+    """
+    Глубина очереди по статусам и задержки задач, завершённых за последние window секунд:
+    wait — от готовности до начала последней попытки, run — время выполнения
+    """
+    waits = [_seconds(started - run_at) for run_at, started, _ in finished]
+    runs = [_seconds(done - started) for _, started, done in finished]
+    return {
+        'queued': counts.get(QUEUED, 0),
+        'running': counts.get(RUNNING, 0),
+        'failed': counts.get(FAILED, 0),
+        'done': counts.get(DONE, 0),
+        'oldest_queued_seconds': round(max(_seconds(now - oldest_run_at), 0), 3) if oldest_run_at else 0,
+        'window_seconds': window,
+        'completed_in_window': len(finished),
+        'wait_seconds': {'avg': round(sum(waits) / len(waits), 3) if waits else 0,
+                         'max': round(max(waits), 3) if waits else 0},
+        'run_seconds': {'avg': round(sum(runs) / len(runs), 3) if runs else 0,
+                        'max': round(max(runs), 3) if runs else 0},
+    }
+
+
+class DatabaseQueue:
+    """
+    Очередь в таблице job; методы воркера (claim, finish, retry, fail, purge) коммитят свою транзакцию
+    """
+    name = 'database'
+
+    def enqueue(self, entry):
+        values = dict(entry, payload=json.dumps(entry['payload']))
+        dialect = db.session.get_bind().dialect.name
+        if entry['unique_key'] is None:
+            db.session.add(Job(**values))
+        elif dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            db.session.execute(insert(Job).values(status=QUEUED, attempts=0, **values).on_conflict_do_nothing(
+                index_elements=[Job.name, Job.unique_key], index_where=Job.status == QUEUED))
+        elif not self.has_queued(entry['name'], entry['unique_key']):
+            # Без ON CONFLICT дубликат при гонке отклонит уникальный индекс при коммите
+            db.session.add(Job(**values))
+
+    def has_queued(self, name, unique_key):
+        return db.session.query(Job.id).filter(
+            Job.status == QUEUED, Job.name == name, Job.unique_key == unique_key).first() is not None
+
+    def claim(self, limit, timeout):
+        now = datetime.utcnow()
+        due = or_(and_(Job.status == QUEUED, Job.run_at <= now),
+                  and_(Job.status == RUNNING, Job.started_at < now - timedelta(seconds=timeout)))
+        candidates = db.session.query(Job.id).filter(due).order_by(Job.run_at, Job.id).limit(limit) \
+            .with_for_update(skip_locked=True).all()
+        claimed = [
+            job_id for job_id, in candidates
+            if db.session.query(Job).filter(Job.id == job_id, due).update(
+                {'status': RUNNING, 'attempts': Job.attempts + 1, 'started_at': now},
+                synchronize_session=False)
+        ]
+        rows = db.session.query(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts, Job.run_at) \
+            .filter(Job.id.in_(claimed)).order_by(Job.run_at, Job.id).all() if claimed else []
+        db.session.commit()
+        return [ClaimedJob(row.id, row.name, json.loads(row.payload), row.attempts, row.max_attempts, row.run_at)
+                for row in rows]
+
+    def _update(self, job_id, **values):
+        db.session.query(Job).filter(Job.id == job_id, Job.status == RUNNING) \
+            .update(values, synchronize_session=False)
+        db.session.commit()
+
+    def finish(self, claimed):
+        self._update(claimed.id, status=DONE, finished_at=datetime.utcnow(), last_error=None)
+
+    def retry(self, claimed, error, run_at):
+        # Пока уникальная задача выполнялась, могла встать такая же: повтор уступает ей место
+        twin = Job.__table__.alias('twin')
+        queued_twin = exists().where(twin.c.name == Job.name, twin.c.unique_key == Job.unique_key,
+                                     twin.c.status == QUEUED)
+        retried = db.session.query(Job).filter(Job.id == claimed.id, Job.status == RUNNING, ~queued_twin) \
+            .update({'status': QUEUED, 'run_at': run_at, 'last_error': error[:1024]}, synchronize_session=False)
+        if not retried:
+            self._update(claimed.id, status=FAILED, finished_at=datetime.utcnow(),
+                         last_error=f'{error} (повтор заменён ждущей задачей)'[:1024])
+            return
+        db.session.commit()
+
+    def fail(self, claimed, error):
+        self._update(claimed.id, status=FAILED, finished_at=datetime.utcnow(), last_error=error[:1024])
+
+    def purge(self, older_than):
+        deleted = db.session.query(Job).filter(Job.status == DONE, Job.finished_at < older_than) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def stats(self, window):
+        now = datetime.utcnow()
+        counts = dict(db.session.query(Job.status, func.count()).group_by(Job.status).all())
+        oldest = db.session.query(func.min(Job.run_at)).filter(Job.status == QUEUED, Job.run_at <= now).scalar()
+        finished = db.session.query(Job.run_at, Job.started_at, Job.finished_at) \
+            .filter(Job.status == DONE, Job.finished_at >= now - timedelta(seconds=window)).all()
+        return summarize(counts, oldest, finished, now, window)
+
+
+class MemoryQueue:
+    """
+    Очередь в памяти процесса для тестов: задачи из сессии попадают сюда после коммита
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._next_id = 1
+
+    def enqueue(self, entry):
+        if entry['unique_key'] is not None and self.has_queued(entry['name'], entry['unique_key']):
+            return
+        # Задача живёт в транзакции: без неё откат не вызвал бы after_rollback
+        session = db.session()
+        if not session.in_transaction():
+            session.begin()
+        session.info.setdefault('jobs_pending', []).append(entry)
+
+    def push(self, entries):
+        with self._lock:
+            for entry in entries:
+                self._jobs[self._next_id] = dict(entry, id=self._next_id, status=QUEUED, attempts=0,
+                                                 started_at=None, finished_at=None, last_error=None)
+                self._next_id += 1
+
+    def has_queued(self, name, unique_key):
+        pending = db.session.info.get('jobs_pending', ())
+        with self._lock:
+            return any((entry['name'], entry['unique_key']) == (name, unique_key) for entry in pending) or \
+                any(entry['status'] == QUEUED and (entry['name'], entry['unique_key']) == (name, unique_key)
+                    for entry in self._jobs.values())
+
+    def claim(self, limit, timeout):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=timeout)
+        with self._lock:
+            due = sorted(
+                (entry for entry in self._jobs.values()
+                 if (entry['status'] == QUEUED and entry['run_at'] <= now)
+                 or (entry['status'] == RUNNING and entry['started_at'] < stale)),
+                key=lambda entry: (entry['run_at'], entry['id']))[:limit]
+            for entry in due:
+                entry.update(status=RUNNING, attempts=entry['attempts'] + 1, started_at=now)
+            return [ClaimedJob(entry['id'], entry['name'], entry['payload'], entry['attempts'],
+                               entry['max_attempts'], entry['run_at']) for entry in due]
+
+    def _update(self, job_id, **values):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is not None and entry['status'] == RUNNING:
+                entry.update(values)
+
+    def finish(self, claimed):
+        self._update(claimed.id, status=DONE, finished_at=datetime.utcnow(), last_error=None)
+
+    def retry(self, claimed, error, run_at):
+        with self._lock:
+            entry = self._jobs.get(claimed.id)
+            key = (entry['name'], entry['unique_key']) if entry is not None else None
+            superseded = key is not None and key[1] is not None and any(
+                other['status'] == QUEUED and (other['name'], other['unique_key']) == key
+                for other in self._jobs.values())
+        if superseded:
+            self._update(claimed.id, status=FAILED, finished_at=datetime.utcnow(),
+                         last_error=f'{error} (повтор заменён ждущей задачей)'[:1024])
+            return
+        self._update(claimed.id, status=QUEUED, run_at=run_at, last_error=error[:1024])
+
+    def fail(self, claimed, error):
+        self._update(claimed.id, status=FAILED, finished_at=datetime.utcnow(), last_error=error[:1024])
+
+    def purge(self, older_than):
+        with self._lock:
+            expired = [job_id for job_id, entry in self._jobs.items()
+                       if entry['status'] == DONE and entry['finished_at'] < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def stats(self, window):
+        now = datetime.utcnow()
+        since = now - timedelta(seconds=window)
+        with self._lock:
+            entries = list(self._jobs.values())
+        counts = {}
+        for entry in entries:
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        oldest = min((entry['run_at'] for entry in entries if entry['status'] == QUEUED and entry['run_at'] <= now),
+                     default=None)
+        finished = [(entry['run_at'], entry['started_at'], entry['finished_at']) for entry in entries
+                    if entry['status'] == DONE and entry['finished_at'] >= since]
+        return summarize(counts, oldest, finished, now, window)
+
+
+def get_jobs():
+    return current_app.extensions['jobs']
+
+
+def enqueue(name, delay=0, unique=False, **payload):
+    """
+    Ставит задачу в очередь в текущей транзакции: воркеры увидят её после коммита.
+    unique=True не ставит задачу, если задача с тем же именем уже ждёт выполнения;
+    строка вместо True — ключ уникальности внутри имени.
+    """
+    now = datetime.utcnow()
+    unique_key = ('' if unique is True else unique) if unique else None
+    get_jobs().enqueue({'name': name, 'unique_key': unique_key, 'payload': payload,
+                        'run_at': now + timedelta(seconds=delay), 'created_at': now,
+                        'max_attempts': current_app.config.get('JOBS_MAX_ATTEMPTS', 5)})
+
+
+class Worker:
+    """
+    Пул потоков, выполняющих задачи; каждый поток сам забирает следующую задачу
+    """
+
+    def __init__(self, app, concurrency=None):
+        config = app.config
+        self.app = app
+        self.queue = app.extensions['jobs']
+        self.concurrency = concurrency or config.get('JOBS_CONCURRENCY', 4)
+        self.poll_interval = config.get('JOBS_POLL_SECONDS', 1.0)
+        self.timeout = config.get('JOBS_TIMEOUT_SECONDS', 300)
+        self.backoff_base = config.get('JOBS_BACKOFF_SECONDS', 5)
+        self.backoff_cap = config.get('JOBS_BACKOFF_MAX_SECONDS', 600)
+        self.retention = timedelta(seconds=config.get('JOBS_RETENTION_SECONDS', 86400))
+        self.stopping = threading.Event()
+
+    def execute(self, claimed):
+        handler = HANDLERS.get(claimed.name)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f'Нет обработчика задачи {claimed.name}')
+            handler(**claimed.payload)
+        except Exception as e:
+            db.session.rollback()
+            error = f'{type(e).__name__}: {e}'
+            if claimed.attempts >= claimed.max_attempts:
+                self.queue.fail(claimed, error)
+                logger.error('Задача %s #%s не выполнена после %s попыток: %s',
+                             claimed.name, claimed.id, claimed.attempts, error)
+            else:
+                delay = backoff(claimed.attempts, self.backoff_base, self.backoff_cap)
+                self.queue.retry(claimed, error, datetime.utcnow() + timedelta(seconds=delay))
+                logger.warning('Задача %s #%s упала (попытка %s), повтор через %.1f с: %s',
+                               claimed.name, claimed.id, claimed.attempts, delay, error)
+            return False
+        self.queue.finish(claimed)
+        logger.info('Задача %s #%s выполнена за %.3f с', claimed.name, claimed.id, time.perf_counter() - started)
+        return True
+
+    def run_once(self):
+        """
+        Выполняет в текущем потоке все готовые задачи; возвращает их число
+        """
+        count = 0
+        with self.app.app_context():
+            while True:
+                claimed = self.queue.claim(1, self.timeout)
+                if not claimed:
+                    return count
+                self.execute(claimed[0])
+                count += 1
+
+    def _loop(self):
+        failures = 0
+        while not self.stopping.is_set():
+            with self.app.app_context():
+                try:
+                    claimed = self.queue.claim(1, self.timeout)
+                    if claimed:
+                        self.execute(claimed[0])
+                    failures = 0
+                except Exception:
+                    # Ошибка очереди (например, БД недоступна) не должна останавливать поток
+                    db.session.rollback()
+                    failures += 1
+                    delay = backoff(failures, self.poll_interval, self.backoff_cap)
+                    logger.exception('Ошибка воркера задач (%s подряд), повтор через %.1f с', failures, delay)
+                    self.stopping.wait(delay)
+                    continue
+            if not claimed:
+                self.stopping.wait(self.poll_interval)
+
+    def run(self):
+        """
+        Работает до stop() или Ctrl+C; раз в минуту удаляет старые выполненные задачи
+        """
+        threads = [threading.Thread(target=self._loop, name=f'jobs-{i}', daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self.stopping.wait(60):
+                with self.app.app_context():
+                    try:
+                        self.queue.purge(datetime.utcnow() - self.retention)
+                    except Exception:
+                        db.session.rollback()
+                        logger.exception('Не удалось удалить старые задачи')
+        except KeyboardInterrupt:
+            self.stopping.set()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        self.stopping.set()
+
+
+def prometheus(stats):
+    lines = ['# TYPE bookexchange_jobs gauge']
+    for status in (QUEUED, RUNNING, FAILED, DONE):
+        lines.append(f'bookexchange_jobs{{status="{status}"}} {stats[status]}')
+    lines.append('# TYPE bookexchange_job_oldest_queued_seconds gauge')
+    lines.append(f"bookexchange_job_oldest_queued_seconds {stats['oldest_queued_seconds']}")
+    lines.append('# TYPE bookexchange_job_latency_seconds gauge')
+    for kind in ('wait', 'run'):
+        for aggregate in ('avg', 'max'):
+            lines.append(f'bookexchange_job_latency_seconds{{kind="{kind}",aggregate="{aggregate}"}} '
+                         f'{stats[kind + "_seconds"][aggregate]}')
+    return '\n'.join(lines) + '\n'
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _push_pending(session):
+    pending = session.info.pop('jobs_pending', None)
+    if pending and has_app_context():
+        get_jobs().push(pending)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('jobs_pending', None)
+
+
+def init_jobs(app):
+    queue = MemoryQueue() if app.config.get('JOBS_BACKEND', 'database') == 'memory' else DatabaseQueue()
+    app.extensions['jobs'] = queue
+
+    @app.cli.command('jobs-worker')
+    @click.option('--concurrency', type=int, help='Число потоков (по умолчанию JOBS_CONCURRENCY)')
+    @click.option('--once', is_flag=True, help='Выполнить готовые задачи и выйти')
+    def jobs_worker_command(concurrency, once):
+        """Выполнять фоновые задачи из очереди."""
+        worker = Worker(app, concurrency)
+        if once:
+            click.echo(f'Выполнено задач: {worker.run_once()}')
+            return
+        click.echo(f'Воркер запущен: {worker.concurrency} потоков, очередь {queue.name}')
+        worker.run()
+
+    @app.cli.command('jobs-status')
+    def jobs_status_command():
+        """Показать глубину очереди и задержки задач."""
+        stats = queue.stats(app.config.get('JOBS_STATS_WINDOW_SECONDS', 300))
+        for name, value in stats.items():
+            click.echo(f'{name}: {value}')
+
+    return queue
@@ -0,0 +1,107 @@
+import atexit
+import json
+import logging
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request
+
+# Поля запроса, которые попадают в каждую JSON-строку лога
+CONTEXT_FIELDS = ('request_id', 'method', 'path', 'endpoint', 'status', 'duration_ms')
+
+_listener = None
+_queue_handler = None
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Добавляет к записи id запроса и endpoint; работает в потоке запроса,
+    пока контекст Flask ещё доступен
+    """
+    def filter(self, record):
+        if has_request_context():
+            if not hasattr(record, 'request_id'):
+                record.request_id = g.get('request_id')
+            if not hasattr(record, 'endpoint'):
+                record.endpoint = request.endpoint
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _build_handlers(app):
+    formatter = JsonFormatter() if app.config.get('LOG_JSON', True) else \
+        logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    handlers = [logging.StreamHandler()]
+    if app.config.get('LOG_FILE'):
+        handlers.append(RotatingFileHandler(
+            app.config['LOG_FILE'],
+            maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=app.config.get('LOG_BACKUP_COUNT', 5),
+            encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def init_logging(app):
+    """
+    Логи пишутся в очередь в потоке запроса, а в консоль и файл — фоновым QueueListener.
+    Настраивается один раз на процесс; повторный вызов только меняет уровень.
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        _queue_handler = QueueHandler(log_queue)
+        _queue_handler.addFilter(RequestContextFilter())
+        root.addHandler(_queue_handler)
+        _listener = QueueListener(log_queue, *_build_handlers(app), respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+
+    access_logger = logging.getLogger('app.access')
+
+    @app.before_request
+    def start_request_timer():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        started = g.get('request_started')
+        duration_ms = round((time.perf_counter() - started) * 1000, 2) if started else None
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        access_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': duration_ms,
+        })
+        return response
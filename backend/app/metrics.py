@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from .database import db
+
+# Границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Пары (верхняя граница, накопленное число наблюдений), последняя граница — +Inf
+        """
+        result, running = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = defaultdict(int)
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+
+class Metrics:
+    """
+    Метрики по endpoint-ам Flask: гистограмма задержек, ответы по статусам,
+    число и суммарное время SQL-запросов
+    """
+
+    def __init__(self):
+        self._endpoints = defaultdict(EndpointStats)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, seconds, sql_count, sql_seconds):
+        with self._lock:
+            stats = self._endpoints[endpoint]
+            stats.latency.observe(seconds)
+            stats.statuses[str(status)] += 1
+            stats.sql_count += sql_count
+            stats.sql_seconds += sql_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': stats.latency.count,
+                    'statuses': dict(stats.statuses),
+                    'latency_seconds_sum': round(stats.latency.total, 6),
+                    'latency_buckets': {
+                        ('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in stats.latency.cumulative()
+                    },
+                    'sql_statements': stats.sql_count,
+                    'sql_seconds_sum': round(stats.sql_seconds, 6),
+                } for endpoint, stats in self._endpoints.items()
+            }
+
+    def prometheus(self):
+        lines = [
+            '# TYPE bookexchange_request_duration_seconds histogram',
+            '# TYPE bookexchange_requests_total counter',
+            '# TYPE bookexchange_sql_statements_total counter',
+            '# TYPE bookexchange_sql_duration_seconds_total counter',
+        ]
+        with self._lock:
+            for endpoint, stats in sorted(self._endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                for bound, count in stats.latency.cumulative():
+                    le = '+Inf' if bound == float('inf') else str(bound)
+                    lines.append(f'bookexchange_request_duration_seconds_bucket{{{label},le="{le}"}} {count}')
+                lines.append(f'bookexchange_request_duration_seconds_sum{{{label}}} {stats.latency.total}')
+                lines.append(f'bookexchange_request_duration_seconds_count{{{label}}} {stats.latency.count}')
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'bookexchange_requests_total{{{label},status="{status}"}} {count}')
+                lines.append(f'bookexchange_sql_statements_total{{{label}}} {stats.sql_count}')
+                lines.append(f'bookexchange_sql_duration_seconds_total{{{label}}} {stats.sql_seconds}')
+        return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['metrics_query_started'].pop()
+    if has_request_context() and 'metrics_sql_count' in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_seconds += time.perf_counter() - started
+
+
+def _handle_error(context):
+    # Запрос завершился ошибкой и after_cursor_execute не будет вызван
+    started = context.connection.info.get('metrics_query_started') if context.connection else None
+    if started:
+        started.pop()
+
+
+def init_metrics(app):
+    """
+    При METRICS_ENABLED=False обработчики не регистрируются и накладных расходов нет
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        app.extensions['metrics'] = None
+        return None
+
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+
+    with app.app_context():
+        # Основная БД и реплики
+        for engine in [db.engine, *app.extensions.get('db_replicas', [])]:
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_seconds = 0.0
+
+    @app.teardown_request
+    def record_metrics(error=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        status = g.pop('metrics_status', 500 if error else 200)
+        metrics.record(request.endpoint or 'unknown', status, time.perf_counter() - started,
+                       g.pop('metrics_sql_count', 0), g.pop('metrics_sql_seconds', 0.0))
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    return metrics
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
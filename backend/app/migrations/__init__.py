@@ -0,0 +1,109 @@
+"""
+Версионные миграции схемы.
+
+Каждая миграция — модуль vNNNN_<название>.py в этом пакете с атрибутом description
+и функциями upgrade(connection) и downgrade(connection). Применённые версии хранятся
+в таблице schema_migrations. Миграции идемпотентны (checkfirst / IF NOT EXISTS),
+поэтому их можно применять и к базе, созданной db.create_all().
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+import click
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+
+MODULE_RE = re.compile(r'^v(\d{4})_\w+$')
+
+version_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(256)),
+    Column('applied_at', DateTime),
+)
+
+
+def discover():
+    """
+    Список (версия, модуль) всех миграций по возрастанию версии
+    """
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = MODULE_RE.match(module_info.name)
+        if match:
+            migrations.append((int(match.group(1)), importlib.import_module(f'{__name__}.{module_info.name}')))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+def applied_versions(connection):
+    version_metadata.create_all(connection, checkfirst=True)
+    return {row.version for row in connection.execute(select(schema_migrations.c.version))}
+
+
+def current_version(engine):
+    with engine.begin() as connection:
+        return max(applied_versions(connection), default=0)
+
+
+def upgrade(engine, target=None):
+    """
+    Применяет недостающие миграции до target включительно; каждая — в своей транзакции
+    """
+    applied = []
+    for version, module in discover():
+        if target is not None and version > target:
+            break
+        with engine.begin() as connection:
+            if version in applied_versions(connection):
+                continue
+            module.upgrade(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=module.description, applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+
+def downgrade(engine, target):
+    """
+    Откатывает применённые миграции с версией больше target, начиная с последней
+    """
+    reverted = []
+    for version, module in reversed(discover()):
+        if version <= target:
+            break
+        with engine.begin() as connection:
+            if version not in applied_versions(connection):
+                continue
+            module.downgrade(connection)
+            connection.execute(schema_migrations.delete().where(schema_migrations.c.version == version))
+        reverted.append(version)
+    return reverted
+
+
+def init_migrations(app, db):
+    @app.cli.group('schema')
+    def schema_command():
+        """Версионные миграции схемы БД."""
+
+    @schema_command.command('upgrade')
+    @click.option('--target', type=int, help='Версия, до которой применить миграции')
+    def upgrade_command(target):
+        for version in upgrade(db.engine, target):
+            click.echo(f'Применена миграция {version:04d}')
+        click.echo(f'Текущая версия схемы: {current_version(db.engine):04d}')
+
+    @schema_command.command('downgrade')
+    @click.option('--target', type=int, required=True, help='Версия, до которой откатить схему')
+    def downgrade_command(target):
+        for version in downgrade(db.engine, target):
+            click.echo(f'Откачена миграция {version:04d}')
+        click.echo(f'Текущая версия схемы: {current_version(db.engine):04d}')
+
+    @schema_command.command('status')
+    def status_command():
+        with db.engine.begin() as connection:
+            applied = applied_versions(connection)
+        for version, module in discover():
+            mark = 'x' if version in applied else ' '
+            click.echo(f'[{mark}] {version:04d} {module.description}')
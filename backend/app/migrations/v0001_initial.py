@@ -0,0 +1,53 @@
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table
+
+description = 'Исходная схема: user, book, review, deal'
+
+metadata = MetaData()
+
+Table(
+    'user', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(64), unique=True, nullable=False),
+    Column('email', String(64)),
+    Column('phone', String(16)),
+    Column('password_hash', String(128), nullable=False),
+    Column('is_admin', Boolean),
+)
+
+Table(
+    'book', metadata,
+    Column('book_id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id')),
+    Column('title', String(32), nullable=False),
+    Column('description', String(128)),
+    Column('is_available', Boolean),
+)
+
+Table(
+    'review', metadata,
+    Column('review_id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id')),
+    Column('book_id', Integer, ForeignKey('book.book_id')),
+    Column('review_text', String(512), nullable=False),
+)
+
+Table(
+    'deal', metadata,
+    Column('deal_id', Integer, primary_key=True),
+    Column('sender_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('recipient_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('sender_book_id', Integer, ForeignKey('book.book_id')),
+    Column('recipient_book_id', Integer, ForeignKey('book.book_id'), nullable=False),
+    Column('gift_flag', Boolean),
+    Column('status', String(32)),
+    Column('time', DateTime),
+    Column('place', String(128)),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    metadata.drop_all(connection, checkfirst=True)
@@ -0,0 +1,19 @@
+from sqlalchemy import BigInteger, Column, MetaData, String, Table
+
+description = 'Таблица stat_counter для счётчиков статистики и версий таблиц'
+
+metadata = MetaData()
+
+Table(
+    'stat_counter', metadata,
+    Column('name', String(64), primary_key=True),
+    Column('value', BigInteger, nullable=False),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    metadata.drop_all(connection, checkfirst=True)
@@ -0,0 +1,33 @@
+from sqlalchemy import Index, MetaData, Table
+
+description = 'Индексы под фильтры маршрутов книг, отзывов и сделок'
+
+# (таблица, имя индекса, колонки)
+INDEXES = [
+    ('book', 'ix_book_user_id', ('user_id', 'book_id')),
+    ('book', 'ix_book_is_available', ('is_available', 'book_id')),
+    ('review', 'ix_review_book_id', ('book_id', 'review_id')),
+    ('deal', 'ix_deal_sender_id', ('sender_id', 'deal_id')),
+    ('deal', 'ix_deal_recipient_id', ('recipient_id', 'deal_id')),
+    ('deal', 'ix_deal_status', ('status', 'deal_id')),
+]
+
+
+def _indexes(connection):
+    metadata = MetaData()
+    tables = {}
+    for table_name, index_name, columns in INDEXES:
+        if table_name not in tables:
+            tables[table_name] = Table(table_name, metadata, autoload_with=connection)
+        table = tables[table_name]
+        yield Index(index_name, *(table.c[column] for column in columns))
+
+
+def upgrade(connection):
+    for index in _indexes(connection):
+        index.create(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    for index in _indexes(connection):
+        index.drop(connection, checkfirst=True)
@@ -0,0 +1,28 @@
+from sqlalchemy import text
+from ..search import POSTGRES_DDL, SQLITE_DDL
+
+description = 'Индексы полнотекстового поиска книг (FTS5 в SQLite, pg_trgm и tsvector в Postgres)'
+
+
+def upgrade(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'book_fts'")).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not exists:
+            connection.execute(text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+def downgrade(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        for name in ('book_fts_ai', 'book_fts_ad', 'book_fts_au'):
+            connection.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        connection.execute(text('DROP TABLE IF EXISTS book_fts'))
+    elif dialect == 'postgresql':
+        connection.execute(text('DROP INDEX IF EXISTS ix_book_search_tsv'))
+        connection.execute(text('DROP INDEX IF EXISTS ix_book_title_trgm'))
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Float, Index, Integer, MetaData, Table
+
+description = 'Таблицы рекомендаций: book_interaction, book_similarity, user_recommendation'
+
+metadata = MetaData()
+
+Table(
+    'book_interaction', metadata,
+    Column('user_id', Integer, primary_key=True),
+    Column('book_id', Integer, primary_key=True),
+    Index('ix_book_interaction_book_id', 'book_id', 'user_id'),
+)
+
+Table(
+    'book_similarity', metadata,
+    Column('book_id', Integer, primary_key=True),
+    Column('similar_book_id', Integer, primary_key=True),
+    Column('score', Float, nullable=False),
+)
+
+Table(
+    'user_recommendation', metadata,
+    Column('user_id', Integer, primary_key=True),
+    Column('book_id', Integer, primary_key=True),
+    Column('score', Float, nullable=False),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    metadata.drop_all(connection, checkfirst=True)
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text
+
+description = 'Очередь фоновых задач: job'
+
+metadata = MetaData()
+
+Table(
+    'job', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(64), nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('status', String(16), nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('max_attempts', Integer, nullable=False),
+    Column('run_at', DateTime, nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Column('started_at', DateTime),
+    Column('finished_at', DateTime),
+    Column('last_error', String(1024)),
+    Index('ix_job_status_run_at', 'status', 'run_at', 'id'),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    metadata.drop_all(connection, checkfirst=True)
@@ -0,0 +1,29 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, String, Table
+
+description = 'Архив завершённых сделок: deal_archive'
+
+metadata = MetaData()
+
+Table(
+    'deal_archive', metadata,
+    Column('deal_id', Integer, primary_key=True, autoincrement=False),
+    Column('sender_id', Integer, nullable=False),
+    Column('recipient_id', Integer, nullable=False),
+    Column('sender_book_id', Integer),
+    Column('recipient_book_id', Integer, nullable=False),
+    Column('gift_flag', Boolean),
+    Column('status', String(32)),
+    Column('time', DateTime),
+    Column('place', String(128)),
+    Column('archived_at', DateTime, nullable=False),
+    Index('ix_deal_archive_sender_id', 'sender_id', 'deal_id'),
+    Index('ix_deal_archive_recipient_id', 'recipient_id', 'deal_id'),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    metadata.drop_all(connection, checkfirst=True)
@@ -0,0 +1,22 @@
+from sqlalchemy import text
+from ..search import SQLITE_TRIGRAM, SQLITE_TRIGRAM_DDL
+
+description = 'Триграммный индекс FTS5 по названию книг для фильтра title (SQLite)'
+
+
+def upgrade(connection):
+    if connection.dialect.name != 'sqlite' or not SQLITE_TRIGRAM:
+        return
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'book_title_trgm'")).first()
+    for statement in SQLITE_TRIGRAM_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text("INSERT INTO book_title_trgm(book_title_trgm) VALUES ('rebuild')"))
+
+
+def downgrade(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    for name in ('book_title_trgm_ai', 'book_title_trgm_ad', 'book_title_trgm_au'):
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+    connection.execute(text('DROP TABLE IF EXISTS book_title_trgm'))
@@ -0,0 +1,37 @@
+from sqlalchemy import Index, MetaData, Table, inspect, text
+from ..stats import DEALS_COMPLETED_SEQ
+
+description = 'Номер завершения сделки (completed_seq) для инкрементального пересчёта рекомендаций'
+
+TABLES = ('deal', 'deal_archive')
+
+
+def _index(connection, table_name):
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    return Index(f'ix_{table_name}_completed_seq', table.c.completed_seq)
+
+
+def upgrade(connection):
+    for table_name in TABLES:
+        columns = {column['name'] for column in inspect(connection).get_columns(table_name)}
+        if 'completed_seq' not in columns:
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN completed_seq INTEGER'))
+            # Уже завершённые сделки нумеруются по deal_id, счётчик продолжает с максимума
+            connection.execute(text(
+                f"UPDATE {table_name} SET completed_seq = deal_id WHERE status = 'Completed'"))
+        _index(connection, table_name).create(connection, checkfirst=True)
+    last = max(connection.execute(text(f'SELECT max(completed_seq) FROM {table_name}')).scalar() or 0
+               for table_name in TABLES)
+    parameters = {'name': DEALS_COMPLETED_SEQ, 'last': last}
+    current = connection.execute(text('SELECT value FROM stat_counter WHERE name = :name'), parameters).scalar()
+    if current is None:
+        connection.execute(text('INSERT INTO stat_counter (name, value) VALUES (:name, :last)'), parameters)
+    elif current < last:
+        connection.execute(text('UPDATE stat_counter SET value = :last WHERE name = :name'), parameters)
+
+
+def downgrade(connection):
+    for table_name in TABLES:
+        _index(connection, table_name).drop(connection, checkfirst=True)
+        connection.execute(text(f'ALTER TABLE {table_name} DROP COLUMN completed_seq'))
+    connection.execute(text('DELETE FROM stat_counter WHERE name = :name'), {'name': DEALS_COMPLETED_SEQ})
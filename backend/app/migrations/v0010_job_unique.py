@@ -0,0 +1,23 @@
+from sqlalchemy import Index, MetaData, Table, inspect, text
+
+description = 'Уникальные ждущие задачи: job.unique_key и частичный уникальный индекс'
+
+QUEUED = text("status = 'queued'")
+
+
+def _index(connection):
+    table = Table('job', MetaData(), autoload_with=connection)
+    return Index('ux_job_queued_unique', table.c.name, table.c.unique_key, unique=True,
+                 postgresql_where=QUEUED, sqlite_where=QUEUED)
+
+
+def upgrade(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('job')}
+    if 'unique_key' not in columns:
+        connection.execute(text('ALTER TABLE job ADD COLUMN unique_key VARCHAR(128)'))
+    _index(connection).create(connection, checkfirst=True)
+
+
+def downgrade(connection):
+    _index(connection).drop(connection, checkfirst=True)
+    connection.execute(text('ALTER TABLE job DROP COLUMN unique_key'))
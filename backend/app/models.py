@@ -1,5 +1,5 @@
 from .database import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from .hashing import get_hasher
 
 
 class User(db.Model):
@@ -28,14 +28,20 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # Хэширование выполняется в пуле процессов, см. app.hashing
+        self.password_hash = get_hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return get_hasher().check(self.password_hash, password)
 
 
 class Book(db.Model):
     __tablename__ = 'book'
+    # Индексы под фильтры маршрутов; создаются также миграцией v0003_query_indexes
+    __table_args__ = (
+        db.Index('ix_book_user_id', 'user_id', 'book_id'),
+        db.Index('ix_book_is_available', 'is_available', 'book_id'),
+    )
     book_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     title = db.Column(db.String(32), nullable=False)
@@ -56,6 +62,9 @@ class Book(db.Model):
 
 class Review(db.Model):
     __tablename__ = 'review'
+    __table_args__ = (
+        db.Index('ix_review_book_id', 'book_id', 'review_id'),
+    )
     review_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     book_id = db.Column(db.Integer, db.ForeignKey('book.book_id'))
@@ -67,6 +76,12 @@ class Deal(db.Model):
     Модель сделки
     """
     __tablename__ = 'deal'
+    __table_args__ = (
+        db.Index('ix_deal_sender_id', 'sender_id', 'deal_id'),
+        db.Index('ix_deal_recipient_id', 'recipient_id', 'deal_id'),
+        db.Index('ix_deal_status', 'status', 'deal_id'),
+        db.Index('ix_deal_completed_seq', 'completed_seq'),
+    )
     deal_id = db.Column(db.Integer, primary_key=True)
 
     # Участники
@@ -83,4 +98,98 @@ class Deal(db.Model):
 
     # Детали
     time = db.Column(db.DateTime)
-    place = db.Column(db.String(128))
\ No newline at end of file
+    place = db.Column(db.String(128))
+    # Номер завершения по порядку коммитов (app.deals.complete), для инкрементальных пересчётов
+    completed_seq = db.Column(db.Integer)
+
+
+class StatCounter(db.Model):
+    """
+    Счётчик статистики, поддерживаемый инкрементально
+    """
+    __tablename__ = 'stat_counter'
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class BookInteraction(db.Model):
+    """
+    Ячейка разреженной матрицы пользователь × книга: отзыв или книга, полученная в обмене.
+    Производные таблицы рекомендаций без внешних ключей, чтобы не мешать удалению книг.
+    """
+    __tablename__ = 'book_interaction'
+    __table_args__ = (
+        db.Index('ix_book_interaction_book_id', 'book_id', 'user_id'),
+    )
+    user_id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True)
+
+
+class BookSimilarity(db.Model):
+    """
+    Top-N похожих книг (косинусная мера по совместным взаимодействиям)
+    """
+    __tablename__ = 'book_similarity'
+    book_id = db.Column(db.Integer, primary_key=True)
+    similar_book_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class UserRecommendation(db.Model):
+    """
+    Top-N рекомендованных пользователю книг
+    """
+    __tablename__ = 'user_recommendation'
+    user_id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class Job(db.Model):
+    """
+    Фоновая задача (app.jobs): очередь в таблице переживает перезапуски процессов
+    """
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at', 'id'),
+        # Уникальные задачи (jobs.enqueue(unique=...)): одна ждущая задача на имя и ключ
+        db.Index('ux_job_queued_unique', 'name', 'unique_key', unique=True,
+                 postgresql_where=db.text("status = 'queued'"), sqlite_where=db.text("status = 'queued'")),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    unique_key = db.Column(db.String(128))  # NULL — задача не уникальна
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON аргументов обработчика
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+
+    # Время: готова к выполнению, поставлена, начата (последняя попытка), завершена
+    run_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(1024))
+
+
+class DealArchive(db.Model):
+    """
+    Старые завершённые сделки, перенесённые из deal (app.archive); deal_id сохраняется
+    """
+    __tablename__ = 'deal_archive'
+    __table_args__ = (
+        db.Index('ix_deal_archive_sender_id', 'sender_id', 'deal_id'),
+        db.Index('ix_deal_archive_recipient_id', 'recipient_id', 'deal_id'),
+        db.Index('ix_deal_archive_completed_seq', 'completed_seq'),
+    )
+    deal_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sender_id = db.Column(db.Integer, nullable=False)
+    recipient_id = db.Column(db.Integer, nullable=False)
+    sender_book_id = db.Column(db.Integer)
+    recipient_book_id = db.Column(db.Integer, nullable=False)
+    gift_flag = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(32))
+    time = db.Column(db.DateTime)
+    place = db.Column(db.String(128))
+    completed_seq = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,100 @@
+from urllib.parse import urlencode
+from flask import Response, current_app, request, stream_with_context
+
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def flag_arg(args, name):
+    """
+    Булев флаг из query string: включён только при 1/true/yes (без учёта регистра),
+    поэтому ?stream=0 и ?stream=false его выключают
+    """
+    return (args.get(name) or '').strip().lower() in TRUE_VALUES
+
+
+def page_limit(limit, config, unbounded=False):
+    """
+    Размер страницы: по умолчанию PAGE_SIZE_DEFAULT, не больше PAGE_SIZE_MAX.
+    None (без ограничения) — только при unbounded и без явного limit.
+    """
+    if limit is None:
+        return None if unbounded else config.get('PAGE_SIZE_DEFAULT', 50)
+    return max(1, min(limit, config.get('PAGE_SIZE_MAX', 100)))
+
+
+def page_args(args, config, stream=False):
+    """
+    (limit, after) из query string. Постраничная выдача включается явно: без limit и
+    after список отдаётся целиком, как раньше; с after без limit — страница по умолчанию.
+    Поток (stream) без limit не ограничивается.
+    """
+    after = args.get('after', type=int)
+    return page_limit(args.get('limit', type=int), config, unbounded=stream or after is None), after
+
+
+def parse_page_args(stream=False):
+    """
+    page_args для текущего запроса Flask
+    """
+    return page_args(request.args, current_app.config, stream)
+
+
+def keyset_filter(query, key_column, limit, after):
+    """
+    Накладывает keyset-условие (key > after), сортировку по ключу и limit.
+    """
+    query = query.order_by(key_column)
+    if after is not None:
+        query = query.filter(key_column > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def keyset_page(query, key_column, key_attr, limit, after):
+    """
+    Возвращает (строки страницы, курсор следующей страницы или None).
+    Берётся на одну строку больше limit, чтобы узнать, есть ли следующая страница.
+    """
+    rows = keyset_filter(query, key_column, limit + 1 if limit is not None else None, after).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], key_attr)
+    return rows, next_cursor
+
+
+def set_next_cursor(response, next_cursor, limit):
+    """
+    Курсор следующей страницы передаётся в заголовках, тело остаётся JSON-массивом.
+    """
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        args = request.args.to_dict()
+        args.update({'limit': limit, 'after': next_cursor})
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def stream_json_array(query, serialize, chunk_size=None):
+    """
+    Отдаёт результат запроса JSON-массивом по мере чтения строк из серверного курсора.
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config.get('STREAM_CHUNK_SIZE', 500)
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield '['
+        first = True
+        for row in query.yield_per(chunk_size):
+            if first:
+                first = False
+            else:
+                yield ','
+            yield dumps(serialize(row))
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
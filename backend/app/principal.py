@@ -0,0 +1,39 @@
+from collections import namedtuple
+from flask import current_app
+from .cache import LRUCache
+from .database import db
+from .models import User
+
+# Текущий пользователь запроса: только то, что нужно для проверок доступа
+Principal = namedtuple('Principal', ['id', 'username', 'is_admin'])
+
+
+def load_principal(user_id):
+    """
+    Principal из процессного кэша с коротким TTL или одним запросом к БД
+    """
+    principals = current_app.extensions['principals']
+    principal = principals.get(user_id)
+    if principal is None:
+        row = db.session.query(User.id, User.username, User.is_admin).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        principal = Principal(row.id, row.username, bool(row.is_admin))
+        principals.set(user_id, principal)
+    return principal
+
+
+def invalidate_principal(user_id):
+    current_app.extensions['principals'].delete(int(user_id))
+
+
+def init_principal(app, jwt):
+    app.extensions['principals'] = LRUCache(
+        app.config.get('PRINCIPAL_CACHE_MAX_ENTRIES', 10000),
+        app.config.get('PRINCIPAL_CACHE_TTL', 30))
+
+    # flask_jwt_extended вызывает загрузчик один раз за запрос и хранит результат
+    # в g, поэтому current_user внутри запроса не обращается к кэшу повторно
+    @jwt.user_lookup_loader
+    def user_lookup(jwt_header, jwt_data):
+        return load_principal(int(jwt_data[app.config.get('JWT_IDENTITY_CLAIM', 'sub')]))
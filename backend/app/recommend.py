@@ -0,0 +1,182 @@
+"""
+Рекомендации «читателям как вы».
+
+Сигнал — разреженная матрица пользователь × книга (book_interaction): отзывы и книги,
+полученные в завершённых обменах. Похожесть книг — косинусная мера по числу общих
+пользователей; co-occurrence считается в БД пакетами GROUP BY, а не парами в Python.
+Хранятся top-N похожих книг и top-N рекомендаций на пользователя.
+
+Инкрементальное обновление берёт только новые взаимодействия (отзывы и завершённые обмены
+после сохранённых водяных знаков) и пересчитывает строки книг
+затронутых пользователей и рекомендации этих пользователей. Полное обновление
+(--full) пересчитывает всё и убирает накопившуюся неточность.
+"""
+import heapq
+import math
+import click
+from flask import current_app
+from sqlalchemy import and_, func
+from sqlalchemy.orm import aliased
+from . import jobs, stats
+from .database import db
+from .models import Book, BookInteraction, BookSimilarity, Deal, DealArchive, Review, UserRecommendation
+
+REVIEW_WATERMARK = 'recommend:review_id'
+DEAL_WATERMARK = 'recommend:deal_seq'
+
+
+def _chunks(values, size):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _completed_deal_pairs(after=None, upto=None):
+    """
+    Пары (пользователь, полученная книга) по завершённым обменам, включая архив:
+    с номером завершения в (after, upto], без after — все
+    """
+    pairs = set()
+    for model in (Deal, DealArchive):
+        for user_column, book_column in ((model.sender_id, model.recipient_book_id),
+                                         (model.recipient_id, model.sender_book_id)):
+            rows = db.session.query(user_column, book_column) \
+                .filter(model.status == 'Completed', book_column.isnot(None))
+            if after is not None:
+                rows = rows.filter(model.completed_seq > after, model.completed_seq <= upto)
+            pairs.update((user_id, book_id) for user_id, book_id in rows)
+    return pairs
+
+
+def collect_interactions(batch_size, full=False):
+    """
+    Добавляет в матрицу новые взаимодействия; возвращает множество затронутых пользователей
+    """
+    watermarks = stats.read_values(REVIEW_WATERMARK, DEAL_WATERMARK, stats.DEALS_COMPLETED_SEQ)
+    reviews = db.session.query(Review.review_id, Review.user_id, Review.book_id) \
+        .filter(Review.review_id > watermarks.get(REVIEW_WATERMARK, 0)).all()
+    pairs = {(review.user_id, review.book_id) for review in reviews
+             if review.user_id is not None and review.book_id is not None}
+    # Номера завершений выдаются в порядке коммитов, поэтому все сделки с номером не больше
+    # закоммиченного значения счётчика уже видны; открытые сделки знак не держат
+    last_completed = watermarks.get(stats.DEALS_COMPLETED_SEQ, 0)
+    if full:
+        pairs |= _completed_deal_pairs()
+    else:
+        pairs |= _completed_deal_pairs(watermarks.get(DEAL_WATERMARK, 0), last_completed)
+
+    users = {user_id for user_id, _ in pairs}
+    for chunk in _chunks(users, batch_size):
+        existing = db.session.query(BookInteraction.user_id, BookInteraction.book_id) \
+            .filter(BookInteraction.user_id.in_(chunk))
+        pairs -= set(existing)
+    for chunk in _chunks(pairs, batch_size):
+        db.session.execute(BookInteraction.__table__.insert(),
+                           [{'user_id': user_id, 'book_id': book_id} for user_id, book_id in chunk])
+    if reviews:
+        stats.set_value(REVIEW_WATERMARK, max(review.review_id for review in reviews))
+    stats.set_value(DEAL_WATERMARK, last_completed)
+    return {user_id for user_id, _ in pairs}
+
+
+def _degrees(book_ids, batch_size):
+    degrees = {}
+    for chunk in _chunks(book_ids, batch_size):
+        degrees.update(db.session.query(BookInteraction.book_id, func.count())
+                       .filter(BookInteraction.book_id.in_(chunk)).group_by(BookInteraction.book_id))
+    return degrees
+
+
+def refresh_books(book_ids, top_n, batch_size):
+    """
+    Пересчитывает top-N похожих книг для book_ids пакетами по batch_size
+    """
+    first, second = aliased(BookInteraction), aliased(BookInteraction)
+    for chunk in _chunks(book_ids, batch_size):
+        cooccurrence = db.session.query(first.book_id, second.book_id, func.count()) \
+            .join(second, and_(second.user_id == first.user_id, second.book_id != first.book_id)) \
+            .filter(first.book_id.in_(chunk)) \
+            .group_by(first.book_id, second.book_id).all()
+        degrees = _degrees({book_id for row in cooccurrence for book_id in row[:2]}, batch_size)
+
+        candidates = {book_id: [] for book_id in chunk}
+        for book_id, other_id, count in cooccurrence:
+            candidates[book_id].append((count / math.sqrt(degrees[book_id] * degrees[other_id]), other_id))
+
+        BookSimilarity.query.filter(BookSimilarity.book_id.in_(chunk)).delete(synchronize_session=False)
+        rows = [
+            {'book_id': book_id, 'similar_book_id': other_id, 'score': score}
+            for book_id, scored in candidates.items()
+            for score, other_id in heapq.nlargest(top_n, scored)
+        ]
+        if rows:
+            db.session.execute(BookSimilarity.__table__.insert(), rows)
+
+
+def refresh_users(user_ids, top_n, batch_size):
+    """
+    Рекомендации пользователя: сумма похожестей его книг на книгу-кандидата;
+    уже прочитанные и собственные книги не рекомендуются
+    """
+    for chunk in _chunks(user_ids, batch_size):
+        seen = set(db.session.query(BookInteraction.user_id, BookInteraction.book_id)
+                   .filter(BookInteraction.user_id.in_(chunk)))
+        seen.update(db.session.query(Book.user_id, Book.book_id).filter(Book.user_id.in_(chunk)))
+        scores = db.session.query(BookInteraction.user_id, BookSimilarity.similar_book_id,
+                                  func.sum(BookSimilarity.score)) \
+            .join(BookSimilarity, BookSimilarity.book_id == BookInteraction.book_id) \
+            .filter(BookInteraction.user_id.in_(chunk)) \
+            .group_by(BookInteraction.user_id, BookSimilarity.similar_book_id)
+
+        candidates = {user_id: [] for user_id in chunk}
+        for user_id, book_id, score in scores:
+            if (user_id, book_id) not in seen:
+                candidates[user_id].append((score, book_id))
+
+        UserRecommendation.query.filter(UserRecommendation.user_id.in_(chunk)).delete(synchronize_session=False)
+        rows = [
+            {'user_id': user_id, 'book_id': book_id, 'score': score}
+            for user_id, scored in candidates.items()
+            for score, book_id in heapq.nlargest(top_n, scored)
+        ]
+        if rows:
+            db.session.execute(UserRecommendation.__table__.insert(), rows)
+
+
+def refresh(full=False, top_n=20, batch_size=500):
+    """
+    Обновляет матрицу и сохранённые рекомендации; возвращает число затронутых строк
+    """
+    if full:
+        for model in (BookInteraction, BookSimilarity, UserRecommendation):
+            model.query.delete(synchronize_session=False)
+        stats.set_value(REVIEW_WATERMARK, 0)
+    # При полном обновлении матрица пуста, и затронуты все пользователи
+    users = collect_interactions(batch_size, full)
+
+    books = set()
+    for chunk in _chunks(users, batch_size):
+        books.update(book_id for book_id, in db.session.query(BookInteraction.book_id)
+                     .filter(BookInteraction.user_id.in_(chunk)))
+    refresh_books(books, top_n, batch_size)
+    refresh_users(users, top_n, batch_size)
+    db.session.commit()
+    return {'users': len(users), 'books': len(books)}
+
+
+@jobs.job('recommend_refresh')
+def refresh_job():
+    """
+    Фоновое обновление после завершённых сделок: новые пары обменов попадают в матрицу
+    """
+    config = current_app.config
+    refresh(top_n=config.get('RECOMMEND_TOP_N', 20), batch_size=config.get('RECOMMEND_BATCH_SIZE', 500))
+
+
+def init_recommendations(app):
+    @app.cli.command('recommend-refresh')
+    @click.option('--full', is_flag=True, help='Пересчитать всё с нуля')
+    def recommend_refresh_command(full):
+        """Обновить рекомендации по новым отзывам и завершённым обменам."""
+        result = refresh(full, app.config.get('RECOMMEND_TOP_N', 20), app.config.get('RECOMMEND_BATCH_SIZE', 500))
+        click.echo(f"Пользователей: {result['users']}, книг: {result['books']}")
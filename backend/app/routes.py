@@ -1,22 +1,27 @@
 import logging
-from flask import request, jsonify
-from .models import Book, User, Review, Deal
-from .database import db
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token
-from flasgger import swag_from
+from flask import Response, abort, current_app, request, jsonify, stream_with_context
+from .models import Book, BookSimilarity, User, Review, Deal, UserRecommendation
+from .database import db, read_only
+from flask_jwt_extended import JWTManager, jwt_required, current_user, create_access_token
+from .apidocs import swag_from
 from datetime import datetime
+from .search import get_search
+from . import archive, batch, bulk, deals, events, export, jobs, stats
+from .etag import conditional, touch
+from .principal import invalidate_principal
+from .metrics import get_metrics
+from .exchange import get_exchange, valid_cycles
+from .cache import cached, book_key, book_reviews_key, get_cache, invalidate_book
+from .pagination import flag_arg, page_limit, parse_page_args, keyset_filter, keyset_page, set_next_cursor, stream_json_array
+from .serialize import BOOK, REVIEW, DEAL, deal_contact_ids, deal_dicts
 
-logging.basicConfig(
-    level=logging.DEBUG,  # Уровень логов (DEBUG для максимальной детализации)
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Вывод логов в консоль (stdout)
-        logging.FileHandler('app.log')  # Сохранение логов в файл
-    ]
-)
+# Обработчики логов настраиваются в app.log.init_logging
 logger = logging.getLogger(__name__)
 
 
+book_to_dict = BOOK.to_dict
+
+
 def init_routes(app):
     # === AUTHENTICATION ===
 
@@ -115,32 +120,88 @@ def init_routes(app):
                 'type': 'boolean',
                 'required': False,
                 'description': 'Фильтр по доступности книги'
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Размер страницы; курсор следующей страницы возвращается в заголовке X-Next-Cursor'
+            },
+            {
+                'name': 'after',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Курсор: вернуть книги с ID больше указанного'
+            },
+            {
+                'name': 'stream',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Потоковая выдача результата по мере чтения из БД'
             }
         ],
         'responses': {
-            '200': {'description': 'Список книг'}
+            '200': {'description': 'Список книг'},
+            '304': {'description': 'Данные не изменились'}
         }
     })
+    @read_only
+    @conditional('book')
     def get_books():
         title_filter = request.args.get('title', '')
         is_available = request.args.get('is_available', type=bool)
+        stream = flag_arg(request.args, 'stream')
+        limit, after = parse_page_args(stream)
 
-        query = Book.query
+        query = BOOK.query()
         if title_filter:
-            query = query.filter(Book.title.ilike(f'%{title_filter}%'))
+            query = get_search().filter_title(query, title_filter)
         if is_available is not None:
             query = query.filter(Book.is_available == is_available)
 
-        books = query.all()
-        return jsonify([
+        if stream:
+            return stream_json_array(keyset_filter(query, Book.book_id, limit, after), BOOK.to_dict)
+
+        books, next_cursor = keyset_page(query, Book.book_id, 'book_id', limit, after)
+        response = jsonify(BOOK.dicts(books))
+        return set_next_cursor(response, next_cursor, limit)
+
+    @app.route('/api/books/search', methods=['GET'])
+    @swag_from({
+        'tags': ['Books'],
+        'summary': 'Полнотекстовый поиск по названию и описанию книг',
+        'parameters': [
             {
-                'id': book.book_id,
-                'title': book.title,
-                'description': book.description,
-                'is_available': book.is_available,
-                'user_id': book.user_id
-            } for book in books
-        ])
+                'name': 'q',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': 'Поисковый запрос; слова ищутся по префиксу'
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Максимальное число результатов'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Книги, упорядоченные по релевантности'},
+            '304': {'description': 'Данные не изменились'}
+        }
+    })
+    @read_only
+    @conditional('book')
+    def search_books():
+        query_text = request.args.get('q', '')
+        # Поиск всегда ограничен: без limit — страница по умолчанию
+        limit = page_limit(request.args.get('limit', type=int), current_app.config)
+        results = get_search().ranked(query_text, limit)
+        return jsonify([dict(book_to_dict(book), rank=rank) for book, rank in results])
 
     @app.route('/api/books', methods=['POST'])
     @jwt_required()
@@ -169,7 +230,7 @@ def init_routes(app):
         }
     })
     def create_book():
-        user_id = get_jwt_identity()
+        user_id = current_user.id
         data = request.get_json()
         new_book = Book(
             title=data.get('title'),
@@ -178,9 +239,75 @@ def init_routes(app):
             is_available=True
         )
         db.session.add(new_book)
+        stats.record_book_created()
+        touch('book')
         db.session.commit()
         return jsonify({'message': 'Книга добавлена'}), 201
 
+    @app.route('/api/books/batch', methods=['POST'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Books'],
+        'summary': 'Массовый импорт книг (JSON-массив или NDJSON)',
+        'security': [{'Bearer': []}],
+        'consumes': ['application/json', 'application/x-ndjson'],
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'title': {'type': 'string'},
+                            'description': {'type': 'string'},
+                            'is_available': {'type': 'boolean'}
+                        },
+                        'required': ['title']
+                    }
+                }
+            },
+            {
+                'name': 'atomic',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Не вставлять ничего, если хотя бы одна строка с ошибкой'
+            }
+        ],
+        'responses': {
+            '201': {'description': 'Книги добавлены; ошибки перечислены по номерам строк'},
+            '400': {'description': 'Ни одна строка не прошла проверку'},
+            '413': {'description': 'Слишком много строк в одном запросе'}
+        }
+    })
+    def import_books():
+        user_id = current_user.id
+        atomic = flag_arg(request.args, 'atomic')
+        try:
+            inserted, errors = bulk.import_books(
+                bulk.iter_rows(request, current_app.config.get('BATCH_MAX_ROWS', 10000)),
+                user_id,
+                chunk_size=current_app.config.get('BATCH_CHUNK_SIZE', 1000),
+                atomic=atomic)
+        except bulk.BatchTooLarge:
+            db.session.rollback()
+            return jsonify({'message': 'Слишком много строк в одном запросе'}), 413
+        except ValueError as error:
+            db.session.rollback()
+            return jsonify({'message': str(error)}), 400
+
+        if not inserted:
+            db.session.rollback()
+            return jsonify({'message': 'Книги не добавлены', 'inserted': 0, 'errors': errors}), 400
+
+        stats.record_book_created(inserted)
+        touch('book')
+        db.session.commit()
+        return jsonify({'message': 'Книги добавлены', 'inserted': inserted, 'errors': errors}), 201
+
     @app.route('/api/books/<int:book_id>', methods=['GET'])
     @swag_from({
         'tags': ['Books'],
@@ -195,18 +322,21 @@ def init_routes(app):
         ],
         'responses': {
             '200': {'description': 'Информация о книге'},
+            '304': {'description': 'Данные не изменились'},
             '404': {'description': 'Книга не найдена'}
         }
     })
+    @read_only
+    @conditional('book')
     def get_book(book_id):
-        book = Book.query.get_or_404(book_id)
-        return jsonify({
-            'id': book.book_id,
-            'title': book.title,
-            'description': book.description,
-            'is_available': book.is_available,
-            'user_id': book.user_id
-        })
+        def load():
+            book = BOOK.query().filter(Book.book_id == book_id).first()
+            return BOOK.to_dict(book) if book else None
+
+        data = cached(book_key(book_id), load)
+        if data is None:
+            abort(404)
+        return jsonify(data)
 
     @app.route('/api/books/<int:book_id>', methods=['PUT'])
     @jwt_required()
@@ -241,7 +371,7 @@ def init_routes(app):
         }
     })
     def update_book(book_id):
-        user_id = get_jwt_identity()
+        user_id = current_user.id
         book = Book.query.get_or_404(book_id)
         if book.user_id != user_id:
             return jsonify({'message': 'Доступ запрещен'}), 403
@@ -250,7 +380,9 @@ def init_routes(app):
         book.title = data.get('title', book.title)
         book.description = data.get('description', book.description)
         book.is_available = data.get('is_available', book.is_available)
+        touch('book')
         db.session.commit()
+        invalidate_book(book_id)
         return jsonify({'message': 'Книга обновлена'})
 
     @app.route('/api/books/<int:book_id>', methods=['DELETE'])
@@ -273,13 +405,17 @@ def init_routes(app):
         }
     })
     def delete_book(book_id):
-        user_id = get_jwt_identity()
+        user_id = current_user.id
         book = Book.query.get_or_404(book_id)
         if book.user_id != user_id:
             return jsonify({'message': 'Доступ запрещен'}), 403
 
         db.session.delete(book)
+        stats.record_book_deleted()
+        # Отзывы удалённой книги теряют book_id
+        touch('book', 'review')
         db.session.commit()
+        invalidate_book(book_id, reviews=True)
         return jsonify({'message': 'Книга удалена'})
 
     # === REVIEWS ===
@@ -310,7 +446,7 @@ def init_routes(app):
         }
     })
     def create_review():
-        user_id = get_jwt_identity()
+        user_id = current_user.id
         data = request.get_json()
         new_review = Review(
             user_id=user_id,
@@ -318,7 +454,9 @@ def init_routes(app):
             review_text=data.get('review_text')
         )
         db.session.add(new_review)
+        touch('review')
         db.session.commit()
+        get_cache().delete(book_reviews_key(new_review.book_id))
         return jsonify({'message': 'Отзыв добавлен'}), 201
 
     @app.route('/api/books/<int:book_id>/reviews', methods=['GET'])
@@ -334,19 +472,51 @@ def init_routes(app):
             }
         ],
         'responses': {
-            '200': {'description': 'Список отзывов'}
+            '200': {'description': 'Список отзывов'},
+            '304': {'description': 'Данные не изменились'}
         }
     })
+    @read_only
+    @conditional('review')
     def get_reviews(book_id):
-        reviews = Review.query.filter_by(book_id=book_id).all()
-        return jsonify([
+        def load():
+            return REVIEW.dicts(REVIEW.query().filter(Review.book_id == book_id))
+
+        return jsonify(cached(book_reviews_key(book_id), load))
+
+    @app.route('/api/books/<int:book_id>/similar', methods=['GET'])
+    @swag_from({
+        'tags': ['Books'],
+        'summary': 'Похожие книги: их читали и получали в обменах те же пользователи',
+        'parameters': [
             {
-                'review_id': review.review_id,
-                'user_id': review.user_id,
-                'book_id': review.book_id,
-                'review_text': review.review_text
-            } for review in reviews
-        ])
+                'name': 'book_id',
+                'in': 'path',
+                'type': 'integer',
+                'required': True
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Максимальное число книг'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Книги по убыванию похожести (поле score)'},
+            '404': {'description': 'Книга не найдена'}
+        }
+    })
+    @read_only
+    def get_similar_books(book_id):
+        Book.query.get_or_404(book_id)
+        limit = max(1, min(request.args.get('limit', 10, type=int), current_app.config.get('PAGE_SIZE_MAX', 100)))
+        rows = db.session.query(Book, BookSimilarity.score) \
+            .join(BookSimilarity, BookSimilarity.similar_book_id == Book.book_id) \
+            .filter(BookSimilarity.book_id == book_id) \
+            .order_by(BookSimilarity.score.desc(), Book.book_id).limit(limit)
+        return jsonify([dict(book_to_dict(book), score=round(score, 4)) for book, score in rows])
 
     # === DEALS ===
 
@@ -377,7 +547,7 @@ def init_routes(app):
         }
     })
     def create_deal():
-        user_id = get_jwt_identity()
+        user_id = current_user.id
         data = request.get_json()
         new_deal = Deal(
             sender_id=user_id,
@@ -388,6 +558,7 @@ def init_routes(app):
             status='Created'
         )
         db.session.add(new_deal)
+        stats.record_deal_created(new_deal)
         db.session.commit()
         return jsonify({'message': 'Запрос на обмен создан'}), 201
 
@@ -419,20 +590,21 @@ def init_routes(app):
         ],
         'responses': {
             '200': {'description': 'Запрос принят'},
-            '403': {'description': 'Доступ запрещен'}
+            '403': {'description': 'Доступ запрещен'},
+            '409': {'description': 'Сделка или книга уже изменена другим запросом'}
         }
     })
     def accept_deal(deal_id):
-        user_id = get_jwt_identity()
-        deal = Deal.query.get_or_404(deal_id)
-        if int(deal.recipient_id) != int(user_id):
+        user_id = current_user.id
+        deal = deals.load(deal_id)
+        if deal.recipient_id != user_id:
             return jsonify({'message': 'Доступ запрещен'}), 403
 
         data = request.get_json()
-        deal.sender_book_id = data.get('sender_book_id')
-        deal.gift_flag = data.get('gift_flag')
-        deal.status = 'Agreed'
-        db.session.commit()
+        try:
+            deals.accept(deal, data.get('sender_book_id'), data.get('gift_flag'))
+        except deals.DealConflict as e:
+            return jsonify({'message': str(e)}), 409
         return jsonify({'message': 'Запрос принят'})
 
     @app.route('/api/deals/<int:deal_id>/complete', methods=['PUT'])
@@ -451,23 +623,22 @@ def init_routes(app):
         ],
         'responses': {
             '200': {'description': 'Обмен завершен'},
-            '403': {'description': 'Доступ запрещен'}
+            '403': {'description': 'Доступ запрещен'},
+            '409': {'description': 'Сделка или книга уже изменена другим запросом'}
         }
     })
     def complete_deal(deal_id):
-        user_id = get_jwt_identity()
-        deal = Deal.query.get_or_404(deal_id)
+        user_id = current_user.id
+        deal = deals.load(deal_id)
         if deal.sender_id != user_id and deal.recipient_id != user_id:
             return jsonify({'message': 'Доступ запрещен'}), 403
 
-        deal.status = 'Completed'
-        # Обновляем доступность книг
-        if deal.sender_book_id:
-            sender_book = Book.query.get(deal.sender_book_id)
-            sender_book.is_available = False
-        recipient_book = Book.query.get(deal.recipient_book_id)
-        recipient_book.is_available = False
-        db.session.commit()
+        try:
+            book_ids = deals.complete(deal)
+        except deals.DealConflict as e:
+            return jsonify({'message': str(e)}), 409
+        for book_id in book_ids:
+            invalidate_book(book_id)
         return jsonify({'message': 'Обмен завершен'})
 
     @app.route('/api/deals/<int:deal_id>', methods=['DELETE'])
@@ -487,19 +658,22 @@ def init_routes(app):
         'responses': {
             '200': {'description': 'Сделка отменена'},
             '403': {'description': 'Доступ запрещен'},
-            '404': {'description': 'Сделка не найдена'}
+            '404': {'description': 'Сделка не найдена'},
+            '409': {'description': 'Сделка уже изменена другим запросом'}
         }
     })
     def cancel_deal(deal_id):
-        user_id = get_jwt_identity()
-        deal = Deal.query.get_or_404(deal_id)
-        if deal.sender_id != int(user_id) and deal.recipient_id != int(user_id):
+        user_id = current_user.id
+        deal = deals.load(deal_id)
+        if deal.sender_id != user_id and deal.recipient_id != user_id:
             return jsonify({'message': 'Доступ запрещен'}), 403
-        if deal.status != 'Created':
+        if deal.status != deals.CREATED:
             return jsonify({'message': 'Можно отменить только сделку в статусе Created'}), 400
 
-        db.session.delete(deal)
-        db.session.commit()
+        try:
+            deals.cancel(deal)
+        except deals.DealConflict as e:
+            return jsonify({'message': str(e)}), 409
         return jsonify({'message': 'Сделка отменена'})
 
     @app.route('/api/deals', methods=['GET'])
@@ -515,6 +689,34 @@ def init_routes(app):
                 'type': 'integer',
                 'required': True,
                 'description': 'ID пользователя для фильтрации сделок'
+            },
+            {
+                'name': 'status',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'Фильтр по статусу сделки (Created/Agreed/Completed)'
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Размер страницы; курсор следующей страницы возвращается в заголовке X-Next-Cursor'
+            },
+            {
+                'name': 'after',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Курсор: вернуть сделки с ID больше указанного'
+            },
+            {
+                'name': 'include_archived',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Включить старые завершённые сделки из архива'
             }
         ],
         'responses': {
@@ -522,31 +724,143 @@ def init_routes(app):
             '403': {'description': 'Доступ запрещен'}
         }
     })
+    @read_only
     def get_user_deals():
-        user_id = get_jwt_identity()
+        user_id = current_user.id
         requested_user_id = request.args.get('user_id', type=int)
-        if int(user_id) != requested_user_id:
+        if user_id != requested_user_id:
             return jsonify({'message': 'Доступ запрещен'}), 403
 
-        deals = Deal.query.filter(
-            (Deal.sender_id == requested_user_id) | (Deal.recipient_id == requested_user_id)).all()
+        status = request.args.get('status')
+        limit, after = parse_page_args()
+
+        criteria = [lambda model: (model.sender_id == requested_user_id) | (model.recipient_id == requested_user_id)]
+        if status:
+            criteria.append(lambda model: model.status == status)
+        if flag_arg(request.args, 'include_archived'):
+            query, key_column = archive.with_archived(DEAL, *criteria)
+        else:
+            query, key_column = DEAL.query().filter(*(criterion(Deal) for criterion in criteria)), Deal.deal_id
+        rows, next_cursor = keyset_page(query, key_column, 'deal_id', limit, after)
+
+        # Контакты участников загружаются одним запросом, а не по два на каждую сделку
+        contact_ids = deal_contact_ids(rows)
+        contacts = {}
+        if contact_ids:
+            contacts = {
+                user.id: user.email or user.phone
+                for user in db.session.query(User.id, User.email, User.phone).filter(User.id.in_(contact_ids))
+            }
+
+        response = jsonify(deal_dicts(rows, contacts))
+        return set_next_cursor(response, next_cursor, limit)
+
+    @app.route('/api/deals/cycles', methods=['GET'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Deals'],
+        'summary': 'Найти многосторонние обмены с участием текущего пользователя',
+        'security': [{'Bearer': []}],
+        'parameters': [
+            {
+                'name': 'max_length',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Максимальное число участников обмена (от 2)'
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Максимальное число предложенных обменов'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Циклы обмена: в каждой сделке sender получает книгу book_id от recipient'}
+        }
+    })
+    def get_exchange_cycles():
+        max_length_limit = current_app.config.get('EXCHANGE_MAX_CYCLE_LENGTH', 5)
+        max_length = max(2, min(request.args.get('max_length', max_length_limit, type=int), max_length_limit))
+        limit = max(1, min(request.args.get('limit', 20, type=int), current_app.config.get('PAGE_SIZE_MAX', 100)))
+
+        cycles = get_exchange().cycles(current_user.id, max_length, limit,
+                                       current_app.config.get('EXCHANGE_SEARCH_BUDGET', 100000))
         return jsonify([
             {
-                'deal_id': deal.deal_id,
-                'sender_id': deal.sender_id,
-                'recipient_id': deal.recipient_id,
-                'recipient_book_id': deal.recipient_book_id,
-                'sender_book_id': deal.sender_book_id,
-                'place': deal.place,
-                'status': deal.status,
-                'gift_flag': deal.gift_flag,
-                'sender_contact': User.query.get(deal.sender_id).email or User.query.get(
-                    deal.sender_id).phone if deal.status == 'Agreed' else None,
-                'recipient_contact': User.query.get(deal.recipient_id).email or User.query.get(
-                    deal.recipient_id).phone if deal.status == 'Agreed' else None
-            } for deal in deals
+                'length': len(cycle),
+                'deals': [
+                    {'deal_id': deal_id, 'sender_id': sender_id, 'recipient_id': recipient_id, 'book_id': book_id}
+                    for deal_id, sender_id, recipient_id, book_id in cycle
+                ]
+            } for cycle in valid_cycles(cycles)
         ])
 
+    @app.route('/api/deals/events', methods=['GET'])
+    @jwt_required(locations=['headers', 'query_string'])
+    @swag_from({
+        'tags': ['Deals'],
+        'summary': 'Поток событий по сделкам текущего пользователя (Server-Sent Events)',
+        'security': [{'Bearer': []}],
+        'produces': ['text/event-stream'],
+        'parameters': [
+            {
+                'name': 'jwt',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'Access-токен, если клиент (EventSource) не может передать заголовок Authorization'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'События deal: deal_id, status (Created/Agreed/Completed/Cancelled), участники и книги'}
+        }
+    })
+    def deal_events():
+        return events.stream_response(current_user.id)
+
+    # === USERS ===
+
+    @app.route('/api/users/<int:user_id>/recommendations', methods=['GET'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Users'],
+        'summary': 'Рекомендованные книги: их выбирали читатели с похожими интересами',
+        'security': [{'Bearer': []}],
+        'parameters': [
+            {
+                'name': 'user_id',
+                'in': 'path',
+                'type': 'integer',
+                'required': True
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Максимальное число книг'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Книги по убыванию оценки (поле score)'},
+            '403': {'description': 'Доступ запрещен'}
+        }
+    })
+    @read_only
+    def get_user_recommendations(user_id):
+        if current_user.id != user_id and not current_user.is_admin:
+            return jsonify({'message': 'Доступ запрещен'}), 403
+
+        limit = max(1, min(request.args.get('limit', 10, type=int), current_app.config.get('PAGE_SIZE_MAX', 100)))
+        rows = db.session.query(Book, UserRecommendation.score) \
+            .join(UserRecommendation, UserRecommendation.book_id == Book.book_id) \
+            .filter(UserRecommendation.user_id == user_id) \
+            .order_by(UserRecommendation.score.desc(), Book.book_id).limit(limit)
+        return jsonify([dict(book_to_dict(book), score=round(score, 4)) for book, score in rows])
+
     # === ADMIN ===
 
     @app.route('/api/admin/stats', methods=['GET'])
@@ -556,25 +870,140 @@ def init_routes(app):
         'summary': 'Получить статистику (для админов)',
         'security': [{'Bearer': []}],
         'responses': {
-            '200': {'description': 'Статистика'},
+            '200': {'description': 'Статистика: итоги, сделки по статусам и по дням'},
             '403': {'description': 'Доступ запрещен'}
         }
     })
+    @read_only
     def admin_stats():
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if not user.is_admin:
+        if not current_user.is_admin:
+            return jsonify({'message': 'Доступ запрещен'}), 403
+
+        # Счётчики поддерживаются инкрементально, полный COUNT(*) не нужен
+        return jsonify(stats.stats_summary(stats.read_counters()))
+
+    @app.route('/api/admin/cache', methods=['GET'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Счётчики кэша: попадания, промахи, вытеснения (для админов)',
+        'security': [{'Bearer': []}],
+        'responses': {
+            '200': {'description': 'Статистика кэша'},
+            '403': {'description': 'Доступ запрещен'}
+        }
+    })
+    def admin_cache_stats():
+        if not current_user.is_admin:
+            return jsonify({'message': 'Доступ запрещен'}), 403
+
+        return jsonify(get_cache().stats())
+
+    @app.route('/api/admin/jobs', methods=['GET'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Очередь фоновых задач: глубина по статусам и задержки (для админов)',
+        'security': [{'Bearer': []}],
+        'responses': {
+            '200': {'description': 'Статистика очереди'},
+            '403': {'description': 'Доступ запрещен'}
+        }
+    })
+    def admin_jobs():
+        if not current_user.is_admin:
+            return jsonify({'message': 'Доступ запрещен'}), 403
+
+        return jsonify(jobs.get_jobs().stats(app.config.get('JOBS_STATS_WINDOW_SECONDS', 300)))
+
+    @app.route('/api/admin/metrics', methods=['GET'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Метрики по endpoint-ам: задержки, статусы, SQL-запросы (для админов)',
+        'security': [{'Bearer': []}],
+        'parameters': [
+            {
+                'name': 'format',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'json (по умолчанию) или prometheus'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Метрики'},
+            '403': {'description': 'Доступ запрещен'},
+            '404': {'description': 'Сбор метрик выключен'}
+        }
+    })
+    def admin_metrics():
+        if not current_user.is_admin:
             return jsonify({'message': 'Доступ запрещен'}), 403
 
-        total_books = Book.query.count()
-        total_deals = Deal.query.count()
-        completed_deals = Deal.query.filter_by(status='Completed').count()
+        metrics = get_metrics()
+        if metrics is None:
+            return jsonify({'message': 'Сбор метрик выключен'}), 404
+        if request.args.get('format') == 'prometheus':
+            queue = jobs.get_jobs().stats(app.config.get('JOBS_STATS_WINDOW_SECONDS', 300))
+            return Response(metrics.prometheus() + jobs.prometheus(queue), mimetype='text/plain; version=0.0.4')
+        return jsonify(metrics.snapshot())
 
-        return jsonify({
-            'total_books': total_books,
-            'total_deals': total_deals,
-            'completed_deals': completed_deals
-        })
+    @app.route('/api/admin/export/<resource>', methods=['GET'])
+    @jwt_required()
+    @swag_from({
+        'tags': ['Admin'],
+        'summary': 'Потоковая выгрузка книг, сделок или отзывов в NDJSON/CSV (для админов)',
+        'security': [{'Bearer': []}],
+        'parameters': [
+            {
+                'name': 'resource',
+                'in': 'path',
+                'type': 'string',
+                'required': True,
+                'description': 'books, deals или reviews'
+            },
+            {
+                'name': 'format',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'ndjson (по умолчанию) или csv'
+            },
+            {
+                'name': 'since',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Выгрузить только строки с ID больше указанного'
+            },
+            {
+                'name': 'gzip',
+                'in': 'query',
+                'type': 'boolean',
+                'required': False,
+                'description': 'Сжать выгрузку gzip'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Файл выгрузки'},
+            '400': {'description': 'Неизвестный ресурс, формат или since'},
+            '403': {'description': 'Доступ запрещен'}
+        }
+    })
+    @read_only
+    def admin_export(resource):
+        if not current_user.is_admin:
+            return jsonify({'message': 'Доступ запрещен'}), 403
+
+        try:
+            chunks, mimetype, filename = export.open_export(
+                resource, request.args.get('format', 'ndjson'), request.args.get('since'),
+                flag_arg(request.args, 'gzip'))
+        except export.ExportInvalid as e:
+            return jsonify({'message': str(e)}), 400
+        return Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
 
     @app.route('/api/admin/promote/<int:user_id>', methods=['PUT'])
     @jwt_required()
@@ -597,12 +1026,58 @@ def init_routes(app):
         }
     })
     def promote_user(user_id):
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        if not current_user or not current_user.is_admin:
+        if not current_user.is_admin:
             return jsonify({'message': 'Доступ запрещен'}), 403
 
         user = User.query.get_or_404(user_id)
         user.is_admin = True
         db.session.commit()
+        invalidate_principal(user_id)
         return jsonify({'message': 'Роль админа назначена'})
+
+    # === BATCH ===
+
+    @app.route('/api/batch', methods=['POST'])
+    @jwt_required(optional=True)
+    @swag_from({
+        'tags': ['Batch'],
+        'summary': 'Выполнить несколько запросов к API за один вызов',
+        'security': [{'Bearer': []}],
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'requests': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'method': {'type': 'string'},
+                                    'path': {'type': 'string'},
+                                    'body': {'type': 'object'},
+                                    'headers': {'type': 'object'}
+                                },
+                                'required': ['path']
+                            }
+                        },
+                        'parallel': {'type': 'boolean'}
+                    },
+                    'required': ['requests']
+                }
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Ответы подзапросов в том же порядке: status, headers, body'},
+            '400': {'description': 'Некорректный пакет'}
+        }
+    })
+    def run_batch():
+        try:
+            items, parallel = batch.parse(request.get_json(silent=True), current_app.config.get('BATCH_MAX_REQUESTS', 20))
+        except batch.BatchInvalid as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify(batch.run(app, items, parallel))
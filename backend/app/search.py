@@ -0,0 +1,176 @@
+import re
+import sqlite3
+from flask import current_app
+from sqlalchemy import DDL, event, func, literal_column, text
+from .database import db
+from .models import Book
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# SQLite: FTS5-индекс с внешним содержимым (таблица book) и триггеры синхронизации
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+    "title, description, content='book', content_rowid='book_id')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title, description) VALUES (new.book_id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, description) "
+    "VALUES ('delete', old.book_id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, description ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title, description) "
+    "VALUES ('delete', old.book_id, old.title, old.description); "
+    "INSERT INTO book_fts(rowid, title, description) VALUES (new.book_id, new.title, new.description); END",
+]
+
+# SQLite: триграммный FTS5-индекс по названию для фильтра title — совпадение по подстроке,
+# как у ILIKE '%...%' в Postgres. Токенизатор trigram есть в SQLite начиная с 3.34
+SQLITE_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+SQLITE_TRIGRAM_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_title_trgm USING fts5("
+    "title, content='book', content_rowid='book_id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS book_title_trgm_ai AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_title_trgm(rowid, title) VALUES (new.book_id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS book_title_trgm_ad AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_title_trgm(book_title_trgm, rowid, title) VALUES ('delete', old.book_id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS book_title_trgm_au AFTER UPDATE OF title ON book BEGIN "
+    "INSERT INTO book_title_trgm(book_title_trgm, rowid, title) VALUES ('delete', old.book_id, old.title); "
+    "INSERT INTO book_title_trgm(rowid, title) VALUES (new.book_id, new.title); END",
+]
+# Триграммный индекс находит только подстроки от трёх символов
+TRIGRAM_MIN_LENGTH = 3
+
+# Postgres: trigram-индекс ускоряет ILIKE '%...%', tsvector-индекс — ранжированный поиск
+POSTGRES_TSVECTOR = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))"
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_book_title_trgm ON book USING gin (title gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_book_search_tsv ON book USING gin (({POSTGRES_TSVECTOR}))",
+]
+
+for _statement in SQLITE_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+if SQLITE_TRIGRAM:
+    for _statement in SQLITE_TRIGRAM_DDL:
+        event.listen(Book.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS book_fts').execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS book_title_trgm').execute_if(dialect='sqlite'))
+for _statement in POSTGRES_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+
+def tokenize(query_text):
+    return TOKEN_RE.findall(query_text or '')
+
+
+class LikeSearch:
+    """
+    Исходный путь: ILIKE по названию, без индекса и без ранжирования
+    """
+    name = 'like'
+
+    def filter_title(self, query, title):
+        return query.filter(Book.title.ilike(f'%{title}%'))
+
+    def ranked(self, query_text, limit):
+        pattern = f'%{query_text}%'
+        books = Book.query.filter(Book.title.ilike(pattern) | Book.description.ilike(pattern)) \
+            .order_by(Book.book_id).limit(limit).all()
+        return [(book, 0.0) for book in books]
+
+
+class SqliteFtsSearch(LikeSearch):
+    """
+    Поиск через FTS5. Фильтр title ищет подстроку по триграммному индексу (как ILIKE);
+    ранжированный поиск — префиксное совпадение по словам, ранжирование bm25
+    """
+    name = 'sqlite_fts5'
+
+    @staticmethod
+    def match_expression(tokens):
+        return ' AND '.join(f'"{token}"*' for token in tokens)
+
+    def install(self):
+        for table, statements in (('book_fts', SQLITE_DDL),
+                                  ('book_title_trgm', SQLITE_TRIGRAM_DDL if SQLITE_TRIGRAM else [])):
+            if not statements:
+                continue
+            exists = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': table}).first()
+            for statement in statements:
+                db.session.execute(text(statement))
+            if not exists:
+                db.session.execute(text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+        db.session.commit()
+
+    def filter_title(self, query, title):
+        if not SQLITE_TRIGRAM or len(title) < TRIGRAM_MIN_LENGTH:
+            return super().filter_title(query, title)
+        # Строка целиком — фраза из триграмм, то есть подстрока названия без учёта регистра
+        phrase = '"' + title.replace('"', '""') + '"'
+        matched = text("SELECT rowid FROM book_title_trgm WHERE book_title_trgm MATCH :match") \
+            .bindparams(match=phrase)
+        return query.filter(Book.book_id.in_(matched))
+
+    def ranked(self, query_text, limit):
+        tokens = tokenize(query_text)
+        if not tokens:
+            return []
+        rows = db.session.execute(
+            text("SELECT rowid, bm25(book_fts) AS rank FROM book_fts WHERE book_fts MATCH :match "
+                 "ORDER BY rank LIMIT :limit"),
+            {'match': self.match_expression(tokens), 'limit': limit}).all()
+        books = {book.book_id: book for book in Book.query.filter(Book.book_id.in_([row.rowid for row in rows]))}
+        # bm25 отрицателен: чем меньше, тем релевантнее
+        return [(books[row.rowid], -row.rank) for row in rows if row.rowid in books]
+
+
+class PostgresSearch(LikeSearch):
+    """
+    Поиск в Postgres: ILIKE по названию обслуживается trigram-индексом,
+    ранжированный поиск — через tsvector с префиксным tsquery
+    """
+    name = 'postgres'
+
+    def install(self):
+        for statement in POSTGRES_DDL:
+            db.session.execute(text(statement))
+        db.session.commit()
+
+    def ranked(self, query_text, limit):
+        tokens = tokenize(query_text)
+        if not tokens:
+            return []
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in tokens))
+        document = literal_column(POSTGRES_TSVECTOR)
+        rank = func.ts_rank(document, tsquery).label('rank')
+        rows = db.session.query(Book, rank) \
+            .filter(document.op('@@')(tsquery)) \
+            .order_by(rank.desc(), Book.book_id).limit(limit).all()
+        return [(book, float(book_rank)) for book, book_rank in rows]
+
+
+BACKENDS = {
+    'like': LikeSearch,
+    'sqlite': SqliteFtsSearch,
+    'postgresql': PostgresSearch,
+}
+
+
+def init_search(app, install=True):
+    """
+    Выбирает бэкенд поиска по диалекту БД (или по SEARCH_BACKEND) и создаёт индексы.
+    При install=False индексы не создаются: их создаёт миграция 0004.
+    """
+    backend_name = app.config.get('SEARCH_BACKEND', 'auto')
+    if backend_name == 'auto':
+        backend_name = db.engine.dialect.name
+    backend = BACKENDS.get(backend_name, LikeSearch)()
+    if install and hasattr(backend, 'install'):
+        backend.install()
+    app.extensions['search'] = backend
+    return backend
+
+
+def get_search():
+    return current_app.extensions.get('search') or LikeSearch()
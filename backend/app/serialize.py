@@ -0,0 +1,110 @@
+"""
+Сериализация ответов API.
+
+Списки выбираются только нужными столбцами (лёгкие Row-кортежи без identity map и
+инструментированных атрибутов) и превращаются в словари по заранее описанным полям
+ресурса. JSON кодируется orjson, если он установлен; иначе — стандартным json Flask.
+"""
+import operator
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+from .database import db
+from .models import Book, Deal, Review
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+
+class Resource:
+    """
+    Поля ответа одного ресурса: ключ JSON -> столбец модели
+    """
+
+    def __init__(self, **fields):
+        self.keys = tuple(fields)
+        self.columns = tuple(fields.values())
+        self._values = operator.attrgetter(*(column.key for column in self.columns))
+
+    def query(self):
+        """
+        ORM-запрос только по столбцам ресурса; строки — кортежи в порядке keys
+        """
+        return db.session.query(*self.columns)
+
+    def select(self):
+        return select(*self.columns)
+
+    def to_dict(self, obj):
+        """
+        ORM-объект или строка с одноимёнными атрибутами
+        """
+        return dict(zip(self.keys, self._values(obj)))
+
+    def dicts(self, rows):
+        """
+        Строки из query()/select(): значения уже стоят в порядке keys
+        """
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+
+BOOK = Resource(id=Book.book_id, title=Book.title, description=Book.description,
+                is_available=Book.is_available, user_id=Book.user_id)
+
+REVIEW = Resource(review_id=Review.review_id, user_id=Review.user_id, book_id=Review.book_id,
+                  review_text=Review.review_text)
+
+DEAL = Resource(deal_id=Deal.deal_id, sender_id=Deal.sender_id, recipient_id=Deal.recipient_id,
+                recipient_book_id=Deal.recipient_book_id, sender_book_id=Deal.sender_book_id,
+                place=Deal.place, status=Deal.status, gift_flag=Deal.gift_flag)
+
+
+def deal_contact_ids(rows):
+    """
+    Участники согласованных сделок: только им показываются контакты друг друга
+    """
+    return {user_id for deal in rows if deal.status == 'Agreed' for user_id in (deal.sender_id, deal.recipient_id)}
+
+
+def deal_dicts(rows, contacts):
+    items = DEAL.dicts(rows)
+    for item in items:
+        agreed = item['status'] == 'Agreed'
+        item['sender_contact'] = contacts.get(item['sender_id']) if agreed else None
+        item['recipient_contact'] = contacts.get(item['recipient_id']) if agreed else None
+    return items
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON-провайдер Flask на orjson; без orjson ведёт себя как стандартный.
+    Даты по-прежнему кодируются через default Flask (HTTP-формат).
+    """
+
+    def _options(self, kwargs):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('cls'):
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=self._options(kwargs)).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default,
+                            option=self._options({'indent': indent}) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_serialization(app):
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,144 @@
+import click
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from .database import db
+from .models import Book, Deal, DealArchive, StatCounter
+
+BOOKS_TOTAL = 'books_total'
+DEALS_TOTAL = 'deals_total'
+DEALS_STATUS_PREFIX = 'deals_status:'
+DEALS_DAY_PREFIX = 'deals_day:'
+# Последний номер завершения сделки (Deal.completed_seq); не статистика, при пересчёте не удаляется
+DEALS_COMPLETED_SEQ = 'deals_completed_seq'
+
+
+def _upsert(name, value, increment=True):
+    """
+    Атомарно прибавляет value к счётчику (или записывает его) в текущей транзакции сессии
+    """
+    new_value = StatCounter.value + value if increment else value
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = insert(StatCounter).values(name=name, value=value)
+        statement = statement.on_conflict_do_update(
+            index_elements=[StatCounter.name],
+            set_={'value': new_value})
+        db.session.execute(statement)
+        return
+
+    updated = db.session.execute(
+        StatCounter.__table__.update()
+        .where(StatCounter.name == name)
+        .values(value=new_value))
+    if updated.rowcount == 0:
+        db.session.add(StatCounter(name=name, value=value))
+
+
+def increment(*names, delta=1):
+    for name in names:
+        _upsert(name, delta)
+
+
+def set_value(name, value):
+    _upsert(name, value, increment=False)
+
+
+def read_values(*names):
+    return dict(db.session.query(StatCounter.name, StatCounter.value).filter(StatCounter.name.in_(names)).all())
+
+
+def record_book_created(count=1):
+    increment(BOOKS_TOTAL, delta=count)
+
+
+def record_book_deleted():
+    increment(BOOKS_TOTAL, delta=-1)
+
+
+def _deal_day(deal):
+    return DEALS_DAY_PREFIX + (deal.time.date().isoformat() if deal.time else 'unknown')
+
+
+def record_deal_created(deal):
+    increment(DEALS_TOTAL, DEALS_STATUS_PREFIX + deal.status, _deal_day(deal))
+
+
+def record_deal_status_changed(old_status, new_status):
+    if old_status == new_status:
+        return
+    increment(DEALS_STATUS_PREFIX + old_status, delta=-1)
+    increment(DEALS_STATUS_PREFIX + new_status)
+
+
+def record_deal_deleted(deal):
+    increment(DEALS_TOTAL, DEALS_STATUS_PREFIX + deal.status, _deal_day(deal), delta=-1)
+
+
+def read_counters():
+    """
+    Все счётчики одним запросом по маленькой таблице
+    """
+    return {counter.name: counter.value for counter in StatCounter.query.all()}
+
+
+def rebuild_counters():
+    """
+    Пересчитывает все счётчики с нуля по таблицам book, deal и deal_archive
+    """
+    counters = {
+        BOOKS_TOTAL: db.session.query(func.count(Book.book_id)).scalar(),
+        DEALS_TOTAL: 0,
+    }
+    # Перенесённые в архив сделки по-прежнему учитываются в статистике
+    for model in (Deal, DealArchive):
+        counters[DEALS_TOTAL] += db.session.query(func.count(model.deal_id)).scalar()
+        for status, count in db.session.query(model.status, func.count(model.deal_id)).group_by(model.status):
+            key = DEALS_STATUS_PREFIX + str(status)
+            counters[key] = counters.get(key, 0) + count
+        day = func.date(model.time)
+        for deal_day, count in db.session.query(day, func.count(model.deal_id)).group_by(day):
+            key = DEALS_DAY_PREFIX + (deal_day.isoformat() if hasattr(deal_day, 'isoformat') else (deal_day or 'unknown'))
+            counters[key] = counters.get(key, 0) + count
+
+    # Удаляются только счётчики статистики; версии таблиц (app.etag) должны только расти
+    StatCounter.query.filter(or_(
+        StatCounter.name.in_([BOOKS_TOTAL, DEALS_TOTAL]),
+        StatCounter.name.startswith(DEALS_STATUS_PREFIX),
+        StatCounter.name.startswith(DEALS_DAY_PREFIX),
+    )).delete(synchronize_session=False)
+    db.session.add_all(StatCounter(name=name, value=value) for name, value in counters.items())
+    db.session.commit()
+    return counters
+
+
+def stats_summary(counters):
+    return {
+        'total_books': counters.get(BOOKS_TOTAL, 0),
+        'total_deals': counters.get(DEALS_TOTAL, 0),
+        'completed_deals': counters.get(DEALS_STATUS_PREFIX + 'Completed', 0),
+        'deals_by_status': {
+            name[len(DEALS_STATUS_PREFIX):]: value
+            for name, value in counters.items() if name.startswith(DEALS_STATUS_PREFIX) and value
+        },
+        'deals_by_day': {
+            name[len(DEALS_DAY_PREFIX):]: value
+            for name, value in sorted(counters.items()) if name.startswith(DEALS_DAY_PREFIX) and value
+        },
+    }
+
+
+def init_stats(app, reconcile=True):
+    """
+    Регистрирует CLI-команду пересчёта; если счётчиков ещё нет и reconcile=True,
+    пересчитывает их сразу
+    """
+    @app.cli.command('reconcile-stats')
+    def reconcile_stats_command():
+        """Пересчитать счётчики статистики по данным БД."""
+        counters = rebuild_counters()
+        for name, value in sorted(counters.items()):
+            click.echo(f'{name}: {value}')
+
+    if reconcile and db.session.get(StatCounter, BOOKS_TOTAL) is None:
+        rebuild_counters()
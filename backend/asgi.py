@@ -0,0 +1,5 @@
+from app import create_app
+from app.asgi import AsgiApp
+
+# uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+app = AsgiApp(create_app())
@@ -0,0 +1,116 @@
+"""
+Нагрузочный бенчмарк основных маршрутов API на детерминированно заполненной БД.
+
+    cd backend && python -m benchmarks.bench_api --books 5000 --deals 5000 --mode http \\
+        --save-baseline benchmarks/baselines/http.json
+    cd backend && python -m benchmarks.bench_api --mode http --compare benchmarks/baselines/http.json
+
+При --compare сравнивает с сохранённым прогоном и завершается с кодом 1,
+если p95 вырос или пропускная способность упала больше чем на --tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+from app.database import db
+from app.models import Book
+from . import loadgen
+from .seed import make_bench_app, seed_dataset
+
+
+def login(client, username):
+    response = client.post('/api/login', json={'username': username, 'password': 'password123'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def build_scenarios(app, user_ids):
+    client = app.test_client()
+    with app.app_context():
+        book_id = db.session.query(db.func.min(Book.book_id)).scalar()
+    admin, user = login(client, 'user0'), login(client, 'user1')
+    return {
+        'books_page': ('GET', '/api/books?limit=50', None),
+        'books_title': ('GET', '/api/books?title=мир&limit=50', None),
+        'books_search': ('GET', '/api/books/search?q=river', None),
+        'book': ('GET', f'/api/books/{book_id}', None),
+        'book_reviews': ('GET', f'/api/books/{book_id}/reviews', None),
+        'deals': ('GET', f'/api/deals?user_id={user_ids[1]}&limit=50', user),
+        'admin_stats': ('GET', '/api/admin/stats', admin),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if result['p95'] > previous['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95']} -> {result['p95']} ms")
+        if result['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {result['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', help='по умолчанию SQLite во временном файле')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--deals', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--requests', type=int, default=500, help='запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--only', nargs='+', help='запустить только указанные сценарии')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    app = make_bench_app(args.database_uri, LOG_LEVEL='WARNING', PASSWORD_HASH_WORKERS=0)
+    with app.app_context():
+        user_ids = seed_dataset(args.users, args.books, args.reviews, args.deals, seed=args.seed)
+    scenarios = build_scenarios(app, user_ids)
+    if args.only:
+        scenarios = {name: scenarios[name] for name in args.only}
+
+    results = {}
+    print(f'mode={args.mode} concurrency={args.concurrency} requests={args.requests} '
+          f'users={args.users} books={args.books} reviews={args.reviews} deals={args.deals}')
+    print(f'{"scenario":<16}{"req/sec":>10}{"p50, ms":>10}{"p95, ms":>10}{"p99, ms":>10}{"errors":>8}')
+    with loadgen.serve(app) if args.mode == 'http' else _null() as base_url:
+        for name, (method, path, headers) in scenarios.items():
+            if args.mode == 'http':
+                result = loadgen.run_http(base_url, method, path, args.requests, args.concurrency, headers)
+            else:
+                result = loadgen.run_client(app, method, path, args.requests, args.concurrency, headers)
+            results[name] = result
+            print(f'{name:<16}{result["rps"]:>10.1f}{result["p50"]:>10.2f}{result["p95"]:>10.2f}'
+                  f'{result["p99"]:>10.2f}{result["errors"]:>8}')
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or '.', exist_ok=True)
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+class _null:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+GET /api/deals по мере роста истории: одна БД хранит все завершённые сделки в deal,
+другая после каждого шага переносит старые в deal_archive (app.archive). Задержка
+первой страницы сделок пользователя должна расти только в первой.
+
+    cd backend && python -m benchmarks.bench_archive --steps 4 --history 20000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from app import archive
+from app.database import db
+from app.models import Book, Deal
+from . import loadgen
+from .seed import _insert_chunked, make_bench_app, seed_dataset
+from .bench_api import login
+
+
+def add_history(count, user_ids, book_ids, share, seed):
+    """
+    Старые завершённые сделки; доля share из них — с участием пользователя user_ids[1]
+    """
+    rng = random.Random(seed)
+    started = datetime.utcnow() - timedelta(days=365)
+
+    def make_deal(i):
+        sender = user_ids[1] if rng.random() < share else rng.choice(user_ids)
+        return {
+            'sender_id': sender,
+            'recipient_id': rng.choice(user_ids),
+            'recipient_book_id': rng.choice(book_ids),
+            'sender_book_id': rng.choice(book_ids),
+            'gift_flag': False,
+            'status': 'Completed',
+            'time': started + timedelta(seconds=i),
+            'place': 'архив',
+        }
+
+    _insert_chunked(Deal.__table__, count, make_deal, 5000)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', type=int, default=4)
+    parser.add_argument('--history', type=int, default=20000, help='завершённых сделок на шаг')
+    parser.add_argument('--share', type=float, default=0.2, help='доля истории с участием пользователя')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    apps = {}
+    for name in ('hot', 'archived'):
+        app = make_bench_app(LOG_LEVEL='WARNING', PASSWORD_HASH_WORKERS=0, CACHE_BACKEND='none')
+        with app.app_context():
+            user_ids = seed_dataset(100, 2000, 0, 2000)
+            book_ids = [book_id for book_id, in db.session.query(Book.book_id)]
+        apps[name] = (app, login(app.test_client(), 'user1'))
+
+    path = f'/api/deals?user_id={user_ids[1]}&limit=20'
+    print(f'history/step={args.history} share={args.share} requests={args.requests}')
+    print(f'{"history":>9}{"hot p50":>10}{"hot p95":>10}{"arch p50":>10}{"arch p95":>10}{"+arch p95":>11}')
+    for step in range(args.steps + 1):
+        results = {}
+        for name, (app, headers) in apps.items():
+            if step:
+                with app.app_context():
+                    add_history(args.history, user_ids, book_ids, args.share, seed=step)
+                    if name == 'archived':
+                        archive.archive_deals(90, app.config['DEAL_ARCHIVE_BATCH_SIZE'])
+            results[name] = loadgen.run_client(app, 'GET', path, args.requests, args.concurrency, headers)
+        app, headers = apps['archived']
+        with_history = loadgen.run_client(app, 'GET', path + '&include_archived=1', args.requests,
+                                          args.concurrency, headers)
+        hot, archived = results['hot'], results['archived']
+        print(f'{step * args.history:>9}{hot["p50"]:>10.2f}{hot["p95"]:>10.2f}'
+              f'{archived["p50"]:>10.2f}{archived["p95"]:>10.2f}{with_history["p95"]:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+WSGI (многопоточный сервер werkzeug) против ASGI (uvicorn, app.asgi) на одной
+и той же заполненной БД: req/sec и перцентили задержек по HTTP при росте числа клиентов.
+
+    cd backend && python -m benchmarks.bench_asgi --requests 1000 --concurrency 8 64 256
+"""
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+from app.asgi import AsgiApp
+from . import loadgen
+from .bench_api import login
+from .seed import make_bench_app, seed_dataset
+
+
+@contextmanager
+def serve_asgi(app, host='127.0.0.1'):
+    """
+    uvicorn в фоновом потоке; возвращает базовый URL
+    """
+    import uvicorn
+
+    config = uvicorn.Config(app, host=host, port=0, log_level='warning', lifespan='on')
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f'http://{host}:{port}'
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', help='по умолчанию SQLite во временном файле')
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--deals', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 64, 256])
+    args = parser.parse_args()
+
+    app = make_bench_app(args.database_uri, LOG_LEVEL='WARNING', PASSWORD_HASH_WORKERS=0)
+    with app.app_context():
+        user_ids = seed_dataset(100, args.books, args.books, args.deals)
+    user = login(app.test_client(), 'user1')
+    scenarios = {
+        'books_page': ('/api/books?limit=50', None),
+        'book': ('/api/books/1', None),
+        'deals': (f'/api/deals?user_id={user_ids[1]}&limit=50', user),
+    }
+
+    print(f'requests={args.requests} books={args.books} deals={args.deals}')
+    print(f'{"server":<8}{"scenario":<12}{"clients":>8}{"req/sec":>10}{"p50, ms":>10}'
+          f'{"p99, ms":>10}{"errors":>8}')
+    for server_name, server in (('wsgi', loadgen.serve(app)), ('asgi', serve_asgi(AsgiApp(app)))):
+        with server as base_url:
+            for name, (path, headers) in scenarios.items():
+                for concurrency in args.concurrency:
+                    result = loadgen.run_http(base_url, 'GET', path, args.requests, concurrency, headers)
+                    print(f'{server_name:<8}{name:<12}{concurrency:>8}{result["rps"]:>10.1f}'
+                          f'{result["p50"]:>10.2f}{result["p99"]:>10.2f}{result["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Поиск циклов обмена на синтетическом графе: время построения, задержка поиска
+циклов по длине и скорость инкрементальных обновлений.
+
+    cd backend && python -m benchmarks.bench_exchange --deals 100000 --users 20000 --max-length 2 3 4 5
+    cd backend && python -m benchmarks.bench_exchange --deals 100000 --db   # построение из SQLite
+"""
+import argparse
+import random
+import time
+from app.exchange import ExchangeGraph, _load_graph
+from .loadgen import percentile
+from .seed import make_bench_app, seed_dataset
+
+
+def synthetic(users, books_per_user, deals, seed):
+    """
+    Книги распределены по пользователям поровну, каждая сделка — случайный пользователь
+    хочет случайную чужую книгу
+    """
+    rng = random.Random(seed)
+    books = [(user_id * books_per_user + i, user_id) for user_id in range(users) for i in range(books_per_user)]
+    rows = []
+    for deal_id in range(deals):
+        book_id, owner_id = rng.choice(books)
+        sender_id = rng.randrange(users)
+        if sender_id != owner_id:
+            rows.append((deal_id, sender_id, owner_id, book_id))
+    return rows, books
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--deals', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--books-per-user', type=int, default=3)
+    parser.add_argument('--max-length', type=int, nargs='+', default=[2, 3, 4, 5])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', action='store_true', help='строить граф из БД, заполненной seed_dataset')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    graph = ExchangeGraph()
+    started = time.perf_counter()
+    if args.db:
+        app = make_bench_app(LOG_LEVEL='WARNING', PASSWORD_HASH_WORKERS=0)
+        with app.app_context():
+            seed_dataset(args.users, args.users * args.books_per_user, 0, args.deals, seed=args.seed)
+            started = time.perf_counter()
+            _load_graph(graph)
+    else:
+        deals, books = synthetic(args.users, args.books_per_user, args.deals, args.seed)
+        graph.load(deals, books)
+    print(f'users={args.users} deals={args.deals} open_deals={len(graph.deals)} '
+          f'build={(time.perf_counter() - started) * 1000:.1f} ms')
+
+    users = list(graph.edges)
+    print(f'{"max_length":<12}{"p50, ms":>10}{"p99, ms":>10}{"cycles/query":>14}')
+    for max_length in args.max_length:
+        latencies, total = [], 0
+        for _ in range(args.queries):
+            user_id = rng.choice(users)
+            query_started = time.perf_counter()
+            total += len(graph.cycles(user_id, max_length, limit=20))
+            latencies.append((time.perf_counter() - query_started) * 1000)
+        print(f'{max_length:<12}{percentile(latencies, 0.5):>10.3f}{percentile(latencies, 0.99):>10.3f}'
+              f'{total / args.queries:>14.2f}')
+
+    deal_ids = list(graph.deals)
+    next_deal_id = max(deal_ids) + 1
+    started = time.perf_counter()
+    for i in range(args.updates):
+        # Сделка закрывается, и такая же открывается заново под новым id
+        index = i % len(deal_ids)
+        sender_id, recipient_id, book_id = graph.deals[deal_ids[index]]
+        graph.remove_deal(deal_ids[index])
+        deal_ids[index] = next_deal_id + i
+        graph.set_deal(deal_ids[index], sender_id, recipient_id, book_id)
+    elapsed = time.perf_counter() - started
+    print(f'updates: {args.updates * 2 / elapsed:.0f} ops/sec')
+
+
+if __name__ == '__main__':
+    main()
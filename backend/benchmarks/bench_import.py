@@ -0,0 +1,45 @@
+"""
+Скорость добавления книг: по одной через POST /api/books и пачками через POST /api/books/batch.
+
+    cd backend && python -m benchmarks.bench_import --books 5000
+"""
+import argparse
+import random
+import time
+from .seed import auth_headers, make_bench_app, random_text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    books = [{'title': random_text(rng, 2)[:32], 'description': random_text(rng, 8)[:128]}
+             for _ in range(args.books)]
+
+    app = make_bench_app(args.database_uri)
+    client = app.test_client()
+    headers = auth_headers(client)
+
+    started = time.perf_counter()
+    for book in books:
+        client.post('/api/books', json=book, headers=headers)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for start in range(0, len(books), args.batch_size):
+        response = client.post('/api/books/batch', json=books[start:start + args.batch_size], headers=headers)
+        assert response.status_code == 201, response.get_json()
+    batch = time.perf_counter() - started
+
+    print(f'books={args.books} batch_size={args.batch_size}')
+    print(f'{"path":<24}{"seconds":>10}{"rows/sec":>12}')
+    print(f'{"POST /api/books":<24}{single:>10.2f}{args.books / single:>12.0f}')
+    print(f'{"POST /api/books/batch":<24}{batch:>10.2f}{args.books / batch:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
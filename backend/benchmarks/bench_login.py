@@ -0,0 +1,58 @@
+"""
+Пропускная способность /api/login и p99 задержки при конкурентной нагрузке:
+хэширование в потоке запроса (workers=0) против пула процессов.
+
+    cd backend && python -m benchmarks.bench_login --requests 200 --concurrency 16 --workers 0 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .loadgen import percentile
+from .seed import make_bench_app
+
+
+def run(workers, requests_count, concurrency, queue_size):
+    app = make_bench_app(PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_QUEUE_SIZE=queue_size)
+    credentials = {'username': 'bench', 'password': 'password123'}
+    app.test_client().post('/api/register', json=credentials)
+
+    def login(_):
+        client = app.test_client()
+        started = time.perf_counter()
+        status = client.post('/api/login', json=credentials).status_code
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(login, range(requests_count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for status, latency in results if status == 200]
+    rejected = sum(1 for status, _ in results if status == 503)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'rejected': rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count() or 2])
+    parser.add_argument('--queue-size', type=int, default=64)
+    args = parser.parse_args()
+
+    print(f'requests={args.requests} concurrency={args.concurrency}')
+    print(f'{"workers":<10}{"req/sec":>10}{"p50, ms":>10}{"p99, ms":>10}{"503":>8}')
+    for workers in args.workers:
+        result = run(workers, args.requests, args.concurrency, args.queue_size)
+        print(f'{workers:<10}{result["rps"]:>10.1f}{result["p50"]:>10.1f}{result["p99"]:>10.1f}'
+              f'{result["rejected"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
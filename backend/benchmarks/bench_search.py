@@ -0,0 +1,45 @@
+"""
+Сравнение фильтра по названию через ILIKE и через индекс поиска.
+
+    cd backend && python -m benchmarks.bench_search --books 50000
+"""
+import argparse
+import time
+from app.database import db
+from app.models import Book
+from app.search import LikeSearch, get_search
+from .seed import make_bench_app, seed_books
+
+QUERIES = ['мир', 'мастер ночь', 'plan', 'river stone', 'звезд']
+
+
+def measure(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    app = make_bench_app(args.database_uri)
+    with app.app_context():
+        seed_books(args.books)
+        like, indexed = LikeSearch(), get_search()
+        print(f'books={args.books} backend={indexed.name}')
+        print(f'{"query":<16}{"like, ms":>12}{"index, ms":>12}{"ranked, ms":>12}')
+        for query_text in QUERIES:
+            like_ms = measure(lambda: like.filter_title(Book.query, query_text).limit(100).all(), args.repeat)
+            index_ms = measure(lambda: indexed.filter_title(Book.query, query_text).limit(100).all(), args.repeat)
+            ranked_ms = measure(lambda: indexed.ranked(query_text, 100), args.repeat)
+            print(f'{query_text:<16}{like_ms:>12.2f}{index_ms:>12.2f}{ranked_ms:>12.2f}')
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
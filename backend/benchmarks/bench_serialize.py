@@ -0,0 +1,83 @@
+"""
+Сериализация списков: прежний путь (ORM-объекты + словарь на строку + json Flask)
+против выборки столбцов (app.serialize) со стандартным json и с orjson. Меряется
+rows/sec от запроса к БД до готового тела ответа.
+
+    cd backend && python -m benchmarks.bench_serialize --books 20000 --page 1000
+"""
+import argparse
+import time
+from flask.json.provider import DefaultJSONProvider
+from app.database import db
+from app.models import Book, Deal, Review
+from app.serialize import BOOK, DEAL, REVIEW, FastJSONProvider, deal_dicts, orjson
+from .seed import make_bench_app, seed_dataset
+
+
+def legacy_book(book):
+    return {'id': book.book_id, 'title': book.title, 'description': book.description,
+            'is_available': book.is_available, 'user_id': book.user_id}
+
+
+def legacy_review(review):
+    return {'review_id': review.review_id, 'user_id': review.user_id, 'book_id': review.book_id,
+            'review_text': review.review_text}
+
+
+def legacy_deal(deal):
+    return {'deal_id': deal.deal_id, 'sender_id': deal.sender_id, 'recipient_id': deal.recipient_id,
+            'recipient_book_id': deal.recipient_book_id, 'sender_book_id': deal.sender_book_id,
+            'place': deal.place, 'status': deal.status, 'gift_flag': deal.gift_flag,
+            'sender_contact': None, 'recipient_contact': None}
+
+
+def rows_per_second(produce, provider, repeat):
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        items = produce()
+        provider.response(items).get_data()
+        rows += len(items)
+        # Каждый повтор — как отдельный запрос: identity map не переиспользуется
+        db.session.remove()
+    return rows / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', help='по умолчанию SQLite во временном файле')
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--page', type=int, default=1000, help='строк в одном ответе')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_bench_app(args.database_uri, LOG_LEVEL='WARNING', PASSWORD_HASH_WORKERS=0)
+    with app.app_context():
+        seed_dataset(100, args.books, args.books, args.books)
+        stdlib, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+        resources = {
+            'books': (
+                lambda: [legacy_book(book) for book in Book.query.order_by(Book.book_id).limit(args.page)],
+                lambda: BOOK.dicts(BOOK.query().order_by(Book.book_id).limit(args.page)),
+            ),
+            'reviews': (
+                lambda: [legacy_review(review) for review in Review.query.order_by(Review.review_id).limit(args.page)],
+                lambda: REVIEW.dicts(REVIEW.query().order_by(Review.review_id).limit(args.page)),
+            ),
+            'deals': (
+                lambda: [legacy_deal(deal) for deal in Deal.query.order_by(Deal.deal_id).limit(args.page)],
+                lambda: deal_dicts(DEAL.query().order_by(Deal.deal_id).limit(args.page).all(), {}),
+            ),
+        }
+
+        print(f'books={args.books} page={args.page} orjson={"yes" if orjson else "no"}')
+        print(f'{"resource":<10}{"orm+json":>12}{"rows+json":>12}{"rows+orjson":>13}{"speedup":>9}')
+        for name, (legacy, projected) in resources.items():
+            before = rows_per_second(legacy, stdlib, args.repeat)
+            projected_stdlib = rows_per_second(projected, stdlib, args.repeat)
+            after = rows_per_second(projected, fast, args.repeat) if orjson else projected_stdlib
+            print(f'{name:<10}{before:>12.0f}{projected_stdlib:>12.0f}{after:>13.0f}{after / before:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Время холодного старта: импорт пакета app и create_app в отдельном процессе,
+для полного режима (flasgger и create_all при старте) и быстрого
+(SWAGGER_MODE=lazy, DB_SCHEMA=none по уже созданной схеме).
+
+    cd backend && python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from .loadgen import percentile
+
+MODES = {
+    'full': {'SWAGGER_MODE': 'eager', 'DB_SCHEMA': 'create_all'},
+    'fast': {'SWAGGER_MODE': 'lazy', 'DB_SCHEMA': 'none'},
+}
+
+# Выполняется в дочернем процессе; печатает время импорта и create_app в миллисекундах
+CHILD = """
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({'LOG_FILE': None})
+print((imported - started) * 1000, (time.perf_counter() - imported) * 1000)
+"""
+
+
+def measure(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], env=env, check=True,
+                            capture_output=True, text=True).stdout.split()
+    import_ms, create_ms = (float(value) for value in output[-2:])
+    return import_ms, create_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    database_uri = 'sqlite:///' + tempfile.mkstemp(suffix='.db')[1]
+    base_env = dict(os.environ, SQLALCHEMY_DATABASE_URI=database_uri)
+    # Схема создаётся один раз заранее, как при развёртывании с миграциями
+    measure(dict(base_env, DB_SCHEMA='migrations'))
+
+    print(f'runs={args.runs}')
+    print(f'{"mode":<8}{"import p50":>12}{"create p50":>12}{"total p50":>12}{"total p95":>12}')
+    for name, mode_env in MODES.items():
+        results = [measure(dict(base_env, **mode_env)) for _ in range(args.runs)]
+        imports = [import_ms for import_ms, _ in results]
+        creates = [create_ms for _, create_ms in results]
+        totals = [import_ms + create_ms for import_ms, create_ms in results]
+        print(f'{name:<8}{percentile(imports, 0.5):>12.1f}{percentile(creates, 0.5):>12.1f}'
+              f'{percentile(totals, 0.5):>12.1f}{percentile(totals, 0.95):>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
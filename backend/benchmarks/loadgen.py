@@ -0,0 +1,102 @@
+"""
+Многопоточный генератор нагрузки: через Flask test client (в процессе)
+или по HTTP к поднятому серверу.
+"""
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from werkzeug.serving import make_server
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Пропускная способность и перцентили задержек в миллисекундах
+    """
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50': round(percentile(latencies_ms, 0.50), 3),
+        'p95': round(percentile(latencies_ms, 0.95), 3),
+        'p99': round(percentile(latencies_ms, 0.99), 3),
+    }
+
+
+def _drive(send, requests_count, concurrency):
+    local = threading.local()
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(_):
+        started = time.perf_counter()
+        ok = send(local)
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(requests_count)))
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def run_client(app, method, path, requests_count, concurrency, headers=None, body=None):
+    """
+    Нагрузка через test client: без сети, измеряется только обработка в приложении
+    """
+    def send(local):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.open(path, method=method, headers=headers, json=body)
+        return response.status_code < 400
+
+    return _drive(send, requests_count, concurrency)
+
+
+def run_http(base_url, method, path, requests_count, concurrency, headers=None, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+
+    def send(local):
+        request = urllib.request.Request(base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json', **(headers or {})})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status < 400
+        except (urllib.error.URLError, OSError):
+            return False
+
+    return _drive(send, requests_count, concurrency)
+
+
+@contextmanager
+def serve(app, host='127.0.0.1', port=0):
+    """
+    Многопоточный HTTP-сервер werkzeug в фоновом потоке; возвращает базовый URL
+    """
+    # Строка лога werkzeug на каждый запрос искажает замеры
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server(host, port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{server.server_port}'
+    finally:
+        server.shutdown()
+        thread.join()
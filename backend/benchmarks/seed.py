@@ -0,0 +1,102 @@
+import random
+import tempfile
+from datetime import datetime, timedelta
+from app import create_app, stats
+from app.database import db
+from app.hashing import get_hasher
+from app.models import Book, Deal, Review, User
+
+WORDS = [
+    'война', 'мир', 'мастер', 'ночь', 'город', 'море', 'звезда', 'сад', 'дорога', 'время',
+    'history', 'river', 'garden', 'winter', 'shadow', 'empire', 'planet', 'journey', 'stone', 'light',
+]
+
+
+def make_bench_app(database_uri=None, **config):
+    """
+    Приложение для бенчмарков; по умолчанию — SQLite во временном файле
+    """
+    if database_uri is None:
+        database_uri = 'sqlite:///' + tempfile.mkstemp(suffix='.db')[1]
+    config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    return create_app(config)
+
+
+def random_text(rng, words_count):
+    return ' '.join(rng.choice(WORDS) for _ in range(words_count))
+
+
+def _insert_chunked(table, count, make_row, chunk_size):
+    for start in range(0, count, chunk_size):
+        db.session.execute(table.insert(), [make_row(start + i) for i in range(min(chunk_size, count - start))])
+
+
+def seed_books(count, seed=42, user_id=None, chunk_size=5000, user_ids=None):
+    """
+    Детерминированно заполняет таблицу book; вызывать внутри app_context.
+    Если передан user_ids, владелец каждой книги выбирается из него.
+    """
+    rng = random.Random(seed)
+    _insert_chunked(Book.__table__, count, lambda _: {
+        'title': random_text(rng, 2)[:32],
+        'description': random_text(rng, 8)[:128],
+        'user_id': rng.choice(user_ids) if user_ids else user_id,
+        'is_available': rng.random() < 0.8,
+    }, chunk_size)
+    db.session.commit()
+
+
+def seed_dataset(users=100, books=5000, reviews=10000, deals=5000, seed=42, chunk_size=5000):
+    """
+    Детерминированный набор пользователей, книг, отзывов и сделок; вызывать внутри app_context.
+    У всех пользователей пароль password123, логины user0..userN-1.
+    """
+    rng = random.Random(seed)
+    password_hash = get_hasher().hash('password123')
+    _insert_chunked(User.__table__, users, lambda i: {
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'phone': f'{i:09d}',
+        'password_hash': password_hash,
+        'is_admin': i == 0,
+    }, chunk_size)
+    user_ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+
+    seed_books(books, seed=seed, chunk_size=chunk_size, user_ids=user_ids)
+    owned_books = db.session.query(Book.book_id, Book.user_id).order_by(Book.book_id).all()
+
+    _insert_chunked(Review.__table__, reviews, lambda _: {
+        'user_id': rng.choice(user_ids),
+        'book_id': rng.choice(owned_books).book_id,
+        'review_text': random_text(rng, 12),
+    }, chunk_size)
+
+    started = datetime(2024, 1, 1)
+
+    def make_deal(i):
+        book = rng.choice(owned_books)
+        status = rng.choice(['Created', 'Agreed', 'Completed'])
+        return {
+            'sender_id': rng.choice(user_ids),
+            'recipient_id': book.user_id,
+            'recipient_book_id': book.book_id,
+            'sender_book_id': rng.choice(owned_books).book_id if status != 'Created' else None,
+            'gift_flag': False,
+            'status': status,
+            'time': started + timedelta(minutes=i),
+            'place': random_text(rng, 2),
+        }
+
+    _insert_chunked(Deal.__table__, deals, make_deal, chunk_size)
+    db.session.commit()
+    stats.rebuild_counters()
+    return user_ids
+
+
+def auth_headers(client, username='bench', password='password123'):
+    """
+    Регистрирует пользователя через API и возвращает заголовок с токеном
+    """
+    client.post('/api/register', json={'username': username, 'password': password})
+    response = client.post('/api/login', json={'username': username, 'password': password})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
@@ -1,9 +1,142 @@
 
+import os
+
+
+def _env_list(name):
+    return [value.strip() for value in os.environ.get(name, '').split(',') if value.strip()]
+
 
 class Config:
 
-    SQLALCHEMY_DATABASE_URI = 'postgresql://user:password@db:5432/book_exchange'
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'SQLALCHEMY_DATABASE_URI',
+        os.environ.get('DATABASE_URL', 'postgresql://user:password@db:5432/book_exchange'))
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    JWT_SECRET_KEY = 'super-secret-key'
\ No newline at end of file
+    JWT_SECRET_KEY = 'super-secret-key'
+
+    # Пагинация и потоковая выдача списков: без limit и after список отдаётся целиком,
+    # с after без limit (и в поиске) — страницей PAGE_SIZE_DEFAULT
+    PAGE_SIZE_DEFAULT = 50
+    PAGE_SIZE_MAX = 100
+    STREAM_CHUNK_SIZE = 500
+
+    # Бэкенд поиска книг: auto (по диалекту БД), like, sqlite, postgresql
+    SEARCH_BACKEND = 'auto'
+
+    # Кэш карточек книг и отзывов: memory (LRU+TTL в процессе), redis, none. Изменение книги
+    # удаляет только её записи; с memory в другом процессе оно видно через CACHE_TTL секунд,
+    # поэтому при нескольких процессах нужен redis
+    CACHE_BACKEND = 'memory'
+    CACHE_TTL = 300
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_REDIS_URL = 'redis://localhost:6379/0'
+    # Валидаторы условных GET (версия и время изменения таблицы) тоже лежат в кэше; с кэшем
+    # в памяти изменение из другого процесса видно через ETAG_CACHE_TTL секунд
+    ETAG_CACHE_TTL = 5
+
+    # Массовый импорт книг
+    BATCH_MAX_ROWS = 10000
+    BATCH_CHUNK_SIZE = 1000
+
+    # Хэширование паролей: метод werkzeug со стоимостью, размер пула процессов и очереди.
+    # При переполнении очереди /api/login и /api/register отвечают 503 с Retry-After.
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE_SIZE = 16
+    PASSWORD_HASH_TIMEOUT = 10
+    PASSWORD_HASH_RETRY_AFTER = 1
+
+    # Кэш текущего пользователя (id и роль) по JWT; после promote сбрасывается сразу,
+    # в других процессах изменение роли видно через PRINCIPAL_CACHE_TTL секунд
+    PRINCIPAL_CACHE_TTL = 30
+    PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+
+    # Логи: JSON-строки через очередь, файл с ротацией
+    LOG_LEVEL = 'INFO'
+    LOG_JSON = True
+    LOG_FILE = 'app.log'
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT = 5
+
+    # Метрики по endpoint-ам (/api/admin/metrics); False — без накладных расходов
+    METRICS_ENABLED = True
+
+    # Создание схемы при старте: create_all (по моделям), migrations (flask schema upgrade)
+    # или none — схему и счётчики готовит развёртывание (flask schema upgrade, flask reconcile-stats)
+    DB_SCHEMA = os.environ.get('DB_SCHEMA', 'create_all')
+
+    # Документация API: eager (flasgger при старте), lazy (спецификация при первом запросе),
+    # file (готовая спецификация из SWAGGER_SPEC_FILE, собирается flask apispec), off
+    SWAGGER_MODE = os.environ.get('SWAGGER_MODE', 'eager')
+    SWAGGER_SPEC_FILE = os.environ.get('SWAGGER_SPEC_FILE', 'apispec.json')
+
+    # Пул соединений (для SQLite размер пула не задаётся)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False')
+
+    # Реплики для чтения (через запятую); пустой список — всё идёт в основную БД.
+    # После записи пользователь REPLICA_STICKY_SECONDS секунд читает с основной.
+    SQLALCHEMY_REPLICA_URIS = _env_list('SQLALCHEMY_REPLICA_URIS')
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    REPLICA_STICKY_MAX_ENTRIES = 10000
+
+    # ASGI-режим (asgi.py): потоки для запросов, которые обслуживает Flask-приложение
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+
+    # Поиск многосторонних обменов (/api/deals/cycles): максимальная длина цикла,
+    # период полной перестройки графа и ограничение шагов поиска на запрос
+    EXCHANGE_MAX_CYCLE_LENGTH = 5
+    EXCHANGE_REBUILD_SECONDS = 60
+    EXCHANGE_SEARCH_BUDGET = 100000
+
+    # Рекомендации (flask recommend-refresh): сколько похожих книг и рекомендаций хранить
+    # и размер пакета при пересчёте
+    RECOMMEND_TOP_N = 20
+    RECOMMEND_BATCH_SIZE = 500
+
+    # Пакетные запросы (/api/batch): максимум подзапросов в пакете и потоков
+    # для параллельного выполнения GET; 0 — подзапросы всегда выполняются по очереди
+    BATCH_MAX_REQUESTS = 20
+    BATCH_MAX_WORKERS = 4
+
+    # События сделок (/api/deals/events): memory — в пределах процесса, redis — между
+    # процессами через EVENTS_REDIS_URL (по умолчанию CACHE_REDIS_URL). Пинг раз в
+    # EVENTS_HEARTBEAT_SECONDS; при EVENTS_MAX_PENDING непрочитанных событий поток закрывается
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'memory')
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL')
+    EVENTS_HEARTBEAT_SECONDS = 15
+    EVENTS_MAX_PENDING = 100
+    EVENTS_RETRY_MS = 3000
+
+    # Фоновые задачи (flask jobs-worker): database — очередь в таблице job, memory — в памяти
+    # процесса (тесты). Упавшая задача повторяется через JOBS_BACKOFF_SECONDS * 2^(попытка-1),
+    # не дольше JOBS_BACKOFF_MAX_SECONDS; задача в running дольше JOBS_TIMEOUT_SECONDS
+    # считается брошенной. Выполненные задачи хранятся JOBS_RETENTION_SECONDS
+    JOBS_BACKEND = os.environ.get('JOBS_BACKEND', 'database')
+    JOBS_CONCURRENCY = int(os.environ.get('JOBS_CONCURRENCY', 4))
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_POLL_SECONDS = 1.0
+    JOBS_TIMEOUT_SECONDS = 300
+    JOBS_BACKOFF_SECONDS = 5
+    JOBS_BACKOFF_MAX_SECONDS = 600
+    JOBS_RETENTION_SECONDS = 86400
+    JOBS_STATS_WINDOW_SECONDS = 300
+    # Через сколько секунд после завершения сделки обновлять рекомендации (одна задача на серию сделок)
+    RECOMMEND_REFRESH_DELAY = 60
+
+    # Выгрузка (/api/admin/export, flask export): строк в одной пачке серверного курсора
+    EXPORT_CHUNK_SIZE = 1000
+
+    # Архив сделок (flask deals-archive, задача deals_archive): завершённые сделки старше
+    # DEAL_ARCHIVE_AFTER_DAYS переносятся в deal_archive пакетами по DEAL_ARCHIVE_BATCH_SIZE;
+    # проход ставится не чаще раза в DEAL_ARCHIVE_INTERVAL_SECONDS и переносит не больше
+    # DEAL_ARCHIVE_BATCHES_PER_PASS пакетов
+    DEAL_ARCHIVE_AFTER_DAYS = int(os.environ.get('DEAL_ARCHIVE_AFTER_DAYS', 90))
+    DEAL_ARCHIVE_BATCH_SIZE = 1000
+    DEAL_ARCHIVE_BATCHES_PER_PASS = 10
+    DEAL_ARCHIVE_INTERVAL_SECONDS = 3600
@@ -1,8 +1,20 @@
+import csv
+import gzip
+import io
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-from ..app import create_app
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from ..app import archive, create_app, recommend, stats
+from ..app.cache import book_key, get_cache
 from ..app.database import db
-from ..app.models import User, Book
+from ..app.models import User, Book, Deal, DealArchive
+from ..app.hashing import PasswordHasher
 
 class TestAPI:
     def setup_method(self):
@@ -22,6 +34,19 @@ class TestAPI:
             db.session.remove()
             db.drop_all()
 
+    def _register_and_login(self, username):
+        self.client.post('/api/register', json={
+            'username': username,
+            'email': f'{username}@example.com',
+            'phone': '000000000',
+            'password': 'password123'
+        })
+        login_response = self.client.post('/api/login', json={
+            'username': username,
+            'password': 'password123'
+        })
+        return json.loads(login_response.data)['access_token']
+
     def test_register_user(self):
         # Тест регистрации нового пользователя
         response = self.client.post('/api/register', json={
@@ -105,4 +130,735 @@ class TestAPI:
         assert response.status_code == 200
         data = json.loads(response.data)
         assert len(data) > 0
-        assert any(book['title'] == 'Another Test Book' for book in data)
\ No newline at end of file
+        assert any(book['title'] == 'Another Test Book' for book in data)
+
+    def test_get_books_keyset_pagination(self):
+        token = self._register_and_login('testuser5')
+        for i in range(5):
+            self.client.post('/api/books', json={
+                'title': f'Paged Book {i}'
+            }, headers={'Authorization': f'Bearer {token}'})
+
+        # Первая страница: курсор следующей страницы в заголовке
+        response = self.client.get('/api/books?limit=2')
+        assert response.status_code == 200
+        first_page = response.get_json()
+        assert len(first_page) == 2
+        cursor = response.headers['X-Next-Cursor']
+        assert cursor == str(first_page[-1]['id'])
+
+        # Вторая страница начинается строго после курсора
+        response = self.client.get(f'/api/books?limit=2&after={cursor}')
+        second_page = response.get_json()
+        assert [book['id'] for book in second_page] == sorted(book['id'] for book in second_page)
+        assert second_page[0]['id'] > first_page[-1]['id']
+
+        # Последняя страница без курсора
+        response = self.client.get(f'/api/books?limit=2&after={second_page[-1]["id"]}')
+        assert len(response.get_json()) == 1
+        assert 'X-Next-Cursor' not in response.headers
+
+    def test_get_books_stream(self):
+        token = self._register_and_login('testuser6')
+        for i in range(3):
+            self.client.post('/api/books', json={
+                'title': f'Streamed Book {i}'
+            }, headers={'Authorization': f'Bearer {token}'})
+
+        response = self.client.get('/api/books?stream=1')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert [book['title'] for book in data] == [f'Streamed Book {i}' for i in range(3)]
+
+    def test_get_books_default_page_size(self):
+        token = self._register_and_login('testuser6a')
+        for i in range(3):
+            self.client.post('/api/books', json={'title': f'Default Page {i}'},
+                             headers={'Authorization': f'Bearer {token}'})
+        self.app.config['PAGE_SIZE_DEFAULT'] = 2
+
+        # Без limit и after список по-прежнему целиком: клиенты без курсора ничего не теряют
+        response = self.client.get('/api/books')
+        assert len(response.get_json()) == 3
+        assert 'X-Next-Cursor' not in response.headers
+        # С after без limit — страница по умолчанию; stream=0 и stream=false поток не включают
+        for value in ('0', 'false', 'no'):
+            response = self.client.get(f'/api/books?after=0&stream={value}')
+            assert len(response.get_json()) == 2
+            assert 'X-Next-Cursor' in response.headers
+        # Поток без limit отдаёт все книги
+        response = self.client.get('/api/books?after=0&stream=TRUE')
+        assert len(json.loads(response.data)) == 3
+
+    def test_get_books_title_filter(self):
+        token = self._register_and_login('testuser7')
+        for title in ['Война и мир', 'Мастер и Маргарита', 'Мир без войны']:
+            self.client.post('/api/books', json={
+                'title': title
+            }, headers={'Authorization': f'Bearer {token}'})
+
+        response = self.client.get('/api/books?title=Маргарита')
+        assert [book['title'] for book in response.get_json()] == ['Мастер и Маргарита']
+
+        # Фильтр ищет подстроку, в том числе из середины слова, на любом бэкенде поиска
+        response = self.client.get('/api/books?title=арга')
+        assert [book['title'] for book in response.get_json()] == ['Мастер и Маргарита']
+        response = self.client.get('/api/books?title=ир')
+        assert [book['title'] for book in response.get_json()] == ['Война и мир', 'Мир без войны']
+
+    def test_search_books_ranked(self):
+        token = self._register_and_login('testuser8')
+        self.client.post('/api/books', json={
+            'title': 'Dune',
+            'description': 'Desert planet'
+        }, headers={'Authorization': f'Bearer {token}'})
+        self.client.post('/api/books', json={
+            'title': 'Foundation',
+            'description': 'Galactic empire'
+        }, headers={'Authorization': f'Bearer {token}'})
+
+        # Поиск по префиксу слова в описании
+        response = self.client.get('/api/books/search?q=plan')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [book['title'] for book in data] == ['Dune']
+        assert 'rank' in data[0]
+
+    def _count_statements(self, fn):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(statements)
+
+    def test_get_user_deals_fixed_query_count(self):
+        sender_token = self._register_and_login('testsender')
+        with self.app.app_context():
+            sender_id = User.query.filter_by(username='testsender').first().id
+
+        def create_agreed_deal(owner_username):
+            # У каждой сделки свой получатель, чтобы контакты не брались из identity map
+            owner_token = self._register_and_login(owner_username)
+            self.client.post('/api/books', json={'title': f'{owner_username} book'},
+                             headers={'Authorization': f'Bearer {owner_token}'})
+            with self.app.app_context():
+                owner_id = User.query.filter_by(username=owner_username).first().id
+                book_id = Book.query.filter_by(user_id=owner_id).first().book_id
+            self.client.post('/api/deals', json={
+                'recipient_id': owner_id,
+                'recipient_book_id': book_id
+            }, headers={'Authorization': f'Bearer {sender_token}'})
+            with self.app.app_context():
+                deal_id = db.session.query(db.func.max(Deal.deal_id)).scalar()
+            self.client.put(f'/api/deals/{deal_id}/accept', json={'gift_flag': True},
+                            headers={'Authorization': f'Bearer {owner_token}'})
+
+        def fetch_deals():
+            return self.client.get(f'/api/deals?user_id={sender_id}',
+                                   headers={'Authorization': f'Bearer {sender_token}'})
+
+        create_agreed_deal('testowner0')
+        response, statements_for_one = self._count_statements(fetch_deals)
+        assert response.get_json()[0]['recipient_contact'] == 'testowner0@example.com'
+
+        for i in range(1, 5):
+            create_agreed_deal(f'testowner{i}')
+        response, statements_for_five = self._count_statements(fetch_deals)
+        assert len(response.get_json()) == 5
+        assert statements_for_five == statements_for_one
+
+    def test_get_user_deals_status_filter_and_pagination(self):
+        owner_token = self._register_and_login('testowner2')
+        sender_token = self._register_and_login('testsender2')
+        with self.app.app_context():
+            owner_id = User.query.filter_by(username='testowner2').first().id
+            sender_id = User.query.filter_by(username='testsender2').first().id
+        self.client.post('/api/books', json={'title': 'Paged Deal Book'},
+                         headers={'Authorization': f'Bearer {owner_token}'})
+        with self.app.app_context():
+            book_id = Book.query.filter_by(title='Paged Deal Book').first().book_id
+        for _ in range(3):
+            self.client.post('/api/deals', json={
+                'recipient_id': owner_id,
+                'recipient_book_id': book_id
+            }, headers={'Authorization': f'Bearer {sender_token}'})
+
+        headers = {'Authorization': f'Bearer {sender_token}'}
+        response = self.client.get(f'/api/deals?user_id={sender_id}&status=Created&limit=2', headers=headers)
+        assert len(response.get_json()) == 2
+        cursor = response.headers['X-Next-Cursor']
+        response = self.client.get(f'/api/deals?user_id={sender_id}&status=Created&limit=2&after={cursor}',
+                                   headers=headers)
+        assert len(response.get_json()) == 1
+
+        response = self.client.get(f'/api/deals?user_id={sender_id}&status=Completed', headers=headers)
+        assert response.get_json() == []
+
+    def test_exchange_cycles(self):
+        users = {}
+        for name in ['cyclea', 'cycleb', 'cyclec']:
+            token = self._register_and_login(name)
+            headers = {'Authorization': f'Bearer {token}'}
+            self.client.post('/api/books', json={'title': f'{name} book'}, headers=headers)
+            with self.app.app_context():
+                user_id = User.query.filter_by(username=name).first().id
+                book_id = Book.query.filter_by(user_id=user_id).first().book_id
+            users[name] = (user_id, book_id, headers)
+
+        def want(sender, owner):
+            self.client.post('/api/deals', json={
+                'recipient_id': users[owner][0],
+                'recipient_book_id': users[owner][1]
+            }, headers=users[sender][2])
+            with self.app.app_context():
+                return db.session.query(db.func.max(Deal.deal_id)).scalar()
+
+        def cycles(name, query=''):
+            response = self.client.get(f'/api/deals/cycles{query}', headers=users[name][2])
+            assert response.status_code == 200
+            return response.get_json()
+
+        want('cyclea', 'cycleb')
+        want('cycleb', 'cyclec')
+        assert cycles('cyclea') == []
+
+        # Граф уже построен — новая сделка попадает в него инкрементально
+        closing_deal = want('cyclec', 'cyclea')
+        found = cycles('cyclea')
+        assert [cycle['length'] for cycle in found] == [3]
+        assert {deal['sender_id'] for deal in found[0]['deals']} == {user_id for user_id, _, _ in users.values()}
+        assert cycles('cycleb')[0]['length'] == 3
+        assert cycles('cyclea', '?max_length=2') == []
+
+        # Парный обмен короче и предлагается первым
+        want('cyclea', 'cyclec')
+        assert [cycle['length'] for cycle in cycles('cyclea')] == [2, 3]
+
+        self.client.delete(f'/api/deals/{closing_deal}', headers=users['cyclec'][2])
+        assert cycles('cyclea') == []
+
+    def test_deal_transitions_race(self):
+        owner_headers = {'Authorization': f'Bearer {self._register_and_login("raceowner")}'}
+        self.client.post('/api/books', json={'title': 'Race Book'}, headers=owner_headers)
+        with self.app.app_context():
+            owner_id = User.query.filter_by(username='raceowner').first().id
+            book_id = Book.query.filter_by(title='Race Book').first().book_id
+        sender_headers = {'Authorization': f'Bearer {self._register_and_login("racesender")}'}
+        for _ in range(8):
+            self.client.post('/api/deals', json={'recipient_id': owner_id, 'recipient_book_id': book_id},
+                             headers=sender_headers)
+        with self.app.app_context():
+            deal_ids = [deal.deal_id for deal in Deal.query.order_by(Deal.deal_id)]
+
+        def hammer(method, paths, headers, body=None):
+            # Все потоки стартуют одновременно, каждый со своим клиентом
+            barrier = threading.Barrier(len(paths))
+
+            def send(path):
+                client = self.app.test_client()
+                barrier.wait()
+                return getattr(client, method)(path, json=body, headers=headers).status_code
+
+            with ThreadPoolExecutor(len(paths)) as pool:
+                return sorted(pool.map(send, paths))
+
+        # Одну сделку принимают параллельно — переход Created -> Agreed выигрывает один запрос
+        assert hammer('put', [f'/api/deals/{deal_ids[0]}/accept'] * 8, owner_headers,
+                      {'gift_flag': True}) == [200] + [409] * 7
+        for deal_id in deal_ids[1:]:
+            self.client.put(f'/api/deals/{deal_id}/accept', json={'gift_flag': True}, headers=owner_headers)
+
+        # Восемь согласованных сделок на одну книгу завершаются параллельно — книгу получает один
+        assert hammer('put', [f'/api/deals/{deal_id}/complete' for deal_id in deal_ids],
+                      owner_headers) == [200] + [409] * 7
+        with self.app.app_context():
+            assert db.session.get(Book, book_id).is_available is False
+            statuses = [deal.status for deal in Deal.query.order_by(Deal.deal_id)]
+        assert sorted(statuses) == ['Agreed'] * 7 + ['Completed']
+
+        admin_headers = {'Authorization': f'Bearer {self._register_and_login("raceadmin")}'}
+        with self.app.app_context():
+            User.query.filter_by(username='raceadmin').first().is_admin = True
+            db.session.commit()
+        data = self.client.get('/api/admin/stats', headers=admin_headers).get_json()
+        assert data['deals_by_status'] == {'Agreed': 7, 'Completed': 1}
+
+    def test_deal_events_stream(self):
+        self.app.config['EVENTS_HEARTBEAT_SECONDS'] = 0.05
+        owner_token = self._register_and_login('streamowner')
+        owner_headers = {'Authorization': f'Bearer {owner_token}'}
+        sender_headers = {'Authorization': f'Bearer {self._register_and_login("streamsender")}'}
+        self.client.post('/api/books', json={'title': 'Stream Book'}, headers=owner_headers)
+        with self.app.app_context():
+            owner_id = User.query.filter_by(username='streamowner').first().id
+            book_id = Book.query.filter_by(title='Stream Book').first().book_id
+
+        # EventSource не умеет передавать заголовки — токен в query string
+        stream = self.client.get(f'/api/deals/events?jwt={owner_token}', buffered=False)
+        assert stream.status_code == 200
+        assert stream.mimetype == 'text/event-stream'
+
+        self.client.post('/api/deals', json={'recipient_id': owner_id, 'recipient_book_id': book_id},
+                         headers=sender_headers)
+        with self.app.app_context():
+            deal_id = db.session.query(db.func.max(Deal.deal_id)).scalar()
+        self.client.put(f'/api/deals/{deal_id}/accept', json={'gift_flag': True}, headers=owner_headers)
+        self.client.put(f'/api/deals/{deal_id}/complete', headers=owner_headers)
+
+        received = []
+        for chunk in stream.response:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if '\nevent: deal\n' in chunk:
+                received.append(json.loads(chunk.split('data: ', 1)[1]))
+            if len(received) == 3 or chunk.startswith(': ping'):
+                break
+        stream.close()
+        assert [(event['deal_id'], event['status']) for event in received] == \
+               [(deal_id, 'Created'), (deal_id, 'Agreed'), (deal_id, 'Completed')]
+        assert self.app.extensions['events'][0].connections() == 0
+
+        assert self.client.get('/api/deals/events').status_code == 401
+
+    def test_recommendations(self):
+        owner_headers = {'Authorization': f'Bearer {self._register_and_login("recowner")}'}
+        for title in ['Rec A', 'Rec B', 'Rec C', 'Rec D']:
+            self.client.post('/api/books', json={'title': title}, headers=owner_headers)
+        with self.app.app_context():
+            books = {book.title[-1]: book.book_id for book in Book.query.filter(Book.title.startswith('Rec '))}
+        readers = {}
+        for name in ['reader1', 'reader2', 'reader3']:
+            readers[name] = {'Authorization': f'Bearer {self._register_and_login(name)}'}
+            with self.app.app_context():
+                readers[name + '_id'] = User.query.filter_by(username=name).first().id
+
+        def review(name, letter):
+            self.client.post('/api/reviews', json={'book_id': books[letter], 'review_text': 'ok'},
+                             headers=readers[name])
+
+        def refresh(*args):
+            result = self.app.test_cli_runner().invoke(args=['recommend-refresh', *args])
+            assert result.exit_code == 0, result.output
+            return result.output
+
+        for name, letters in [('reader1', 'AB'), ('reader2', 'ABC'), ('reader3', 'A')]:
+            for letter in letters:
+                review(name, letter)
+        refresh()
+
+        similar = self.client.get(f'/api/books/{books["A"]}/similar').get_json()
+        assert [book['title'] for book in similar] == ['Rec B', 'Rec C']
+        assert similar[0]['score'] == round(2 / (3 * 2) ** 0.5, 4)
+
+        response = self.client.get(f'/api/users/{readers["reader3_id"]}/recommendations',
+                                   headers=readers['reader3'])
+        assert [book['title'] for book in response.get_json()] == ['Rec B', 'Rec C']
+        response = self.client.get(f'/api/users/{readers["reader3_id"]}/recommendations',
+                                   headers=readers['reader1'])
+        assert response.status_code == 403
+
+        # Инкрементальное обновление учитывает только новые отзывы
+        review('reader1', 'D')
+        assert 'Пользователей: 1' in refresh()
+        similar = self.client.get(f'/api/books/{books["D"]}/similar').get_json()
+        assert {book['title'] for book in similar} == {'Rec A', 'Rec B'}
+
+        # Сделка, открытая во время обновления, учитывается, когда завершится; старая сделка,
+        # которая так и остаётся открытой, водяной знак не держит
+        with self.app.app_context():
+            owner_id = User.query.filter_by(username='recowner').first().id
+        for letter in 'CD':
+            self.client.post('/api/deals', json={'recipient_id': owner_id, 'recipient_book_id': books[letter]},
+                             headers=readers['reader3'])
+        with self.app.app_context():
+            open_id, deal_id = sorted(deal_id for deal_id, in db.session.query(Deal.deal_id))[-2:]
+        assert 'Пользователей: 0' in refresh()
+        self.client.put(f'/api/deals/{deal_id}/accept', json={'gift_flag': True}, headers=owner_headers)
+        self.client.put(f'/api/deals/{deal_id}/complete', headers=owner_headers)
+        assert 'Пользователей: 1' in refresh()
+
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            completed_seq = db.session.get(Deal, deal_id).completed_seq
+            assert db.session.get(Deal, open_id).status == 'Created'
+            assert stats.read_values('recommend:deal_seq') == {'recommend:deal_seq': completed_seq}
+            # Следующее обновление не перечитывает уже учтённые сделки
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                assert recommend.collect_interactions(500) == set()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+                db.session.rollback()
+        deal_scans = [statement for statement in statements if 'FROM deal' in statement]
+        assert deal_scans and all('completed_seq >' in statement for statement in deal_scans)
+
+        incremental = self.client.get(f'/api/books/{books["A"]}/similar').get_json()
+        refresh('--full')
+        assert self.client.get(f'/api/books/{books["A"]}/similar').get_json() == incremental
+
+    def test_admin_stats_counters(self):
+        admin_token = self._register_and_login('testadmin')
+        owner_token = self._register_and_login('testowner3')
+        with self.app.app_context():
+            User.query.filter_by(username='testadmin').first().is_admin = True
+            db.session.commit()
+            owner_id = User.query.filter_by(username='testowner3').first().id
+        for title in ['Stats Book 1', 'Stats Book 2']:
+            self.client.post('/api/books', json={'title': title},
+                             headers={'Authorization': f'Bearer {owner_token}'})
+        with self.app.app_context():
+            book_id = Book.query.filter_by(title='Stats Book 1').first().book_id
+        for _ in range(3):
+            self.client.post('/api/deals', json={
+                'recipient_id': owner_id,
+                'recipient_book_id': book_id
+            }, headers={'Authorization': f'Bearer {admin_token}'})
+        with self.app.app_context():
+            deal_ids = [deal.deal_id for deal in Deal.query.order_by(Deal.deal_id)]
+        self.client.put(f'/api/deals/{deal_ids[0]}/accept', json={'gift_flag': True},
+                        headers={'Authorization': f'Bearer {owner_token}'})
+        self.client.delete(f'/api/deals/{deal_ids[1]}',
+                           headers={'Authorization': f'Bearer {admin_token}'})
+
+        response = self.client.get('/api/admin/stats', headers={'Authorization': f'Bearer {admin_token}'})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total_books'] == 2
+        assert data['total_deals'] == 2
+        assert data['deals_by_status'] == {'Created': 1, 'Agreed': 1}
+        assert sum(data['deals_by_day'].values()) == 2
+
+        # Пересчёт с нуля сходится с инкрементальными счётчиками
+        result = self.app.test_cli_runner().invoke(args=['reconcile-stats'])
+        assert result.exit_code == 0
+        reconciled = self.client.get('/api/admin/stats',
+                                     headers={'Authorization': f'Bearer {admin_token}'}).get_json()
+        assert reconciled == data
+
+    def test_book_cache_invalidation(self):
+        token = self._register_and_login('testuser9')
+        headers = {'Authorization': f'Bearer {token}'}
+        self.client.post('/api/books', json={'title': 'Cached Book'}, headers=headers)
+        with self.app.app_context():
+            book_id = Book.query.filter_by(title='Cached Book').first().book_id
+
+        assert self.client.get(f'/api/books/{book_id}').get_json()['title'] == 'Cached Book'
+        # И валидаторы для ETag, и сама книга берутся из кэша
+        _, statements = self._count_statements(lambda: self.client.get(f'/api/books/{book_id}'))
+        assert statements == 0
+
+        self.client.put(f'/api/books/{book_id}', json={'title': 'Renamed Book'}, headers=headers)
+        assert self.client.get(f'/api/books/{book_id}').get_json()['title'] == 'Renamed Book'
+
+        assert self.client.get(f'/api/books/{book_id}/reviews').get_json() == []
+        self.client.post('/api/reviews', json={'book_id': book_id, 'review_text': 'Great'}, headers=headers)
+        reviews = self.client.get(f'/api/books/{book_id}/reviews').get_json()
+        assert [review['review_text'] for review in reviews] == ['Great']
+
+        self.client.delete(f'/api/books/{book_id}', headers=headers)
+        assert self.client.get(f'/api/books/{book_id}').status_code == 404
+
+    def test_book_update_keeps_other_cached_books(self):
+        token = self._register_and_login('testuser9b')
+        headers = {'Authorization': f'Bearer {token}'}
+        for title in ('Book A', 'Book B'):
+            self.client.post('/api/books', json={'title': title}, headers=headers)
+        with self.app.app_context():
+            book_a, book_b = (Book.query.filter_by(title=title).first().book_id for title in ('Book A', 'Book B'))
+        self.client.get(f'/api/books/{book_a}')
+        self.client.get(f'/api/books/{book_b}')
+
+        self.client.put(f'/api/books/{book_a}', json={'title': 'Book A2'}, headers=headers)
+        with self.app.app_context():
+            cache = get_cache()
+            assert cache.get(book_key(book_a)) is None
+            assert cache.get(book_key(book_b))['title'] == 'Book B'
+        # Книга B по-прежнему берётся из кэша; из БД читаются только сброшенные валидаторы ETag
+        response, statements = self._count_statements(lambda: self.client.get(f'/api/books/{book_b}'))
+        assert statements == 1
+        assert response.get_json()['title'] == 'Book B'
+        assert self.client.get(f'/api/books/{book_a}').get_json()['title'] == 'Book A2'
+
+    def test_conditional_get(self):
+        token = self._register_and_login('testuser10')
+        headers = {'Authorization': f'Bearer {token}'}
+        self.client.post('/api/books', json={'title': 'ETag Book'}, headers=headers)
+
+        response = self.client.get('/api/books')
+        etag = response.headers['ETag']
+        assert response.headers.get('Last-Modified')
+
+        response = self.client.get('/api/books', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        # Любое изменение книг меняет валидатор
+        self.client.post('/api/books', json={'title': 'ETag Book 2'}, headers=headers)
+        response = self.client.get('/api/books', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        assert len(response.get_json()) == 2
+
+    def test_import_books_batch(self):
+        token = self._register_and_login('testuser11')
+        headers = {'Authorization': f'Bearer {token}'}
+
+        response = self.client.post('/api/books/batch', json=[
+            {'title': 'Batch Book 1', 'description': 'first'},
+            {'description': 'no title'},
+            {'title': 'Batch Book 2', 'is_available': False}
+        ], headers=headers)
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['inserted'] == 2
+        assert data['errors'] == [{'row': 1, 'error': 'Поле title обязательно'}]
+
+        ndjson = '\n'.join(json.dumps({'title': f'Stream Book {i}'}) for i in range(3))
+        response = self.client.post('/api/books/batch', data=ndjson,
+                                    content_type='application/x-ndjson', headers=headers)
+        assert response.get_json()['inserted'] == 3
+
+        # В атомарном режиме одна ошибка отменяет весь импорт
+        response = self.client.post('/api/books/batch?atomic=1', json=[
+            {'title': 'Atomic Book'},
+            {'title': 'x' * 100}
+        ], headers=headers)
+        assert response.status_code == 400
+        with self.app.app_context():
+            assert Book.query.count() == 5
+            assert Book.query.filter_by(title='Atomic Book').first() is None
+
+        # atomic=0 — обычный режим, а не «любое непустое значение»
+        response = self.client.post('/api/books/batch?atomic=0', json=[
+            {'title': 'Lenient Book'},
+            {'title': 'x' * 100}
+        ], headers=headers)
+        assert response.status_code == 201
+        assert response.get_json()['inserted'] == 1
+
+    def test_login_backpressure(self):
+        self.client.post('/api/register', json={'username': 'testuser12', 'password': 'password123'})
+        with self.app.app_context():
+            # Дорогой хэш, чтобы проверка пароля заметно занимала единственный воркер
+            User.query.filter_by(username='testuser12').first().password_hash = \
+                generate_password_hash('password123', 'pbkdf2:sha256:1000000')
+            db.session.commit()
+        hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, queue_size=0, timeout=0.01)
+        self.app.extensions['hashing'] = hasher
+        login = {'username': 'testuser12', 'password': 'password123'}
+
+        # Ответ не дождался проверки — 503 с Retry-After, но задача продолжает занимать слот
+        response = self.client.post('/api/login', json=login)
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+        # Без таймаута запрос ждал бы результата, но слота нет — сразу 503
+        hasher.timeout = None
+        assert self.client.post('/api/login', json=login).status_code == 503
+
+        # Слот освобождается только после завершения задачи в пуле
+        deadline = time.monotonic() + 60
+        while response.status_code == 503 and time.monotonic() < deadline:
+            time.sleep(0.1)
+            response = self.client.post('/api/login', json=login)
+        assert response.status_code == 200
+
+    def test_promote_invalidates_cached_principal(self):
+        admin_token = self._register_and_login('testadmin2')
+        user_token = self._register_and_login('testuser13')
+        with self.app.app_context():
+            User.query.filter_by(username='testadmin2').first().is_admin = True
+            db.session.commit()
+            user_id = User.query.filter_by(username='testuser13').first().id
+        admin_headers = {'Authorization': f'Bearer {admin_token}'}
+        user_headers = {'Authorization': f'Bearer {user_token}'}
+
+        # Роль пользователя попадает в кэш вместе с первым запросом
+        assert self.client.get('/api/admin/cache', headers=user_headers).status_code == 403
+
+        # Повторная проверка роли не обращается к БД
+        self.client.get('/api/admin/cache', headers=admin_headers)
+        response, statements = self._count_statements(
+            lambda: self.client.get('/api/admin/cache', headers=admin_headers))
+        assert response.status_code == 200
+        assert statements == 0
+
+        self.client.put(f'/api/admin/promote/{user_id}', headers=admin_headers)
+        assert self.client.get('/api/admin/cache', headers=user_headers).status_code == 200
+
+    def test_json_provider_matches_stdlib(self):
+        from datetime import datetime
+        from flask.json.provider import DefaultJSONProvider
+
+        payload = {'title': 'Мастер и Маргарита', 'counts': {1: 2}, 'time': datetime(2024, 1, 2, 3, 4, 5),
+                   'items': [{'b': None, 'a': True}]}
+        with self.app.app_context():
+            fast = self.app.json.response(payload)
+            stdlib = DefaultJSONProvider(self.app).response(payload)
+        assert fast.mimetype == 'application/json'
+        assert json.loads(fast.get_data()) == json.loads(stdlib.get_data())
+
+    def test_batch_requests(self):
+        token = self._register_and_login('batchuser')
+        headers = {'Authorization': f'Bearer {token}'}
+        self.client.post('/api/books', json={'title': 'Batch Book'}, headers=headers)
+        with self.app.app_context():
+            user_id = User.query.filter_by(username='batchuser').first().id
+            book_id = Book.query.filter_by(title='Batch Book').first().book_id
+        self.client.post('/api/reviews', json={'book_id': book_id, 'review_text': 'good'}, headers=headers)
+
+        requests = [
+            {'path': f'/api/books/{book_id}'},
+            {'path': f'/api/books/{book_id}/reviews'},
+            {'path': f'/api/deals?user_id={user_id}'},
+            {'path': '/api/books/999999'},
+        ]
+        response = self.client.post('/api/batch', json={'requests': requests}, headers=headers)
+        assert response.status_code == 200
+        results = response.get_json()
+        assert [result['status'] for result in results] == [200, 200, 200, 404]
+        assert results[0]['body'] == self.client.get(f'/api/books/{book_id}').get_json()
+        assert results[0]['headers']['ETag']
+        assert results[1]['body'][0]['review_text'] == 'good'
+        assert results[2]['body'] == []
+
+        # Параллельное выполнение даёт те же ответы
+        parallel = self.client.post('/api/batch', json={'requests': requests, 'parallel': True}, headers=headers)
+        assert parallel.get_json() == results
+
+        # Запись и последующее чтение в одном пакете; без токена подзапрос получает 401
+        results = self.client.post('/api/batch', json={'requests': [
+            {'method': 'POST', 'path': '/api/books', 'body': {'title': 'Batch Book 2'}},
+            {'path': '/api/books?title=Batch'},
+        ]}, headers=headers).get_json()
+        assert results[0]['status'] == 201
+        assert {book['title'] for book in results[1]['body']} == {'Batch Book', 'Batch Book 2'}
+        anonymous = self.client.post('/api/batch', json={'requests': [{'path': f'/api/deals?user_id={user_id}'}]})
+        assert anonymous.get_json()[0]['status'] == 401
+
+        # Потоковые подзапросы не выполняются: бесконечный поток событий не блокирует пакет
+        results = self.client.post('/api/batch', json={'requests': [
+            {'path': '/api/deals/events'},
+            {'path': '/api/admin/export/books'},
+            {'path': '/api/books?stream=1'},
+            {'path': f'/api/books/{book_id}'},
+        ]}, headers=headers).get_json()
+        assert [result['status'] for result in results] == [400, 400, 400, 200]
+        assert 'в пакете не поддерживаются' in results[0]['body']['message']
+        assert self.app.extensions['events'][0].connections() == 0
+
+        for body in [{'requests': []}, {'requests': [{'path': '/api/batch', 'method': 'POST'}]},
+                     {'requests': [{'path': '/api/books', 'method': 'POST'}], 'parallel': True}]:
+            assert self.client.post('/api/batch', json=body, headers=headers).status_code == 400
+
+    def test_request_id_header(self):
+        response = self.client.get('/api/books', headers={'X-Request-ID': 'req-123'})
+        assert response.headers['X-Request-ID'] == 'req-123'
+        assert self.client.get('/api/books').headers['X-Request-ID']
+
+    def test_admin_metrics(self):
+        admin_token = self._register_and_login('testadmin3')
+        with self.app.app_context():
+            User.query.filter_by(username='testadmin3').first().is_admin = True
+            db.session.commit()
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        self.client.get('/api/books')
+        self.client.get('/api/books/999')
+
+        data = self.client.get('/api/admin/metrics', headers=headers).get_json()
+        assert data['get_books']['statuses'] == {'200': 1}
+        assert data['get_books']['sql_statements'] > 0
+        assert data['get_books']['latency_buckets']['+Inf'] == 1
+        assert data['get_book']['statuses'] == {'404': 1}
+
+        response = self.client.get('/api/admin/metrics?format=prometheus', headers=headers)
+        assert response.mimetype == 'text/plain'
+        assert 'bookexchange_requests_total{endpoint="get_books",status="200"} 1' in response.get_data(as_text=True)
+        assert 'bookexchange_jobs{status="queued"} 0' in response.get_data(as_text=True)
+
+    def test_admin_export(self):
+        admin_token = self._register_and_login('testadmin4')
+        user_token = self._register_and_login('exportuser')
+        with self.app.app_context():
+            admin = User.query.filter_by(username='testadmin4').first()
+            admin.is_admin = True
+            db.session.add_all([Book(title=f'Книга {i}', user_id=admin.id, is_available=True) for i in range(5)])
+            db.session.commit()
+            book_ids = sorted(book_id for book_id, in db.session.query(Book.book_id))
+        self.app.config['EXPORT_CHUNK_SIZE'] = 2
+        headers = {'Authorization': f'Bearer {admin_token}'}
+
+        response = self.client.get('/api/admin/export/books', headers=headers)
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.is_streamed
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [row['book_id'] for row in rows] == book_ids
+        assert rows[0]['title'] == 'Книга 0'
+
+        response = self.client.get(f'/api/admin/export/books?format=csv&gzip=1&since={book_ids[1]}', headers=headers)
+        assert response.mimetype == 'application/gzip'
+        assert 'books.csv.gz' in response.headers['Content-Disposition']
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.get_data()).decode('utf-8'))))
+        assert [int(row['book_id']) for row in rows] == book_ids[2:]
+        response = self.client.get('/api/admin/export/books?format=csv&gzip=false', headers=headers)
+        assert response.mimetype == 'text/csv'
+
+        assert self.client.get('/api/admin/export/users', headers=headers).status_code == 400
+        assert self.client.get('/api/admin/export/books?since=abc', headers=headers).status_code == 400
+        assert self.client.get('/api/admin/export/books',
+                               headers={'Authorization': f'Bearer {user_token}'}).status_code == 403
+
+    def test_archive_completed_deals(self):
+        token = self._register_and_login('archiveuser')
+        headers = {'Authorization': f'Bearer {token}'}
+        with self.app.app_context():
+            user = User.query.filter_by(username='archiveuser').first()
+            user.is_admin = True
+            user_id = user.id
+            book = Book(title='Архивная', user_id=user_id)
+            db.session.add(book)
+            db.session.flush()
+            old, recent = datetime.utcnow() - timedelta(days=400), datetime.utcnow()
+            db.session.add_all([
+                Deal(sender_id=user_id, recipient_id=user_id, recipient_book_id=book.book_id, status=status, time=time)
+                for status, time in [('Completed', old), ('Completed', old), ('Agreed', old),
+                                     ('Completed', old), ('Completed', recent)]])
+            db.session.commit()
+            deal_ids = sorted(deal_id for deal_id, in db.session.query(Deal.deal_id))
+            before = stats.rebuild_counters()
+
+            assert archive.archive_deals(90, 2) == (3, False)
+            assert DealArchive.query.count() == 3
+            assert stats.rebuild_counters() == before
+
+        path = f'/api/deals?user_id={user_id}'
+        hot = self.client.get(path, headers=headers).get_json()
+        assert [deal['status'] for deal in hot] == ['Agreed', 'Completed']
+
+        response = self.client.get(path + '&include_archived=1&limit=3', headers=headers)
+        full = response.get_json()
+        assert [deal['deal_id'] for deal in full] == deal_ids[:3]
+        rest = self.client.get(path + f"&include_archived=1&after={response.headers['X-Next-Cursor']}",
+                               headers=headers).get_json()
+        assert [deal['deal_id'] for deal in rest] == deal_ids[3:]
+        completed = self.client.get(path + '&include_archived=1&status=Completed', headers=headers).get_json()
+        assert len(completed) == 4
+        assert self.client.get(path + '&include_archived=0', headers=headers).get_json() == hot
+
+        # Выгрузка сделок включает архив и идёт одним потоком по deal_id
+        def export(query=''):
+            response = self.client.get('/api/admin/export/deals' + query, headers=headers)
+            return [json.loads(line)['deal_id'] for line in response.get_data(as_text=True).splitlines()]
+
+        assert export() == deal_ids
+        assert export(f'?since={deal_ids[1]}') == deal_ids[2:]
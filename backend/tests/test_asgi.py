@@ -0,0 +1,258 @@
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('aiosqlite')
+
+from ..app import create_app
+from ..app.asgi import AsgiApp
+from ..app.cache import book_key, book_reviews_key
+from ..app.database import db
+from ..app.models import Deal, DealArchive, User
+
+
+def call(loop, asgi_app, method, path, headers=None, body=None):
+    """
+    Один HTTP-запрос к ASGI-приложению; возвращает (статус, заголовки, тело)
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+    }
+    payload = json.dumps(body).encode() if body is not None else b''
+    if body is not None:
+        scope['headers'].append((b'content-type', b'application/json'))
+    messages = []
+    requests = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+
+    async def receive():
+        # Как у сервера: после тела запроса receive ждёт отключения клиента
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    loop.run_until_complete(asgi_app(scope, receive, send))
+    start = messages[0]
+    headers = {name.decode(): value.decode() for name, value in start['headers']}
+    return start['status'], headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+
+class TestAsgi:
+    def setup_method(self):
+        self.app = create_app({'TESTING': True})
+        self.client = self.app.test_client()
+        self.asgi = AsgiApp(self.app)
+        # Пул асинхронных соединений привязан к циклу событий, поэтому цикл один на тест
+        self.loop = asyncio.new_event_loop()
+
+    def teardown_method(self):
+        self.loop.run_until_complete(self.asgi.close())
+        self.loop.close()
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _call(self, method, path, headers=None, body=None):
+        return call(self.loop, self.asgi, method, path, headers, body)
+
+    def _login(self, username):
+        credentials = {'username': username, 'password': 'password123'}
+        self.client.post('/api/register', json=credentials)
+        token = self.client.post('/api/login', json=credentials).get_json()['access_token']
+        return {'Authorization': f'Bearer {token}'}
+
+    def test_native_routes_match_wsgi(self):
+        headers = self._login('asgiuser')
+        for i in range(5):
+            status, _, _ = self._call('POST', '/api/books', headers,
+                                      {'title': f'Книга {i}', 'description': 'о'})
+            assert status == 201
+        self.client.post('/api/reviews', json={'book_id': 1, 'review_text': 'Хорошо'}, headers=headers)
+        with self.app.app_context():
+            user_id = User.query.filter_by(username='asgiuser').first().id
+            db.session.add(Deal(deal_id=2, sender_id=user_id, recipient_id=user_id, recipient_book_id=1,
+                                status='Agreed'))
+            db.session.add(DealArchive(deal_id=1, sender_id=user_id, recipient_id=user_id, recipient_book_id=1,
+                                       status='Completed', time=datetime(2020, 1, 1), archived_at=datetime.utcnow()))
+            db.session.commit()
+
+        for path, request_headers in [
+            ('/api/books?limit=2', {}),
+            ('/api/books?limit=2&after=2', {}),
+            ('/api/books/3', {}),
+            ('/api/books/1/reviews', {}),
+            (f'/api/deals?user_id={user_id}&limit=1', headers),
+            (f'/api/deals?user_id={user_id}&include_archived=0', headers),
+            (f'/api/deals?user_id={user_id}&include_archived=1&limit=1', headers),
+            (f'/api/deals?user_id={user_id}&include_archived=true&after=1', headers),
+            (f'/api/deals?user_id={user_id}&include_archived=1&status=Completed', headers),
+        ]:
+            expected = self.client.get(path, headers=request_headers)
+            status, response_headers, body = self._call('GET', path, request_headers)
+            assert status == expected.status_code, path
+            assert body == expected.data, path
+            for header in ('ETag', 'X-Next-Cursor', 'Link'):
+                assert response_headers.get(header.lower()) == expected.headers.get(header), (path, header)
+
+    def test_conditional_and_fallbacks(self):
+        status, headers, _ = self._call('GET', '/api/books')
+        assert status == 200
+        status, _, body = self._call('GET', '/api/books', {'If-None-Match': headers['etag']})
+        assert status == 304 and body == b''
+
+        # Ошибки аутентификации и 404 формирует Flask-приложение
+        status, _, body = self._call('GET', '/api/deals?user_id=1')
+        assert status == 401
+        assert json.loads(body) == self.client.get('/api/deals?user_id=1').get_json()
+        status, _, _ = self._call('GET', '/api/books/999')
+        assert status == 404
+
+        other = self._login('asgiother')
+        status, _, body = self._call('GET', '/api/deals?user_id=999', other)
+        assert status == 403
+        assert json.loads(body) == {'message': 'Доступ запрещен'}
+
+    def test_deal_events_stream(self):
+        owner = self._login('eventowner')
+        sender = self._login('eventsender')
+        self.client.post('/api/books', json={'title': 'Event Book'}, headers=owner)
+        with self.app.app_context():
+            owner_id = User.query.filter_by(username='eventowner').first().id
+        token = owner['Authorization'].split(' ', 1)[1]
+
+        messages = []
+        disconnect = asyncio.Event()
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/deals/events', 'query_string': f'jwt={token}'.encode(),
+            'headers': [], 'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+            'client': ('127.0.0.1', 1),
+        }
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        def body():
+            return b''.join(message.get('body', b'') for message in messages[1:]).decode()
+
+        stream = self.loop.create_task(self.asgi(scope, receive, send))
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        assert messages[0]['status'] == 200
+        hub, _ = self.app.extensions['events']
+        assert hub.connections() == 1
+
+        # Сделку создаёт Flask-приложение в этом потоке — событие приходит в корутину потока
+        self.client.post('/api/deals', json={'recipient_id': owner_id, 'recipient_book_id': 1}, headers=sender)
+        for _ in range(20):
+            if 'event: deal' in body():
+                break
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+        data = json.loads(body().split('data: ', 1)[1].split('\n', 1)[0])
+        assert data['status'] == 'Created' and data['recipient_id'] == owner_id
+
+        disconnect.set()
+        self.loop.run_until_complete(stream)
+        assert hub.connections() == 0
+
+        # Без токена ответ 401 формирует Flask-приложение
+        status, _, _ = self._call('GET', '/api/deals/events')
+        assert status == 401
+
+    def test_deal_events_overflow_closes_stream(self):
+        self.app.config['EVENTS_MAX_PENDING'] = 1
+        owner = self._login('overflowowner')
+        with self.app.app_context():
+            owner_id = User.query.filter_by(username='overflowowner').first().id
+        token = owner['Authorization'].split(' ', 1)[1]
+
+        messages = []
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/deals/events', 'query_string': f'jwt={token}'.encode(),
+            'headers': [], 'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+            'client': ('127.0.0.1', 1),
+        }
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        stream = self.loop.create_task(self.asgi(scope, receive, send))
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        hub, _ = self.app.extensions['events']
+        for deal_id in range(3):
+            hub.dispatch({'deal_id': deal_id, 'status': 'Created', 'sender_id': owner_id, 'recipient_id': owner_id})
+
+        # Клиент не успевает читать: поток закрывается без отправки накопленного и без отключения клиента
+        self.loop.run_until_complete(asyncio.wait_for(stream, 1))
+        assert messages[-1] == {'type': 'http.response.body', 'body': b''}
+        assert 'event: deal' not in b''.join(message.get('body', b'') for message in messages[1:]).decode()
+        assert hub.connections() == 0
+
+    def test_native_reads_use_cache(self):
+        headers = self._login('asgicache')
+        self.client.post('/api/books', json={'title': 'Кэш'}, headers=headers)
+        cache = self.app.extensions['cache']
+        status, _, body = self._call('GET', '/api/books/1')
+        assert status == 200
+        assert cache.get(book_key(1)) == json.loads(body)
+
+        # Обработчик ASGI читает тот же кэш, что и Flask
+        cache.set(book_key(1), dict(json.loads(body), title='Из кэша'))
+        _, _, body = self._call('GET', '/api/books/1')
+        assert json.loads(body)['title'] == 'Из кэша'
+        self._call('GET', '/api/books/1/reviews')
+        assert cache.get(book_reviews_key(1)) == []
+
+    def test_wsgi_stream_stops_on_disconnect(self):
+        closed = threading.Event()
+
+        class Endless:
+            def __iter__(self):
+                while True:
+                    yield b'x' * 1024
+
+            def close(self):
+                closed.set()
+
+        def endless_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return Endless()
+
+        self.app.wsgi_app = endless_app
+        messages = []
+        disconnect = asyncio.Event()
+        scope = {
+            'type': 'http', 'method': 'POST', 'path': '/api/endless', 'query_string': b'', 'headers': [],
+            'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+        }
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            if len(messages) == 3:
+                # Клиент перестаёт читать и уходит; очередь ответа к этому времени уже полна
+                await asyncio.sleep(0.1)
+                disconnect.set()
+
+        self.loop.run_until_complete(asyncio.wait_for(self.asgi(scope, receive, send), 5))
+        # Поток с Flask-ответом не висит на полной очереди: итератор закрыт
+        assert closed.wait(5)
@@ -0,0 +1,52 @@
+import time
+
+from ..app.cache import LRUCache, RedisCache
+
+
+class FakeRedis:
+    """
+    Локальная заглушка Redis-клиента для разделяемого бэкенда
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class TestCache:
+    def test_lru_eviction(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        # 'b' дольше всех не использовался и вытесняется
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+    def test_lru_ttl(self):
+        cache = LRUCache(default_ttl=0.01)
+        cache.set('a', {'id': 1})
+        time.sleep(0.02)
+        assert cache.get('a') is None
+        stats = cache.stats()
+        assert stats['misses'] == 1
+        assert stats['size'] == 0
+
+    def test_shared_backend(self):
+        client = FakeRedis()
+        first, second = RedisCache(client), RedisCache(client)
+        first.set('book:1', {'id': 1, 'title': 'Dune'})
+        assert second.get('book:1') == {'id': 1, 'title': 'Dune'}
+        second.delete('book:1')
+        assert first.get('book:1') is None
+        assert (second.hits, first.misses) == (1, 1)
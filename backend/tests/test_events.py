@@ -0,0 +1,59 @@
+import json
+import threading
+
+from ..app.events import EventHub, RedisBroker, Subscription
+
+
+class FakePubSub:
+    """
+    Заглушка pubsub: первое соединение обрывается, второе отдаёт сообщения
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def subscribe(self, channel):
+        self.client.subscriptions += 1
+
+    def listen(self):
+        if self.client.subscriptions == 1:
+            raise ConnectionError('connection reset')
+        yield from self.client.messages
+        # Дальше соединение живо и сообщений нет
+        threading.Event().wait()
+
+    def close(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self, messages):
+        self.messages = messages
+        self.subscriptions = 0
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        return FakePubSub(self)
+
+
+class RecordingSubscription(Subscription):
+    def __init__(self, user_id):
+        super().__init__(user_id)
+        self.events = []
+        self.received = threading.Event()
+
+    def deliver(self, event):
+        self.events.append(event)
+        self.received.set()
+
+
+class TestEvents:
+    def test_redis_listener_reconnects(self):
+        event = {'deal_id': 1, 'status': 'Created', 'sender_id': 1, 'recipient_id': 2}
+        client = FakeRedis([{'data': 'not json'}, {'data': json.dumps(event)}])
+        hub = EventHub()
+        subscription = hub.subscribe(RecordingSubscription(2))
+        broker = RedisBroker(hub, client, reconnect_delay=0.01)
+        broker.listen()
+        # Обрыв первой подписки не останавливает поток: он переподписывается и доставляет событие
+        assert subscription.received.wait(5)
+        assert subscription.events == [event]
+        assert client.subscriptions == 2
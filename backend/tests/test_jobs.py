@@ -0,0 +1,174 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from ..app import create_app, jobs
+from ..app.database import db
+from ..app.models import Book, Deal, User
+
+
+@pytest.fixture(params=['database', 'memory'])
+def app(request, tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "jobs.db"}',
+        'CACHE_BACKEND': 'none',
+        'JOBS_BACKEND': request.param,
+        'JOBS_BACKOFF_SECONDS': 0,
+        'TESTING': True,
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+class TestJobs:
+    def test_enqueued_after_commit(self, app, monkeypatch):
+        calls = []
+        monkeypatch.setitem(jobs.HANDLERS, 'probe', lambda **payload: calls.append(payload))
+        queue = jobs.get_jobs()
+
+        jobs.enqueue('probe', value=1)
+        db.session.rollback()
+        jobs.enqueue('probe', value=2, unique=True)
+        jobs.enqueue('probe', value=2, unique=True)
+        db.session.commit()
+
+        assert jobs.Worker(app).run_once() == 1
+        assert calls == [{'value': 2}]
+        stats = queue.stats(60)
+        assert (stats['queued'], stats['done'], stats['completed_in_window']) == (0, 1, 1)
+        assert stats['wait_seconds']['max'] >= 0
+        assert 'bookexchange_jobs{status="done"} 1' in jobs.prometheus(stats)
+
+    def test_unique_enqueue_concurrent(self, app, monkeypatch):
+        monkeypatch.setitem(jobs.HANDLERS, 'probe', lambda: 1 / 0)
+        queue = jobs.get_jobs()
+        barrier = threading.Barrier(4)
+
+        def enqueue():
+            with app.app_context():
+                barrier.wait()
+                jobs.enqueue('probe', unique=True)
+                db.session.commit()
+                db.session.remove()
+
+        threads = [threading.Thread(target=enqueue) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        jobs.enqueue('probe', unique='other')
+        db.session.commit()
+        assert queue.stats(60)['queued'] == 2
+
+        # Пока задача выполняется, такая же ставится снова; повтор упавшей уступает ей место
+        claimed = [job for job in queue.claim(2, 300) if job.name == 'probe']
+        jobs.enqueue('probe', unique=True)
+        db.session.commit()
+        assert queue.stats(60)['queued'] == 1
+        for job in claimed:
+            queue.retry(job, 'нет связи', datetime.utcnow())
+        stats = queue.stats(60)
+        assert (stats['queued'], stats['failed']) == (2, 1)
+
+    def test_retry_then_fail(self, app, monkeypatch):
+        attempts = []
+
+        def flaky(**payload):
+            attempts.append(payload)
+            raise RuntimeError('нет связи')
+
+        monkeypatch.setitem(jobs.HANDLERS, 'flaky', flaky)
+        app.config['JOBS_MAX_ATTEMPTS'] = 3
+        jobs.enqueue('flaky')
+        db.session.commit()
+
+        # С нулевой задержкой повтор готов сразу, run_once доходит до последней попытки
+        assert jobs.Worker(app).run_once() == 3
+        assert len(attempts) == 3
+        stats = jobs.get_jobs().stats(60)
+        assert (stats['failed'], stats['queued'], stats['running']) == (1, 0, 0)
+
+    def test_backoff_delays_retry(self, app, monkeypatch):
+        monkeypatch.setitem(jobs.HANDLERS, 'flaky', lambda: 1 / 0)
+        app.config['JOBS_BACKOFF_SECONDS'] = 60
+        jobs.enqueue('flaky')
+        db.session.commit()
+
+        assert jobs.Worker(app).run_once() == 1
+        assert jobs.get_jobs().stats(60)['queued'] == 1
+        assert jobs.get_jobs().claim(1, 300) == []
+        assert 48 <= jobs.backoff(1, 60, 600) <= 72
+        assert jobs.backoff(10, 60, 600) <= 720
+
+    def test_stale_running_job_reclaimed(self, app, monkeypatch):
+        monkeypatch.setitem(jobs.HANDLERS, 'probe', lambda: None)
+        queue = jobs.get_jobs()
+        jobs.enqueue('probe')
+        db.session.commit()
+
+        claimed, = queue.claim(1, 300)
+        # Воркер «упал»: задача остаётся running и до тайм-аута не выдаётся снова
+        assert queue.claim(1, 300) == []
+        reclaimed, = queue.claim(1, 0)
+        assert (reclaimed.id, reclaimed.attempts) == (claimed.id, 2)
+
+    def test_deal_transitions_enqueue_jobs(self, app, monkeypatch):
+        notified = []
+        monkeypatch.setitem(jobs.HANDLERS, 'recommend_refresh', lambda: notified.append('refresh'))
+        app.config['RECOMMEND_REFRESH_DELAY'] = 0
+        client = app.test_client()
+        tokens = {}
+        for username in ('jobsender', 'jobrecipient'):
+            client.post('/api/register', json={'username': username, 'password': 'password123'})
+            tokens[username] = {'Authorization': 'Bearer ' + client.post('/api/login', json={
+                'username': username, 'password': 'password123'}).get_json()['access_token']}
+        recipient = User.query.filter_by(username='jobrecipient').first()
+        sender = User.query.filter_by(username='jobsender').first()
+        book = Book(title='Пикник на обочине', user_id=recipient.id)
+        db.session.add(book)
+        db.session.flush()
+        deal = Deal(sender_id=sender.id, recipient_id=recipient.id, recipient_book_id=book.book_id,
+                    status='Created', time=datetime.utcnow() - timedelta(minutes=1))
+        db.session.add(deal)
+        db.session.commit()
+        deal_id = deal.deal_id
+        db.session.remove()
+
+        assert client.put(f'/api/deals/{deal_id}/accept', json={'gift_flag': True},
+                          headers=tokens['jobrecipient']).status_code == 200
+        assert client.put(f'/api/deals/{deal_id}/complete', headers=tokens['jobsender']).status_code == 200
+
+        # Готово только обновление рекомендаций; проход архивации отложен на DEAL_ARCHIVE_INTERVAL_SECONDS
+        assert jobs.Worker(app).run_once() == 1
+        assert notified == ['refresh']
+        assert jobs.get_jobs().stats(60)['queued'] == 1
+
+    def test_worker_survives_queue_errors(self, app, monkeypatch):
+        calls = []
+        monkeypatch.setitem(jobs.HANDLERS, 'probe', lambda: calls.append('probe'))
+        app.config['JOBS_POLL_SECONDS'] = 0.01
+        jobs.enqueue('probe')
+        db.session.commit()
+
+        worker = jobs.Worker(app, concurrency=1)
+        claim, failures = worker.queue.claim, []
+
+        def flaky_claim(limit, timeout):
+            # Первые два обращения к очереди падают, как при потере соединения с БД
+            if len(failures) < 2:
+                failures.append(limit)
+                raise RuntimeError('connection lost')
+            claimed = claim(limit, timeout)
+            if calls or claimed:
+                worker.stop()
+            return claimed
+
+        monkeypatch.setattr(worker.queue, 'claim', flaky_claim)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        thread.join(10)
+        assert not thread.is_alive()
+        assert len(failures) == 2
+        assert calls == ['probe']
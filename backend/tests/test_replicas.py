@@ -0,0 +1,59 @@
+import shutil
+
+from sqlalchemy import create_engine
+
+from ..app import create_app
+from ..app.database import db
+from ..app.models import Book
+
+
+class TestReplicas:
+    """
+    Основная БД и реплика — два файла SQLite; реплика — копия основной,
+    в которую книга добавлена напрямую, чтобы было видно, откуда пришло чтение
+    """
+
+    def _make_app(self, tmp_path):
+        primary = tmp_path / 'primary.db'
+        replica = tmp_path / 'replica.db'
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+            'SQLALCHEMY_REPLICA_URIS': [f'sqlite:///{replica}'],
+            'CACHE_BACKEND': 'none',
+            'TESTING': True,
+        })
+        client = app.test_client()
+        client.post('/api/register', json={'username': 'replicauser', 'password': 'password123'})
+        token = client.post('/api/login', json={
+            'username': 'replicauser', 'password': 'password123'}).get_json()['access_token']
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        shutil.copy(primary, replica)
+        replica_engine = create_engine(f'sqlite:///{replica}')
+        with replica_engine.begin() as connection:
+            connection.execute(Book.__table__.insert().values(title='Только на реплике', user_id=1))
+        return app, client, {'Authorization': f'Bearer {token}'}, replica_engine
+
+    def test_reads_go_to_replica(self, tmp_path):
+        app, client, headers, _ = self._make_app(tmp_path)
+        titles = [book['title'] for book in client.get('/api/books').get_json()]
+        assert titles == ['Только на реплике']
+        assert client.get('/api/books/1', headers=headers).get_json()['title'] == 'Только на реплике'
+
+    def test_writes_and_read_your_writes_use_primary(self, tmp_path):
+        app, client, headers, replica_engine = self._make_app(tmp_path)
+        response = client.post('/api/books', json={'title': 'Новая', 'description': ''}, headers=headers)
+        assert response.status_code == 201
+
+        with replica_engine.connect() as connection:
+            replica_titles = [row.title for row in connection.execute(Book.__table__.select())]
+        assert replica_titles == ['Только на реплике']
+
+        # Автор записи сразу видит её: его чтения идут в основную БД
+        titles = [book['title'] for book in client.get('/api/books', headers=headers).get_json()]
+        assert titles == ['Новая']
+        # Анонимные чтения по-прежнему обслуживает реплика
+        titles = [book['title'] for book in client.get('/api/books').get_json()]
+        assert titles == ['Только на реплике']
@@ -0,0 +1,123 @@
+import random
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, inspect, text
+
+from ..app import create_app
+from ..app.database import db
+from ..app.migrations import current_version, discover, downgrade, schema_migrations, upgrade
+from ..app.models import User, Book, Review, Deal
+
+# Маленькие служебные таблицы, которые читаются целиком намеренно
+FULL_SCAN_ALLOWED = {'stat_counter'}
+
+
+class TestSchema:
+    def setup_method(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+
+    def teardown_method(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            schema_migrations.drop(db.engine, checkfirst=True)
+
+    def _seed(self):
+        rng = random.Random(7)
+        with self.app.app_context():
+            db.session.execute(User.__table__.insert(), [
+                {'username': f'planuser{i}', 'password_hash': 'x', 'is_admin': i == 0} for i in range(200)])
+            user_ids = [user_id for user_id, in db.session.query(User.id)]
+            db.session.execute(Book.__table__.insert(), [
+                {'title': f'мир книга {i}', 'user_id': rng.choice(user_ids), 'is_available': rng.random() < 0.5}
+                for i in range(2000)])
+            book_ids = [book_id for book_id, in db.session.query(Book.book_id)]
+            db.session.execute(Review.__table__.insert(), [
+                {'user_id': rng.choice(user_ids), 'book_id': rng.choice(book_ids), 'review_text': 'ok'}
+                for _ in range(4000)])
+            db.session.execute(Deal.__table__.insert(), [
+                {'sender_id': rng.choice(user_ids), 'recipient_id': rng.choice(user_ids),
+                 'recipient_book_id': rng.choice(book_ids), 'status': rng.choice(['Created', 'Agreed', 'Completed'])}
+                for _ in range(4000)])
+            db.session.commit()
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+            return user_ids, book_ids
+
+    def _token(self, user_id):
+        with self.app.app_context():
+            return create_access_token(identity=str(user_id))
+
+    def _explain(self, statement, parameters):
+        with self.app.app_context():
+            with db.engine.connect() as connection:
+                if connection.dialect.name == 'postgresql':
+                    # На маленьких таблицах Postgres выбирает Seq Scan даже при наличии индекса
+                    connection.exec_driver_sql('SET enable_seqscan = off')
+                    plan = [row[0] for row in connection.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+                    return [line for line in plan if 'Seq Scan' in line and
+                            not any(f'on {table}' in line for table in FULL_SCAN_ALLOWED)]
+                plan = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                return [line for line in plan if line.startswith('SCAN ') and 'VIRTUAL TABLE' not in line and
+                        line.split()[1] not in FULL_SCAN_ALLOWED]
+
+    def test_route_queries_use_indexes(self):
+        user_ids, book_ids = self._seed()
+        headers = {'Authorization': f'Bearer {self._token(user_ids[1])}'}
+        admin_headers = {'Authorization': f'Bearer {self._token(user_ids[0])}'}
+        requests = [
+            (f'/api/books?limit=20&after={book_ids[100]}', None),
+            (f'/api/books?is_available=1&limit=20&after={book_ids[100]}', None),
+            ('/api/books?title=мир&limit=20', None),
+            (f'/api/books/{book_ids[5]}', None),
+            (f'/api/books/{book_ids[5]}/reviews', None),
+            (f'/api/books/{book_ids[5]}/similar', None),
+            (f'/api/users/{user_ids[1]}/recommendations', headers),
+            (f'/api/deals?user_id={user_ids[1]}&limit=20', headers),
+            (f'/api/deals?user_id={user_ids[1]}&status=Agreed&limit=20', headers),
+            (f'/api/deals?user_id={user_ids[1]}&include_archived=1&limit=20', headers),
+            ('/api/admin/stats', admin_headers),
+        ]
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        with self.app.app_context():
+            engine = db.engine
+        for path, request_headers in requests:
+            statements.clear()
+            event.listen(engine, 'before_cursor_execute', capture)
+            try:
+                response = self.client.get(path, headers=request_headers)
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+            assert response.status_code == 200, path
+            for statement, parameters in statements:
+                full_scans = self._explain(statement, parameters)
+                assert not full_scans, f'{path}: {statement} -> {full_scans}'
+
+    def test_migrations_upgrade_and_downgrade(self):
+        with self.app.app_context():
+            engine = db.engine
+            latest = discover()[-1][0]
+
+            # Миграции идемпотентны и применяются поверх схемы из create_all
+            upgrade(engine)
+            assert current_version(engine) == latest
+            assert upgrade(engine) == []
+
+            downgrade(engine, 2)
+            assert current_version(engine) == 2
+            index_names = {index['name'] for index in inspect(engine).get_indexes('deal')}
+            assert 'ix_deal_sender_id' not in index_names
+
+            assert upgrade(engine) == [3] + [version for version, _ in discover() if version > 3]
+            index_names = {index['name'] for index in inspect(engine).get_indexes('deal')}
+            assert {'ix_deal_sender_id', 'ix_deal_recipient_id', 'ix_deal_status'} <= index_names
@@ -0,0 +1,51 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..app import create_app
+from ..app.database import db
+from ..app.migrations import schema_migrations
+
+
+class TestStartup:
+    def setup_method(self):
+        # Полный старт: схема по моделям и flasgger
+        self.app = create_app({'TESTING': True})
+        self.client = self.app.test_client()
+
+    def teardown_method(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            schema_migrations.drop(db.engine, checkfirst=True)
+
+    def test_fast_start_does_not_touch_database(self):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', capture)
+        try:
+            app = create_app({'TESTING': True, 'DB_SCHEMA': 'none', 'SWAGGER_MODE': 'lazy'})
+        finally:
+            event.remove(Engine, 'before_cursor_execute', capture)
+        assert statements == []
+        assert app.test_client().get('/api/books').status_code == 200
+
+    def test_lazy_spec_matches_eager(self):
+        eager = self.client.get('/apispec_1.json').get_json()
+        lazy_app = create_app({'TESTING': True, 'DB_SCHEMA': 'none', 'SWAGGER_MODE': 'lazy'})
+        lazy = lazy_app.test_client().get('/apispec_1.json').get_json()
+        assert '/api/books' in eager['paths']
+        assert lazy['paths'] == eager['paths']
+        assert lazy_app.test_client().get('/apidocs/').status_code == 200
+
+    def test_prebuilt_spec_file(self, tmp_path):
+        spec_file = tmp_path / 'apispec.json'
+        result = self.app.test_cli_runner().invoke(args=['apispec', '--output', str(spec_file)])
+        assert result.exit_code == 0, result.output
+
+        app = create_app({
+            'TESTING': True, 'DB_SCHEMA': 'none', 'SWAGGER_MODE': 'file', 'SWAGGER_SPEC_FILE': str(spec_file)})
+        spec = app.test_client().get('/apispec_1.json').get_json()
+        assert spec['paths'] == self.client.get('/apispec_1.json').get_json()['paths']
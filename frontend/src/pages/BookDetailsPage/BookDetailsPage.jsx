@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { booksAPI, dealsAPI } from '../../services/api';
+import { batchAPI, booksAPI, dealsAPI } from '../../services/api';
 import { useAuth } from '../../context/AuthContext';
 import './BookDetailsPage.css';
 
@@ -22,11 +22,16 @@ const BookDetailsPage = () => {
   const fetchBookDetails = async () => {
     setLoading(true);
     try {
-      const bookData = await booksAPI.getBookById(id);
-      setBook(bookData);
-
-      const reviewsData = await booksAPI.getBookReviews(id);
-      setReviews(reviewsData);
+      // Book and reviews in one round-trip
+      const [bookResult, reviewsResult] = await batchAPI.run([
+        { path: `/api/books/${id}` },
+        { path: `/api/books/${id}/reviews` },
+      ], { parallel: true });
+      if (bookResult.status !== 200) {
+        throw new Error(`Request failed with status ${bookResult.status}`);
+      }
+      setBook(bookResult.body);
+      setReviews(reviewsResult.status === 200 ? reviewsResult.body : []);
 
       setError(null);
     } catch (err) {
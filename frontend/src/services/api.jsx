@@ -117,4 +117,12 @@ export const userAPI = {
   getUserBooks: () => request('/books?user_id=current'), // This endpoint might need adjustment
 
   getUserDeals: () => request('/deals?user_id=current'), // This endpoint might need adjustment
-};
\ No newline at end of file
+};
+
+// Batch API: several /api requests in one round-trip, results in the same order
+export const batchAPI = {
+  run: (requests, { parallel = false } = {}) => request('/batch', {
+    method: 'POST',
+    body: JSON.stringify({ requests, parallel }),
+  }),
+};